@@ -0,0 +1,107 @@
+"""Compares building a month of games one DataFrame per game against one batch build.
+
+Run from the repository root:
+    python benchmarks/bench_dataframe_build.py [n_games]
+"""
+from pathlib import Path
+from datetime import datetime
+import tempfile
+import random
+import time
+import sys
+import os
+
+import polars as pl
+
+os.environ.setdefault('OPPONENT_CACHE_PATH', str(Path(tempfile.mkdtemp()) / 'opponent_cache.sqlite'))
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'extract' / 'lichess'))
+
+from utils import SCHEMA, build_dataframe, convert_seconds_to_hhmmss
+from extract.evals import encode_analysis
+
+
+def make_row(i: int) -> dict:
+    
+    n_plies = random.randint(20, 120)
+    # A third of the games have a computer analysis, as in fixtures.py
+    analysis = [{'eval': random.randint(-400, 400)} for _ in range(n_plies)] if i % 3 == 0 else None
+    eval_cp, eval_judgment = encode_analysis(analysis)
+    
+    return {
+        'game_id': f'g{i:08d}',
+        'url': f'https://lichess.org/g{i:08d}',
+        'time_class': 'rapid',
+        'time_control': '600+0',
+        'is_rated': True,
+        'white_rating': random.randint(800, 2400),
+        'black_rating': random.randint(800, 2400),
+        'white_accuracy': random.choice([None, random.randint(40, 99)]),
+        'black_accuracy': random.choice([None, random.randint(40, 99)]),
+        'game_winner': random.choice(['white', 'black', 'draw']),
+        'game_status': 'resign',
+        'username': 'zainsiddiqi',
+        'colour': random.choice(['white', 'black']),
+        'opponent_id': f'user{i % 300}',
+        'opponent_username': f'User{i % 300}',
+        'opponent_country': 'GB',
+        'opponent_is_verified': False,
+        'opponent_status': 'lichess member',
+        'start_datetime': '2024-01-01 12:00:00',
+        'end_datetime': '2024-01-01 12:10:00',
+        'opening_code': 'C50',
+        'opening_name': 'Italian Game',
+        'total_moves': n_plies // 2,
+        'moves': ['e4'] * n_plies,
+        'clocks': sorted(random.sample(range(1000, 60000), n_plies), reverse=True),
+        'eval_cp': eval_cp,
+        'eval_judgment': eval_judgment
+    }
+
+
+def legacy_build(rows: list) -> pl.DataFrame:
+    """The previous approach: a one-row DataFrame per game, cast and vstacked."""
+    
+    df = pl.DataFrame({})
+    
+    for row in rows:
+        move_times = [convert_seconds_to_hhmmss(clock) for clock in row['clocks']]
+        # List columns are wrapped so the one-row DataFrame does not read them as rows
+        row = {**row, 'moves': ','.join(row['moves']), 'move_times': ','.join(move_times),
+               'eval_cp': [row['eval_cp']], 'eval_judgment': [row['eval_judgment']]}
+        del row['clocks']
+        game_df = pl.DataFrame(row).with_columns(
+            pl.col('moves').str.split(','),
+            pl.col('move_times').str.split(',')
+        ).select(
+            [pl.col(name).cast(dtype) for name, dtype in SCHEMA.items() if name in row]
+            + [pl.lit(datetime.now()).alias("_extracted_at")]
+        )
+        df = df.vstack(game_df)
+    
+    return df
+
+
+def timed(func, rows: list) -> tuple:
+    
+    start = time.perf_counter()
+    df = func(rows)
+    
+    return time.perf_counter() - start, df
+
+
+if __name__ == '__main__':
+    
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rows = [make_row(i) for i in range(n_games)]
+    
+    legacy_seconds, legacy_df = timed(legacy_build, rows)
+    batch_seconds, batch_df = timed(build_dataframe, rows)
+    
+    # Openings are reclassified from the moves by build_dataframe, so they are not compared
+    ignored = ['_extracted_at', 'opening_code', 'opening_name']
+    assert legacy_df.drop(ignored).equals(batch_df.select(legacy_df.columns).drop(ignored))
+    
+    print(f"{n_games} games")
+    print(f"per-game DataFrame + vstack: {legacy_seconds:.3f}s ({n_games / legacy_seconds:,.0f} games/s)")
+    print(f"batch build_dataframe:       {batch_seconds:.3f}s ({n_games / batch_seconds:,.0f} games/s)")
+    print(f"speedup: {legacy_seconds / batch_seconds:.1f}x")
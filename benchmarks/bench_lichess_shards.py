@@ -0,0 +1,59 @@
+"""Compares one streamed lichess export against month windows exported in parallel.
+
+The stub server throttles each export stream, like lichess does, so the time
+is spent waiting on the API rather than parsing. A last run drops a few
+exports mid-response to check that only their windows are requested again.
+
+Run from the repository root:
+    python benchmarks/bench_lichess_shards.py [n_games] [games_per_second]
+"""
+from pathlib import Path
+import tempfile
+import time
+import sys
+import os
+
+from fixtures import Dataset, StubServer, LICHESS_USER
+
+if __name__ == '__main__':
+
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    export_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 2000.0
+
+    server = StubServer(Dataset(n_games), export_rate=export_rate)
+    work_dir = Path(tempfile.mkdtemp())
+    os.environ['LICHESS_API_URL'] = server.url
+    os.environ['OPPONENT_CACHE_PATH'] = str(work_dir / 'opponent_cache.sqlite')
+    os.environ['GAME_INDEX_PATH'] = str(work_dir / 'game_index.sqlite')
+    os.environ['HTTP_BACKOFF_BASE'] = '0.05'
+    sys.path.append(str(Path(__file__).resolve().parents[1] / 'extract' / 'lichess'))
+
+    from utils import stream_games, metrics
+    from shards import sharded_games
+
+    print(f"{n_games} games, exports throttled to {export_rate:.0f} games/s per stream")
+
+    start = time.perf_counter()
+    expected = [game['id'] for game in stream_games(LICHESS_USER)]
+    print(f"{'stream':12s} {time.perf_counter() - start:6.2f}s  {len(expected)} games")
+
+    for workers in (1, 2, 4):
+        server.reset()
+        start = time.perf_counter()
+        game_ids = [game['id'] for game in sharded_games(LICHESS_USER, workers=workers)]
+        seconds = time.perf_counter() - start
+        assert game_ids == expected
+        requests = server.stats()['lichess_games']['calls']
+        print(f"{f'sharded x{workers}':12s} {seconds:6.2f}s  {len(game_ids)} games, {requests} export requests")
+
+    server.reset()
+    server.drop_next_exports(3)
+    retries = metrics.counters['lichess_window_retries']
+    start = time.perf_counter()
+    game_ids = [game['id'] for game in sharded_games(LICHESS_USER, workers=4)]
+    seconds = time.perf_counter() - start
+    assert game_ids == expected
+    print(f"{'3 dropped':12s} {seconds:6.2f}s  {len(game_ids)} games, "
+          f"{metrics.counters['lichess_window_retries'] - retries} windows retried, same games in the same order")
+
+    server.close()
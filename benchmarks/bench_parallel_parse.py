@@ -0,0 +1,91 @@
+"""Measures lichess parse throughput of the process pool against the number of workers.
+
+Synthetic games are parsed through parallel.submit_month (opponents are given,
+so no network calls are made) with 1, 2, 4... workers up to the CPU count.
+
+Run from the repository root:
+    python benchmarks/bench_parallel_parse.py [n_games]
+"""
+from pathlib import Path
+import tempfile
+import random
+import time
+import sys
+import os
+
+
+os.environ.setdefault('OPPONENT_CACHE_PATH', str(Path(tempfile.mkdtemp()) / 'opponent_cache.sqlite'))
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'extract' / 'lichess'))
+
+from parallel import submit_month, collect_month, make_executor, PARSE_BATCH_SIZE
+
+# A legal game, truncated at random lengths to vary the number of plies
+MOVES = (
+    'e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6 O-O Be7 Re1 b5 Bb3 d6 c3 O-O h3 Nb8 d4 Nbd7 '
+    'Nbd2 Bb7 Bc2 Re8 Nf1 Bf8 Ng3 g6 a4 c5 d5 c4 Bg5 h6 Be3 Nc5 Qd2 h5 Bg5 Be7 '
+    'Ra3 Nfd7 Bh6 Bf8 Bxf8 Kxf8 Nh2 Qh4 Nhf1 Kg8 Ne3 Nf6 Qe2 Qd8 Rf1 Rc8'
+).split()
+
+
+def make_game(i: int) -> dict:
+
+    n_plies = random.randint(20, len(MOVES))
+    clocks = [60000 - 150 * ply for ply in range(n_plies + 1)]
+
+    return {
+        'id': f'g{i:08d}',
+        'status': 'resign',
+        'winner': random.choice(['white', 'black']),
+        'speed': 'rapid',
+        'clock': {'initial': 600, 'increment': 0},
+        'rated': True,
+        'createdAt': 1700000000000 + i * 60000,
+        'lastMoveAt': 1700000000000 + i * 60000 + 30000,
+        'players': {
+            'white': {'user': {'id': 'zainsiddiqi', 'name': 'zainsiddiqi'}, 'rating': 1500},
+            'black': {'user': {'id': f'user{i % 300}', 'name': f'User{i % 300}'}, 'rating': random.randint(800, 2400),
+                      'analysis': {'accuracy': random.randint(40, 99)}}
+        },
+        'opening': {'eco': 'C95', 'name': 'Ruy Lopez: Closed, Breyer Defense'},
+        'moves': ' '.join(MOVES[:n_plies]),
+        'clocks': clocks
+    }
+
+
+def timed_parse(games: list, opponents: dict, workers: int) -> tuple:
+
+    executor = make_executor(workers)
+    if executor is not None:
+        # Start the workers before timing, spawning them is a one-off cost per run
+        list(executor.map(abs, range(workers)))
+
+    start = time.perf_counter()
+    futures = submit_month(executor, games, 'zainsiddiqi', opponents, PARSE_BATCH_SIZE)
+    df = collect_month(futures)
+    seconds = time.perf_counter() - start
+
+    if executor is not None:
+        executor.shutdown()
+
+    return seconds, df
+
+
+if __name__ == '__main__':
+
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    games = [make_game(i) for i in range(n_games)]
+    opponents = {f'user{i}': {'profile': {'country': 'GB'}} for i in range(300)}
+
+    workers = [1]
+    while workers[-1] * 2 <= (os.cpu_count() or 1):
+        workers.append(workers[-1] * 2)
+
+    print(f"{n_games} games, {os.cpu_count()} CPUs")
+
+    baseline_seconds, baseline_df = timed_parse(games, opponents, 1)
+    print(f"1 worker (in process): {baseline_seconds:.2f}s ({n_games / baseline_seconds:,.0f} games/s)")
+
+    for n_workers in workers[1:]:
+        seconds, df = timed_parse(games, opponents, n_workers)
+        assert df.drop('_extracted_at').equals(baseline_df.drop('_extracted_at'))
+        print(f"{n_workers} workers: {seconds:.2f}s ({n_games / seconds:,.0f} games/s, {baseline_seconds / seconds:.1f}x)")
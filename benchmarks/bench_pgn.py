@@ -0,0 +1,97 @@
+"""Measures chess.com PGN parsing throughput in games per second.
+
+Compares the previous fixed line offset parsing with parse_pgn and the
+vectorized parse_pgn_column. Run from the repository root:
+    python benchmarks/bench_pgn.py [n_games]
+"""
+from pathlib import Path
+import random
+import re
+import time
+import sys
+
+import polars as pl
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'extract' / 'chesscom'))
+
+from pgn import parse_pgn, parse_pgn_column
+
+SAN = ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6', 'Ba4', 'Nf6', 'O-O', 'Be7', 'Re1', 'b5', 'Bb3', 'd6', 'c3', 'O-O', 'h3', 'Nb8', 'd4', 'Nbd7', 'exd8=Q+']
+
+
+def make_pgn(n_plies: int) -> str:
+    
+    tags = [
+        ('Event', 'Live Chess'), ('Site', 'Chess.com'), ('Date', '2024.01.05'), ('Round', '-'),
+        ('White', 'zainsiddiqii'), ('Black', 'opponent'), ('Result', '1-0'),
+        ('CurrentPosition', 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq -'),
+        ('Timezone', 'UTC'), ('ECO', 'C60'),
+        ('ECOUrl', 'https://www.chess.com/openings/Ruy-Lopez-Opening-Morphy-Defense'),
+        ('UTCDate', '2024.01.05'), ('UTCTime', '10:00:00'), ('WhiteElo', '1500'), ('BlackElo', '1490'),
+        ('TimeControl', '600'), ('Termination', 'zainsiddiqii won by resignation'),
+        ('StartTime', '10:00:00'), ('EndDate', '2024.01.05'), ('EndTime', '10:10:00'),
+        ('Link', 'https://www.chess.com/game/live/1')
+    ]
+    movetext = ' '.join(
+        f"{ply // 2 + 1}{'.' if ply % 2 == 0 else '...'} {random.choice(SAN)} {{[%clk 0:0{9 - ply * 9 // n_plies}:{random.randint(10, 59)}.{ply % 10}]}}"
+        for ply in range(n_plies)
+    )
+    
+    return '\n'.join(f'[{name} "{value}"]' for name, value in tags) + '\n\n' + movetext + ' 1-0\n'
+
+
+def legacy_parse(pgn: str) -> tuple:
+    """The previous parsing by fixed line offsets, kept for comparison."""
+    
+    pgn_data = pgn.split('\n')
+    tags = {
+        'Date': pgn_data[2].strip('[]').split(' ')[1].strip('"'),
+        'ECO': pgn_data[9].strip('[]').split(' ')[1].strip('"'),
+        'ECOUrl': pgn_data[10].strip('[]').split(' ')[1].strip('"'),
+        'StartTime': pgn_data[17].strip('[]').split(' ')[1].strip('"'),
+        'EndDate': pgn_data[18].strip('[]').split(' ')[1].strip('"'),
+        'EndTime': pgn_data[19].strip('[]').split(' ')[1].strip('"')
+    }
+    movetext = pgn.split('\n')[-2].split('}')
+    moves = [move.split('{')[0].strip() for move in movetext]
+    move_times = [move.split('{')[-1] for move in movetext]
+    move_times = [move_time.split(' ')[-1].strip(']') for move_time in move_times]
+    moves_list = [move.split(' ')[-1] for move in moves]
+    move_times_list = [move.split(' ')[-1] for move in move_times]
+    
+    return tags, moves_list[:-1], move_times_list[:-1]
+
+
+def games_per_second(func, n_games: int) -> float:
+    
+    start = time.perf_counter()
+    func()
+    
+    return n_games / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    pgns = [make_pgn(random.randint(20, 120)) for _ in range(n_games)]
+    df = pl.DataFrame({'pgn': pgns})
+    
+    legacy = [legacy_parse(pgn) for pgn in pgns]
+    parsed = [parse_pgn(pgn) for pgn in pgns]
+    vectorized = parse_pgn_column(df)
+    
+    for (legacy_tags, legacy_moves, legacy_times), (tags, moves, times) in zip(legacy, parsed):
+        assert all(tags[name] == value for name, value in legacy_tags.items())
+        assert (moves, times) == (legacy_moves, legacy_times)
+    assert vectorized['moves'].to_list() == [moves for _, moves, _ in parsed]
+    assert vectorized['move_times'].to_list() == [times for _, _, times in parsed]
+    
+    # Moves without a clock get an empty time from both parsers, so times stay aligned with moves
+    unclocked = [re.sub(r' \{\[%clk [^\]]+\]\}', '', pgn, count=k % 5) for k, pgn in enumerate(pgns[:1000])]
+    vectorized = parse_pgn_column(pl.DataFrame({'pgn': unclocked}))
+    assert vectorized['move_times'].to_list() == [parse_pgn(pgn)[2] for pgn in unclocked]
+    
+    print(f"{n_games} games")
+    print(f"line offsets:     {games_per_second(lambda: [legacy_parse(pgn) for pgn in pgns], n_games):>10,.0f} games/s")
+    print(f"parse_pgn:        {games_per_second(lambda: [parse_pgn(pgn) for pgn in pgns], n_games):>10,.0f} games/s")
+    print(f"parse_pgn_column: {games_per_second(lambda: parse_pgn_column(df), n_games):>10,.0f} games/s")
@@ -0,0 +1,151 @@
+"""Times a query over the local store through extract/store.py, NDJSON against Parquet.
+
+A synthetic store of both platforms (5 players, 2021 to 2024) is written in
+each format, then "rapid games as black against players above 1800 in 2023"
+is run with and without pruning the partitions by month.
+
+Run from the repository root:
+    python benchmarks/bench_store_query.py [games_per_month]
+"""
+from pathlib import Path
+from datetime import datetime, timedelta
+import tempfile
+import random
+import time
+import sys
+
+import polars as pl
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from extract.store import NDJSON_SCHEMAS, scan_games, list_partitions
+from fixtures import ROSTER, MOVES
+
+YEARS = range(2021, 2025)
+TIME_CLASSES = ['bullet', 'blitz', 'rapid', 'daily']
+CHESSCOM_RESULTS = ['win', 'checkmated', 'resigned', 'timeout', 'agreed', 'repetition']
+
+
+def make_partition(platform: str, username: str, year: int, month: int, n_games: int) -> pl.DataFrame:
+    """A month of games with the columns and NDJSON types of the platform's files."""
+
+    rng = random.Random(f'{platform}{username}{year}{month}')
+    rows = []
+
+    for i in range(n_games):
+        n_plies = rng.randint(20, len(MOVES))
+        start = datetime(year, month, 1) + timedelta(minutes=i * 30)
+        colour = rng.choice(['white', 'black'])
+        row = {
+            'game_id': f'{platform[0]}{username}{year}{month:02d}{i:05d}',
+            'url': f'https://{platform}.example/{i}',
+            'time_class': rng.choice(TIME_CLASSES),
+            'time_control': '600',
+            'is_rated': True,
+            'white_rating': str(rng.randint(1000, 2400)),
+            'black_rating': str(rng.randint(1000, 2400)),
+            'white_accuracy': str(round(rng.uniform(50, 99), 1)),
+            'black_accuracy': str(round(rng.uniform(50, 99), 1)),
+            'username': username,
+            'colour': colour,
+            'opponent_id': str(rng.randrange(500)) if platform == 'chesscom' else f'opp{rng.randrange(500)}',
+            'opponent_username': f'opp{rng.randrange(500)}',
+            'opponent_country': 'GB',
+            'opponent_is_verified': False,
+            'opponent_status': 'basic',
+            'start_datetime': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'end_datetime': (start + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S'),
+            'opening_code': 'C60',
+            'opening_name': 'Ruy Lopez',
+            'total_moves': str(n_plies // 2),
+            'moves': MOVES[:n_plies],
+            'move_times': ['0:10:00'] * n_plies,
+            'clock_ms': [600000 - 1000 * ply for ply in range(n_plies)],
+            'time_spent_ms': [1000] * n_plies,
+            '_extracted_at': '2024-09-01 00:00:00.000000'
+        }
+        if platform == 'chesscom':
+            result = rng.choice(CHESSCOM_RESULTS)
+            other = 'win' if result != 'win' and result not in ('agreed', 'repetition') else rng.choice(['resigned', 'timeout'])
+            if result in ('agreed', 'repetition'):
+                other = result
+            row['white_result'], row['black_result'] = (result, other) if colour == 'white' else (other, result)
+            row['opening_url'] = 'https://www.chess.com/openings/Ruy-Lopez'
+        else:
+            row['game_winner'] = rng.choice(['white', 'black', 'draw'])
+            row['game_status'] = 'resign'
+            row['eval_cp'] = [rng.randint(-300, 300) for _ in range(n_plies)] if i % 3 == 0 else None
+            row['eval_judgment'] = [0] * n_plies if i % 3 == 0 else None
+        rows.append(row)
+
+    return pl.DataFrame(rows, schema=NDJSON_SCHEMAS[platform])
+
+
+def write_store(root: Path, games_per_month: int):
+
+    for platform in NDJSON_SCHEMAS:
+        for username in ROSTER:
+            user_dir = root / 'ndjson' / platform / username
+            parquet_dir = root / 'parquet' / platform / username
+            user_dir.mkdir(parents=True)
+            parquet_dir.mkdir(parents=True)
+            for year in YEARS:
+                for month in range(1, 13):
+                    df = make_partition(platform, username, year, month, games_per_month)
+                    df.write_ndjson(user_dir / f'{year}_{month:02d}.ndjson')
+                    df.with_columns(
+                        [pl.col(name).cast(pl.Int64) for name in ('white_rating', 'black_rating', 'total_moves')]
+                    ).with_columns(
+                        pl.col(['white_accuracy', 'black_accuracy']).cast(pl.Float64)
+                    ).write_parquet(parquet_dir / f'{year}_{month:02d}.parquet', compression='zstd')
+
+
+def query(root: Path, pruned: bool) -> pl.DataFrame:
+
+    months = dict(start='2023-01', end='2023-12') if pruned else dict()
+
+    return scan_games(root=root, **months).filter(
+        (pl.col('year') == 2023)
+        & (pl.col('time_class') == 'rapid')
+        & (pl.col('colour') == 'black')
+        & (pl.col('opponent_rating') > 1800)
+    ).select(
+        ['platform', 'username', 'game_id', 'end_datetime', 'opponent_username', 'opponent_rating', 'result']
+    ).collect()
+
+
+def timed(function, *args, repeat: int = 3) -> tuple:
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - started)
+
+    return min(timings), result
+
+
+if __name__ == '__main__':
+
+    games_per_month = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    root = Path(tempfile.mkdtemp())
+
+    started = time.perf_counter()
+    write_store(root, games_per_month)
+    partitions = list_partitions(root / 'parquet')
+    games = len(partitions) * games_per_month
+    print(f"Wrote {len(partitions)} partitions, {games} games per format in {time.perf_counter() - started:.1f}s")
+
+    results = {}
+    for output_format in ('ndjson', 'parquet'):
+        for pruned in (False, True):
+            seconds, df = timed(query, root / output_format, pruned)
+            results[(output_format, pruned)] = df
+            label = 'pruned to 2023' if pruned else 'all partitions'
+            print(f"{output_format:8s} {label:15s} {seconds * 1000:8.1f} ms  {df.height} games")
+
+    # Every way of reading the store returns the same games
+    expected = results[('parquet', True)].sort('game_id')
+    for df in results.values():
+        assert df.sort('game_id').equals(expected)
+    print(f"Results match, {expected['result'].value_counts().sort('result').rows()}")
@@ -0,0 +1,91 @@
+"""Compares loading lichess months through files against streaming compressed chunks.
+
+The file path writes every month as NDJSON and then loads the files with
+load_files. The streaming path compresses each month as it is parsed and
+uploads it while the next months are parsed (load/streaming.py). Both load
+to FakeBigQueryClient with a limited upload bandwidth, so uploaded bytes
+count in the time from the first parsed game to the last loaded row.
+
+Run from the repository root:
+    python benchmarks/bench_streaming_load.py [n_games] [bandwidth_mib_per_second]
+"""
+from pathlib import Path
+import tempfile
+import time
+import sys
+import os
+
+work_dir = Path(tempfile.mkdtemp())
+os.environ.setdefault('OPPONENT_CACHE_PATH', str(work_dir / 'opponent_cache.sqlite'))
+os.environ.setdefault('GAME_INDEX_PATH', str(work_dir / 'game_index.sqlite'))
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'extract' / 'lichess'))
+
+from fixtures import Dataset, FakeBigQueryClient, MONTHS, LICHESS_USER
+from utils import extract_game_data, build_dataframe, write_games, metrics
+from load.orchestrator import load_files
+from load.streaming import StreamingLoader
+
+
+def parsed_months(dataset: Dataset, opponents: dict):
+
+    for year, month in MONTHS:
+        games = [dataset.lichess_game(i) for i in dataset.month_range(year, month)]
+        if games:
+            yield f'{year}_{month:02d}', build_dataframe([extract_game_data(game, LICHESS_USER, opponents) for game in games])
+
+
+def through_files(dataset: Dataset, opponents: dict, client: FakeBigQueryClient) -> tuple:
+
+    paths = [
+        write_games(df, work_dir / 'files' / year_month, 'ndjson')
+        for year_month, df in parsed_months(dataset, opponents)
+    ]
+    results = load_files(client, 'project.dataset.table', paths, None, poll_interval=0.01)
+
+    return sum(result['output_rows'] for result in results.values()), sum(path.stat().st_size for path in paths)
+
+
+def streamed(dataset: Dataset, opponents: dict, client: FakeBigQueryClient, chunk_bytes: int) -> tuple:
+
+    loaded = []
+    loader = StreamingLoader(client, None, 'ndjson', chunk_bytes=chunk_bytes, on_loaded=loaded.append)
+
+    for year_month, df in parsed_months(dataset, opponents):
+        loader.write(df, f'project.dataset.table${year_month.replace("_", "")}', year_month)
+
+    results = loader.close()
+    assert len(loaded) == len({result['key'] for result in results.values()})
+
+    return sum(result['output_rows'] for result in results.values()), 0
+
+
+if __name__ == '__main__':
+
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    bandwidth = float(sys.argv[2]) * 2 ** 20 if len(sys.argv) > 2 else 8 * 2 ** 20
+
+    dataset = Dataset(n_games)
+    opponents = {f'opp{k}': dataset.lichess_user(f'opp{k}') for k in range(dataset.n_opponents)}
+    print(f"{n_games} games over {len(MONTHS)} months, uploads at {bandwidth / 2 ** 20:.0f} MiB/s")
+
+    runs = [
+        ('files', lambda client: through_files(dataset, opponents, client), dict()),
+        ('streamed', lambda client: streamed(dataset, opponents, client, 2 ** 20), dict()),
+        ('streamed, 2 failed loads', lambda client: streamed(dataset, opponents, client, 2 ** 20), dict(fail_loads=2))
+    ]
+
+    for name, run, options in runs:
+        client = FakeBigQueryClient(latency=0.05, bandwidth=bandwidth, **options)
+        start = time.perf_counter()
+        rows, disk_bytes = run(client)
+        seconds = time.perf_counter() - start
+        uploaded = sum(load['bytes'] for load in client.loads)
+        assert rows == n_games, rows
+        print(
+            f"{name:26s} {seconds:6.2f}s  {rows} rows in {len(client.loads)} uploads, "
+            f"{uploaded / 2 ** 20:7.2f} MiB uploaded, {disk_bytes / 2 ** 20:7.2f} MiB written to disk"
+        )
+
+    print(f"Compressed {metrics.counters['upload_raw_bytes'] / 2 ** 20:.2f} MiB of NDJSON "
+          f"to {metrics.counters['upload_bytes'] / 2 ** 20:.2f} MiB over the streamed runs")
@@ -0,0 +1,97 @@
+"""Offline benchmark suite for the extract and load paths.
+
+Synthetic chess.com archives, lichess exports and opponent profiles are served
+by a local stub server (see fixtures.py) and loads go to a fake BigQuery
+client, so nothing leaves the machine. Every scenario runs in its own process
+(suite_worker.py) for each dataset size, with a fresh opponent cache.
+
+Results are written as JSON, one record per scenario and size, with games/s,
+HTTP calls per game by endpoint, peak RSS and wall time.
+
+Run from the repository root:
+    python benchmarks/bench_suite.py [--sizes 100 1000 10000] [--scenarios ...] [--output results.json]
+"""
+from pathlib import Path
+import subprocess
+import argparse
+import platform
+import tempfile
+import json
+import sys
+import os
+
+from fixtures import Dataset, StubServer
+from suite_worker import SCENARIOS
+
+WORKER_PATH = Path(__file__).resolve().parent / 'suite_worker.py'
+
+
+def run_scenario(scenario: str, n_games: int, server: StubServer, env: dict) -> dict:
+
+    server.reset()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        result_path = Path(work_dir) / 'result.json'
+        process = subprocess.run(
+            [sys.executable, str(WORKER_PATH), scenario, str(n_games), server.url, str(result_path)],
+            cwd=work_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if process.returncode != 0:
+            return {'scenario': scenario, 'n_games': n_games, 'error': process.stderr.strip().splitlines()[-1:]}
+        result = json.loads(result_path.read_text())
+
+    http = server.stats()
+    http_calls = sum(endpoint['calls'] for endpoint in http.values())
+    games = result['games']
+
+    return {
+        'scenario': scenario,
+        'n_games': n_games,
+        'games': games,
+        'wall_seconds': round(result['wall_seconds'], 3),
+        'games_per_second': round(games / result['wall_seconds'], 1) if result['wall_seconds'] else None,
+        'http_calls': http_calls,
+        'http_calls_per_game': round(http_calls / games, 4) if games else None,
+        'http_endpoints': http,
+        'peak_rss_mib': result['peak_rss_mib']
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='dataset sizes in games per platform, up to 1000000')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--output', type=Path, default=Path('bench_results.json'))
+    args = parser.parse_args()
+
+    # No rate limit is needed against the stub, the clients are measured instead
+    env = dict(os.environ, CHESSCOM_RATE=os.getenv('CHESSCOM_RATE', '1000'))
+    results = []
+
+    for n_games in args.sizes:
+        server = StubServer(Dataset(n_games))
+        for scenario in args.scenarios:
+            result = run_scenario(scenario, n_games, server, env)
+            results.append(result)
+            if 'error' in result:
+                print(f"{scenario:32} {n_games:>8} games: failed {result['error']}")
+            else:
+                print(f"{scenario:32} {n_games:>8} games: {result['games_per_second']:>10,.0f} games/s "
+                      f"{result['http_calls_per_game'] or 0:>7.3f} calls/game {result['peak_rss_mib']:>8.1f} MiB "
+                      f"{result['wall_seconds']:>8.2f}s")
+        server.close()
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
@@ -0,0 +1,411 @@
+"""Synthetic API fixtures for the offline benchmark suite.
+
+Games are generated on demand from their index, so datasets of any size are
+served without being held in memory. StubServer replays them through local
+chess.com and lichess endpoints and counts the requests it answers;
+FakeBigQueryClient stands in for bigquery.Client in the load paths.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+import threading
+import random
+import gzip
+import sys
+import json
+import time
+import io
+
+import pyarrow.parquet as pq
+
+CHESSCOM_USER = 'zainsiddiqii'
+LICHESS_USER = 'zainsiddiqi'
+# Tracked players of the multi-user scenarios, they share the dataset's opponents
+ROSTER = [f'player{k}' for k in range(5)]
+
+# Months covered by the chess.com backfill script, December 2020 to August 2024
+MONTHS = [(2020, 12)] + [(year, month) for year in range(2021, 2025) for month in range(1, 13) if (year, month) <= (2024, 8)]
+
+# A legal game, truncated at random lengths to vary the number of plies
+MOVES = (
+    'e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6 O-O Be7 Re1 b5 Bb3 d6 c3 O-O h3 Nb8 d4 Nbd7 '
+    'Nbd2 Bb7 Bc2 Re8 Nf1 Bf8 Ng3 g6 a4 c5 d5 c4 Bg5 h6 Be3 Nc5 Qd2 h5 Bg5 Be7 '
+    'Ra3 Nfd7 Bh6 Bf8 Bxf8 Kxf8 Nh2 Qh4 Nhf1 Kg8 Ne3 Nf6 Qe2 Qd8 Rf1 Rc8'
+).split()
+
+COUNTRIES = ['GB', 'US', 'IN', 'PK', 'DE', 'FR', 'NO', 'BR']
+
+
+class Dataset:
+    """Deterministic synthetic games of a player on both platforms.
+
+    Every tracked player gets the same games against the same opponents, only
+    their username differs.
+
+    Args:
+        n_games (int): games per platform, spread evenly over MONTHS.
+        opponents_ratio (float, optional): distinct opponents per game. Defaults to 0.05.
+    """
+
+    def __init__(self, n_games: int, opponents_ratio: float = 0.05):
+
+        self.n_games = n_games
+        self.n_opponents = max(10, int(n_games * opponents_ratio))
+        self.per_month = -(-n_games // len(MONTHS))
+        self.start_ms = int(datetime(*MONTHS[0], 1, tzinfo=timezone.utc).timestamp() * 1000)
+        end_ms = int(datetime(2024, 8, 31, tzinfo=timezone.utc).timestamp() * 1000)
+        self.step_ms = (end_ms - self.start_ms) // n_games
+
+    def month_range(self, year: int, month: int) -> range:
+
+        index = MONTHS.index((year, month))
+
+        return range(index * self.per_month, min((index + 1) * self.per_month, self.n_games))
+
+    def plies(self, i: int) -> int:
+
+        return random.Random(i).randint(20, len(MOVES))
+
+    def chesscom_game(self, i: int, base_url: str, username: str = CHESSCOM_USER) -> dict:
+
+        rng = random.Random(i)
+        year, month = MONTHS[i // self.per_month]
+        n_plies = self.plies(i)
+        opponent = f'opp{rng.randrange(self.n_opponents)}'
+        white, black = (username, opponent) if i % 2 == 0 else (opponent, username)
+        date = f'{year}.{month:02d}.{i % 28 + 1:02d}'
+
+        tags = [
+            ('Event', 'Live Chess'), ('Site', 'Chess.com'), ('Date', date), ('Round', '-'),
+            ('White', white), ('Black', black), ('Result', '1-0'),
+            ('ECO', 'C95'), ('ECOUrl', 'https://www.chess.com/openings/Ruy-Lopez-Opening-Closed-Breyer-Defense'),
+            ('UTCDate', date), ('UTCTime', '10:00:00'), ('TimeControl', '600'),
+            ('StartTime', '10:00:00'), ('EndDate', date), ('EndTime', '10:20:00')
+        ]
+        movetext = ' '.join(
+            f"{ply // 2 + 1}{'.' if ply % 2 == 0 else '...'} {move} {{[%clk 0:{9 - ply // 20:02d}:{59 - ply % 20 * 3:02d}.{ply % 10}]}}"
+            for ply, move in enumerate(MOVES[:n_plies])
+        )
+        pgn = '\n'.join(f'[{name} "{value}"]' for name, value in tags) + '\n\n' + movetext + ' 1-0\n'
+
+        def player(username, result):
+            return {'username': username, 'rating': rng.randint(800, 2400), 'result': result,
+                    '@id': f'{base_url}/pub/player/{username}'}
+
+        return {
+            'url': f'https://www.chess.com/game/live/{i}',
+            'uuid': f'c{i:09d}',
+            'pgn': pgn,
+            'time_control': '600',
+            'end_time': self.start_ms // 1000 + i * self.step_ms // 1000,
+            'rated': True,
+            'accuracies': {'white': rng.uniform(40, 99), 'black': rng.uniform(40, 99)},
+            'time_class': 'rapid',
+            'white': player(white, 'win'),
+            'black': player(black, 'resigned')
+        }
+
+    def chesscom_player(self, username: str, base_url: str) -> dict:
+
+        k = int(username[3:])
+
+        return {
+            'username': username,
+            'player_id': k,
+            'country': f'{base_url}/pub/country/{COUNTRIES[k % len(COUNTRIES)]}',
+            'verified': False,
+            'status': 'basic'
+        }
+
+    def lichess_game(self, i: int, username: str = LICHESS_USER) -> dict:
+
+        rng = random.Random(i)
+        n_plies = self.plies(i)
+        opponent = f'opp{rng.randrange(self.n_opponents)}'
+        created_at = self.start_ms + i * self.step_ms
+
+        def player(user_id, rating):
+            return {'user': {'id': user_id, 'name': user_id}, 'rating': rating,
+                    'analysis': {'accuracy': rng.randint(40, 99)}}
+
+        white, black = (username, opponent) if i % 2 == 0 else (opponent, username)
+
+        game = {
+            'id': f'l{i:09d}',
+            'rated': True,
+            'speed': 'rapid',
+            'createdAt': created_at,
+            'lastMoveAt': created_at + 20 * 60 * 1000,
+            'status': 'resign',
+            'winner': rng.choice(['white', 'black']),
+            'players': {'white': player(white, rng.randint(800, 2400)), 'black': player(black, rng.randint(800, 2400))},
+            'opening': {'eco': 'C95', 'name': 'Ruy Lopez: Closed, Breyer Defense'},
+            'moves': ' '.join(MOVES[:n_plies]),
+            'clocks': [60000 - 150 * ply for ply in range(n_plies + 1)],
+            'clock': {'initial': 600, 'increment': 0, 'totalTime': 600}
+        }
+
+        # A third of the games have a computer analysis, a random walk ending in a mate
+        if i % 3 == 0:
+            analysis, eval_cp = [], 0
+            for ply in range(n_plies - 2):
+                swing = rng.choice([10, 20, 40, 80, 150, 350])
+                eval_cp += swing * rng.choice([-1, 1])
+                judgment = {'Inaccuracy': 80, 'Mistake': 150, 'Blunder': 350}
+                name = next((name for name, bound in judgment.items() if bound == swing), None)
+                analysis.append({'eval': eval_cp, 'judgment': {'name': name, 'comment': f'{name}.'}} if name else {'eval': eval_cp})
+            analysis += [{'mate': 2}, {'mate': 1}]
+            game['analysis'] = analysis
+
+        return game
+
+    def lichess_user(self, user_id: str) -> dict:
+
+        k = int(user_id[3:]) if user_id[3:].isdigit() else 0
+
+        return {'id': user_id, 'username': user_id, 'createdAt': self.start_ms,
+                'profile': {'country': COUNTRIES[k % len(COUNTRIES)]}}
+
+    def lichess_games_between(self, since: int = None, until: int = None, username: str = LICHESS_USER):
+
+        first = 0 if since is None else max(0, -(-(since - self.start_ms) // self.step_ms))
+        for i in range(first, self.n_games):
+            if until is not None and self.start_ms + i * self.step_ms > until:
+                break
+            yield self.lichess_game(i, username)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes, without TCP_NODELAY every request on a
+    # kept-alive connection waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, content_type='application/json'):
+
+        body = data if isinstance(data, bytes) else json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def record(self, endpoint: str, start: float):
+
+        self.server.calls[endpoint] += 1
+        self.server.latencies[endpoint].append(time.perf_counter() - start)
+
+    def do_GET(self):
+
+        start = time.perf_counter()
+        dataset = self.server.dataset
+        base_url = f'http://{self.server.server_address[0]}:{self.server.server_port}'
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+
+        if parts[:2] == ['pub', 'player'] and parts[3:4] == ['games'] and len(parts) == 6:
+            year, month = int(parts[4]), int(parts[5])
+            games = [dataset.chesscom_game(i, base_url, parts[2]) for i in dataset.month_range(year, month)] if (year, month) in MONTHS else []
+            self.send_json({'games': games})
+            endpoint = 'chesscom_monthly_archive'
+        elif parts[:2] == ['pub', 'player'] and parts[3:] == ['games', 'archives']:
+            self.send_json({'archives': [f'{base_url}/pub/player/{parts[2]}/games/{y}/{m:02d}' for y, m in MONTHS]})
+            endpoint = 'chesscom_archives'
+        elif parts[:2] == ['pub', 'player']:
+            self.send_json(dataset.chesscom_player(parts[2], base_url))
+            endpoint = 'chesscom_player'
+        elif parts[:2] == ['pub', 'country']:
+            self.send_json({'code': parts[2], 'name': f'Country {parts[2]}'})
+            endpoint = 'chesscom_country'
+        elif parts[:3] == ['api', 'games', 'user']:
+            query = parse_qs(url.query)
+            since = int(query['since'][0]) if 'since' in query else None
+            until = int(query['until'][0]) if 'until' in query else None
+            max_games = int(query['max'][0]) if 'max' in query else None
+            with self.server.lock:
+                drop = self.server.drop_exports > 0
+                self.server.drop_exports -= drop
+            # The export is streamed in chunks like lichess does
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            dropped = False
+            for n, game in enumerate(dataset.lichess_games_between(since, until, parts[3])):
+                if n == max_games:
+                    break
+                # A dropped export stops after a few games without ending the response
+                if drop and n == 10:
+                    self.close_connection = dropped = True
+                    break
+                if self.server.export_rate:
+                    time.sleep(1 / self.server.export_rate)
+                line = json.dumps(game).encode() + b'\n'
+                self.wfile.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+            if not dropped:
+                self.wfile.write(b'0\r\n\r\n')
+            endpoint = 'lichess_games'
+        elif parts[:2] == ['api', 'user']:
+            self.send_json(dataset.lichess_user(parts[2]))
+            endpoint = 'lichess_user'
+        else:
+            self.send_error(404)
+            endpoint = 'not_found'
+
+        self.record(endpoint, start)
+
+    def do_POST(self):
+
+        start = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+
+        if self.path.startswith('/api/users'):
+            self.send_json([self.server.dataset.lichess_user(user_id) for user_id in body.split(',') if user_id])
+            endpoint = 'lichess_users'
+        else:
+            self.send_error(404)
+            endpoint = 'not_found'
+
+        self.record(endpoint, start)
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections at exit are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """Local HTTP server answering the chess.com and lichess endpoints from a Dataset."""
+
+    def __init__(self, dataset: Dataset, export_rate: float = None):
+        """
+        Args:
+            dataset (Dataset): games and profiles to serve.
+            export_rate (float, optional): games per second of each lichess export,
+            like lichess throttles its streams. Defaults to None, unthrottled.
+        """
+
+        self.httpd = StubHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.httpd.dataset = dataset
+        self.httpd.export_rate = export_rate
+        self.httpd.drop_exports = 0
+        self.httpd.lock = threading.Lock()
+        self.reset()
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def drop_next_exports(self, n: int):
+        """Cuts the next n lichess exports short, like a dropped connection."""
+
+        with self.httpd.lock:
+            self.httpd.drop_exports = n
+
+    def reset(self):
+
+        self.httpd.calls = Counter()
+        self.httpd.latencies = defaultdict(list)
+
+    def stats(self) -> dict:
+        """Requests answered per endpoint and their mean server side latency in ms."""
+
+        return {
+            endpoint: {
+                'calls': count,
+                'mean_ms': round(1000 * sum(self.httpd.latencies[endpoint]) / count, 3)
+            }
+            for endpoint, count in self.httpd.calls.items()
+        }
+
+    def close(self):
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeLoadJob:
+
+    def __init__(self, job_id: str, output_rows: int, latency: float):
+
+        self.job_id = job_id
+        self.output_rows = output_rows
+        # Rows a merge query inserted or updated, see FakeBigQueryClient.query
+        self.num_dml_affected_rows = output_rows
+        self.error_result = None
+        self.errors = None
+        self.done_at = time.monotonic() + latency
+
+    def done(self) -> bool:
+        return time.monotonic() >= self.done_at
+
+    def result(self):
+
+        time.sleep(max(0.0, self.done_at - time.monotonic()))
+
+        return self
+
+
+class FakeBigQueryClient:
+    """Stand-in for bigquery.Client that reads uploads fully and counts their rows.
+
+    Gzip compressed uploads are decompressed like BigQuery does, `bytes` of a
+    load is what was uploaded.
+
+    Args:
+        latency (float, optional): seconds a load job takes to finish after
+        the upload. Defaults to 0.05.
+        fail_loads (int, optional): number of first load jobs that fail. Defaults to 0.
+        bandwidth (float, optional): upload speed in bytes per second, uploads
+        take their size over it. Defaults to None, instant.
+    """
+
+    def __init__(self, latency: float = 0.05, fail_loads: int = 0, bandwidth: float = None):
+
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fail_loads = fail_loads
+        self.loads = []
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def load_table_from_file(self, file_obj, destination, job_config=None, **kwargs) -> FakeLoadJob:
+
+        uploaded = file_obj.read()
+        if self.bandwidth:
+            time.sleep(len(uploaded) / self.bandwidth)
+        data = gzip.decompress(uploaded) if uploaded[:2] == b'\x1f\x8b' else uploaded
+
+        if data[:4] == b'PAR1':
+            rows = pq.read_metadata(io.BytesIO(data)).num_rows
+        else:
+            rows = data.count(b'\n')
+
+        with self.lock:
+            self.loads.append({'destination': str(destination), 'bytes': len(uploaded), 'rows': rows})
+            job = FakeLoadJob(f'load_{len(self.loads)}', rows, self.latency)
+            if self.fail_loads > 0:
+                self.fail_loads -= 1
+                job.error_result = {'reason': 'backendError'}
+                job.errors = [{'reason': 'backendError', 'message': 'Fake load failure'}]
+
+        return job
+
+    def query(self, query: str, **kwargs) -> FakeLoadJob:
+
+        self.queries.append(query)
+        # A merge affects the rows just loaded to its staging table
+        rows = self.loads[-1]['rows'] if self.loads else 0
+
+        return FakeLoadJob(f'query_{len(self.queries)}', rows, self.latency)
+
+    def delete_table(self, table, not_found_ok: bool = False):
+        pass
@@ -0,0 +1,195 @@
+"""Runs one scenario of the offline benchmark suite, see bench_suite.py.
+
+Each scenario runs in its own process: both platforms have a module named
+`utils`, and the peak RSS of the process is the peak of the scenario.
+
+    python benchmarks/suite_worker.py <scenario> <n_games> <stub_url> <result_path>
+"""
+from pathlib import Path
+import contextlib
+import resource
+import runpy
+import json
+import time
+import sys
+import os
+
+REPO_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(REPO_PATH))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from fixtures import Dataset, FakeBigQueryClient, MONTHS, CHESSCOM_USER, LICHESS_USER, ROSTER
+
+
+def use_platform(platform: str):
+    """Makes the platform's sibling imports (utils, pgn...) importable, like running its scripts."""
+
+    sys.path.insert(0, str(REPO_PATH / 'extract' / platform))
+
+
+def chesscom_extract_monthly_data(dataset: Dataset, prepared) -> int:
+
+    use_platform('chesscom')
+    from utils import extract_monthly_data
+
+    return sum(extract_monthly_data(year, month, CHESSCOM_USER)[0].height for year, month in MONTHS)
+
+
+def chesscom_backfill_roster(dataset: Dataset, prepared) -> int:
+    """The chess.com backfill of every ROSTER player in one run, sharing their opponents."""
+
+    use_platform('chesscom')
+    os.environ['CHESSCOM_USERS'] = ','.join(ROSTER)
+    runpy.run_path(str(REPO_PATH / 'extract' / 'chesscom' / 'backfill.py'), run_name='__main__')
+
+    return dataset.n_games * len(ROSTER)
+
+
+def chesscom_backfill(dataset: Dataset, prepared) -> int:
+
+    use_platform('chesscom')
+    runpy.run_path(str(REPO_PATH / 'extract' / 'chesscom' / 'backfill.py'), run_name='__main__')
+
+    return dataset.n_games
+
+
+def lichess_extract_game_data(dataset: Dataset, prepared) -> int:
+
+    use_platform('lichess')
+    from utils import extract_game_data, build_dataframe
+
+    opponents = {f'opp{k}': dataset.lichess_user(f'opp{k}') for k in range(dataset.n_opponents)}
+    extracted = 0
+
+    for year, month in MONTHS:
+        games = [dataset.lichess_game(i) for i in dataset.month_range(year, month)]
+        extracted += build_dataframe([extract_game_data(game, LICHESS_USER, opponents) for game in games]).height
+
+    return extracted
+
+
+def lichess_get_games(dataset: Dataset, prepared) -> int:
+
+    use_platform('lichess')
+    from utils import get_games
+
+    return len(get_games(LICHESS_USER))
+
+
+def lichess_backfill(dataset: Dataset, prepared) -> int:
+
+    use_platform('lichess')
+    runpy.run_path(str(REPO_PATH / 'extract' / 'lichess' / 'backfill.py'), run_name='__main__')
+
+    return dataset.n_games
+
+
+def lichess_backfill_rerun(dataset: Dataset, prepared) -> int:
+    """The lichess backfill over months already in the store but missing from the manifest."""
+
+    use_platform('lichess')
+    runpy.run_path(str(REPO_PATH / 'extract' / 'lichess' / 'backfill.py'), run_name='__main__')
+
+    return dataset.n_games
+
+
+def make_output_dirs(dataset: Dataset):
+    """Creates the games_data directories the backfill scripts write into."""
+
+    for platform in ('chesscom', 'lichess'):
+        (Path.cwd() / 'games_data' / platform).mkdir(parents=True, exist_ok=True)
+
+
+def write_lichess_files(dataset: Dataset) -> list:
+    """Writes the lichess dataset as monthly files in the working directory."""
+
+    use_platform('lichess')
+    from utils import extract_game_data, build_dataframe, write_games
+
+    opponents = {f'opp{k}': dataset.lichess_user(f'opp{k}') for k in range(dataset.n_opponents)}
+    paths = []
+
+    for year, month in MONTHS:
+        games = [dataset.lichess_game(i) for i in dataset.month_range(year, month)]
+        if games:
+            df = build_dataframe([extract_game_data(game, LICHESS_USER, opponents) for game in games])
+            paths.append(write_games(df, Path.cwd() / f'{year}_{month:02d}'))
+
+    return paths
+
+
+def write_lichess_store(dataset: Dataset):
+    """Writes the lichess dataset to the player's partitions, indexed but not in the manifest."""
+
+    use_platform('lichess')
+    from utils import extract_game_data, build_dataframe, write_games
+
+    opponents = {f'opp{k}': dataset.lichess_user(f'opp{k}') for k in range(dataset.n_opponents)}
+    user_path = Path.cwd() / 'games_data' / 'lichess' / LICHESS_USER
+
+    for year, month in MONTHS:
+        games = [dataset.lichess_game(i) for i in dataset.month_range(year, month)]
+        if games:
+            df = build_dataframe([extract_game_data(game, LICHESS_USER, opponents) for game in games])
+            write_games(df, user_path / f'{year}_{month:02d}')
+
+
+def load_backfill(dataset: Dataset, paths: list) -> int:
+
+    from load.orchestrator import load_files
+    from load.lichess.config import job_config, parquet_job_config
+
+    config = parquet_job_config if os.getenv('OUTPUT_FORMAT') == 'parquet' else job_config
+    results = load_files(FakeBigQueryClient(), 'project.dataset.table', paths, config, poll_interval=0.01)
+
+    return sum(result['output_rows'] for result in results.values())
+
+
+SCENARIOS = {
+    'chesscom_extract_monthly_data': chesscom_extract_monthly_data,
+    'chesscom_backfill': chesscom_backfill,
+    'chesscom_backfill_roster': chesscom_backfill_roster,
+    'lichess_extract_game_data': lichess_extract_game_data,
+    'lichess_get_games': lichess_get_games,
+    'lichess_backfill': lichess_backfill,
+    'lichess_backfill_rerun': lichess_backfill_rerun,
+    'load_backfill': load_backfill
+}
+
+# Untimed preparation of a scenario's input, passed to it as `prepared`
+PREPARE = {
+    'chesscom_backfill': make_output_dirs,
+    'chesscom_backfill_roster': make_output_dirs,
+    'lichess_backfill': make_output_dirs,
+    'lichess_backfill_rerun': write_lichess_store,
+    'load_backfill': write_lichess_files
+}
+
+
+# Parse workers of the lichess backfill are spawned and import this module again
+if __name__ == '__main__':
+
+    scenario, n_games, stub_url, result_path = sys.argv[1], int(sys.argv[2]), sys.argv[3], sys.argv[4]
+    dataset = Dataset(n_games)
+
+    os.environ['CHESSCOM_API_URL'] = stub_url
+    os.environ['LICHESS_API_URL'] = stub_url
+    os.environ['CHESSCOM_USER'] = CHESSCOM_USER
+    os.environ['LICHESS_USER'] = LICHESS_USER
+    os.environ['OPPONENT_CACHE_PATH'] = str(Path.cwd() / 'opponent_cache.sqlite')
+
+    # Keeps the scripts' progress and metrics output out of the timings
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        prepared = PREPARE[scenario](dataset) if scenario in PREPARE else None
+        start = time.perf_counter()
+        games = SCENARIOS[scenario](dataset, prepared)
+        wall_seconds = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux
+    peak_rss_kib = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+
+    with open(result_path, 'w') as f:
+        json.dump({'games': games, 'wall_seconds': wall_seconds, 'peak_rss_mib': round(peak_rss_kib / 1024, 1)}, f)
@@ -0,0 +1,291 @@
+import re
+
+# Squares are indexed 0-63 from a1 to h8: index = rank * 8 + file
+FILES = 'abcdefgh'
+PROMOTIONS = {'N': 1, 'B': 2, 'R': 3, 'Q': 4}
+PROMOTION_PIECES = {code: piece for piece, code in PROMOTIONS.items()}
+
+KNIGHT_STEPS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+KING_STEPS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+ROOK_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, 1), (-1, -1), (1, -1)]
+SLIDES = {'B': BISHOP_DIRECTIONS, 'R': ROOK_DIRECTIONS, 'Q': BISHOP_DIRECTIONS + ROOK_DIRECTIONS}
+
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+START_POSITION = (
+    list('RNBQKBNR') + ['P'] * 8 + [None] * 32 + ['p'] * 8 + list('rnbqkbnr')
+)
+
+
+def square_index(name: str) -> int:
+    return (int(name[1]) - 1) * 8 + FILES.index(name[0])
+
+
+def square_name(square: int) -> str:
+    return FILES[square % 8] + str(square // 8 + 1)
+
+
+def offset(square: int, file_step: int, rank_step: int):
+    """Returns the square reached by a step, or None when it leaves the board."""
+
+    file = square % 8 + file_step
+    rank = square // 8 + rank_step
+
+    if 0 <= file < 8 and 0 <= rank < 8:
+        return rank * 8 + file
+
+    return None
+
+
+def encode_move(from_square: int, to_square: int, promotion: int = 0) -> int:
+    """Packs a move into 16 bits: 6 bits from, 6 bits to and 3 bits promotion piece."""
+
+    return from_square | (to_square << 6) | (promotion << 12)
+
+
+def decode_move(code: int) -> str:
+    """Returns the UCI notation (e.g. 'e2e4', 'e7e8q') of an encoded move."""
+
+    promotion = PROMOTION_PIECES.get(code >> 12, '').lower()
+
+    return square_name(code & 63) + square_name((code >> 6) & 63) + promotion
+
+
+class Board:
+    """Minimal array backed board that replays SAN moves.
+
+    Only what is needed to resolve SAN into from/to squares is implemented:
+    piece placement, side to move, castling rights and the en passant square.
+    """
+
+    def __init__(self):
+
+        self.squares = list(START_POSITION)
+        self.white_to_move = True
+        # Castling rights as a subset of 'KQkq'
+        self.castling = 'KQkq'
+        self.ep_square = None
+
+    @classmethod
+    def from_fen(cls, fen: str) -> 'Board':
+        """Creates a board from the first four fields of a FEN string."""
+
+        placement, side, castling, ep_square = fen.split()[:4]
+        board = cls()
+        board.squares = [None] * 64
+
+        for rank, row in enumerate(reversed(placement.split('/'))):
+            file = 0
+            for char in row:
+                if char.isdigit():
+                    file += int(char)
+                else:
+                    board.squares[rank * 8 + file] = char
+                    file += 1
+
+        board.white_to_move = side == 'w'
+        board.castling = '' if castling == '-' else castling
+        board.ep_square = None if ep_square == '-' else square_index(ep_square)
+
+        return board
+
+    def copy(self) -> 'Board':
+
+        board = Board.__new__(Board)
+        board.squares = list(self.squares)
+        board.white_to_move = self.white_to_move
+        board.castling = self.castling
+        board.ep_square = self.ep_square
+
+        return board
+
+    def own(self, piece: str) -> str:
+        """Returns the piece letter in the case of the side to move."""
+
+        return piece.upper() if self.white_to_move else piece.lower()
+
+    def is_attacked(self, square: int, by_white: bool) -> bool:
+        """Whether a square is attacked by the pieces of one side."""
+
+        def piece(letter):
+            return letter.upper() if by_white else letter.lower()
+
+        for file_step, rank_step in KNIGHT_STEPS:
+            target = offset(square, file_step, rank_step)
+            if target is not None and self.squares[target] == piece('N'):
+                return True
+
+        for file_step, rank_step in KING_STEPS:
+            target = offset(square, file_step, rank_step)
+            if target is not None and self.squares[target] == piece('K'):
+                return True
+
+        # Pawns attack diagonally forward, so look one rank behind the square
+        pawn_rank_step = -1 if by_white else 1
+        for file_step in (-1, 1):
+            target = offset(square, file_step, pawn_rank_step)
+            if target is not None and self.squares[target] == piece('P'):
+                return True
+
+        for directions, attackers in ((ROOK_DIRECTIONS, 'RQ'), (BISHOP_DIRECTIONS, 'BQ')):
+            for file_step, rank_step in directions:
+                target = offset(square, file_step, rank_step)
+                while target is not None:
+                    occupant = self.squares[target]
+                    if occupant is not None:
+                        if occupant in {piece(letter) for letter in attackers}:
+                            return True
+                        break
+                    target = offset(target, file_step, rank_step)
+
+        return False
+
+    def king_in_check_after(self, from_square: int, to_square: int) -> bool:
+        """Whether a move would leave the mover's own king in check."""
+
+        board = self.copy()
+        board.apply(from_square, to_square, 0)
+        king = board.squares.index('K' if self.white_to_move else 'k')
+
+        return board.is_attacked(king, not self.white_to_move)
+
+    def candidates(self, piece: str, to_square: int, capture_file) -> list:
+        """Squares of pieces of the side to move that can pseudo-legally reach a square."""
+
+        own_piece = self.own(piece)
+        found = []
+
+        if piece == 'P':
+            direction = 1 if self.white_to_move else -1
+            if capture_file is not None:
+                source = offset(to_square, FILES.index(capture_file) - to_square % 8, -direction)
+                if source is not None and self.squares[source] == own_piece:
+                    found.append(source)
+            else:
+                source = offset(to_square, 0, -direction)
+                if source is not None and self.squares[source] == own_piece:
+                    found.append(source)
+                elif source is not None and self.squares[source] is None:
+                    double = offset(source, 0, -direction)
+                    start_rank = 1 if self.white_to_move else 6
+                    if double is not None and double // 8 == start_rank and self.squares[double] == own_piece:
+                        found.append(double)
+
+        elif piece in ('N', 'K'):
+            for file_step, rank_step in (KNIGHT_STEPS if piece == 'N' else KING_STEPS):
+                source = offset(to_square, file_step, rank_step)
+                if source is not None and self.squares[source] == own_piece:
+                    found.append(source)
+
+        else:
+            for file_step, rank_step in SLIDES[piece]:
+                source = offset(to_square, file_step, rank_step)
+                while source is not None:
+                    occupant = self.squares[source]
+                    if occupant is not None:
+                        if occupant == own_piece:
+                            found.append(source)
+                        break
+                    source = offset(source, file_step, rank_step)
+
+        return found
+
+    def parse_san(self, san: str) -> tuple:
+        """Resolves a SAN move into (from_square, to_square, promotion) for the side to move.
+
+        Raises:
+            ValueError: if the move is malformed or no legal move matches it.
+        """
+
+        san = san.rstrip('+#!?')
+
+        if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            rank = 0 if self.white_to_move else 7
+            king = rank * 8 + 4
+            return king, king + (2 if len(san) == 3 else -2), 0
+
+        match = SAN_RE.match(san)
+        if match is None:
+            raise ValueError(f"Invalid SAN move: {san}")
+
+        piece, from_file, from_rank, to_name, promotion = match.groups()
+        piece = piece or 'P'
+        to_square = square_index(to_name)
+
+        capture_file = from_file if piece == 'P' and 'x' in san else None
+        sources = self.candidates(piece, to_square, capture_file)
+
+        if from_file is not None:
+            sources = [source for source in sources if FILES[source % 8] == from_file]
+        if from_rank is not None:
+            sources = [source for source in sources if source // 8 == int(from_rank) - 1]
+        if len(sources) > 1:
+            sources = [source for source in sources if not self.king_in_check_after(source, to_square)]
+
+        if len(sources) != 1:
+            raise ValueError(f"Cannot resolve SAN move: {san}")
+
+        return sources[0], to_square, PROMOTIONS.get(promotion, 0)
+
+    def apply(self, from_square: int, to_square: int, promotion: int) -> list:
+        """Plays a move given as squares, updating castling rights and en passant.
+
+        Returns:
+            list: (square, piece before the move) of every square the move
+            changed, so a position hash can be updated instead of recomputed.
+        """
+
+        squares = self.squares
+        piece = squares[from_square]
+        ep_square = self.ep_square
+        self.ep_square = None
+        changed = [(from_square, piece), (to_square, squares[to_square])]
+
+        if piece in ('P', 'p'):
+            if to_square == ep_square:
+                # En passant removes the pawn behind the target square
+                captured = to_square - 8 if piece == 'P' else to_square + 8
+                changed.append((captured, squares[captured]))
+                squares[captured] = None
+            if abs(to_square - from_square) == 16:
+                self.ep_square = (from_square + to_square) // 2
+            if promotion:
+                piece = PROMOTION_PIECES[promotion]
+                piece = piece if self.white_to_move else piece.lower()
+
+        if piece in ('K', 'k') and abs(to_square - from_square) == 2:
+            # Castling also moves the rook
+            if to_square > from_square:
+                rook_from, rook_to = to_square + 1, to_square - 1
+            else:
+                rook_from, rook_to = to_square - 2, to_square + 1
+            changed += [(rook_from, squares[rook_from]), (rook_to, squares[rook_to])]
+            squares[rook_to], squares[rook_from] = squares[rook_from], None
+
+        squares[to_square] = piece
+        squares[from_square] = None
+
+        for square, right in ((4, 'KQ'), (60, 'kq'), (0, 'Q'), (7, 'K'), (56, 'q'), (63, 'k')):
+            if square in (from_square, to_square):
+                self.castling = ''.join(c for c in self.castling if c not in right)
+
+        self.white_to_move = not self.white_to_move
+
+        return changed
+
+    def push_san(self, san: str) -> int:
+        """Plays a SAN move and returns its 16 bit encoding."""
+
+        from_square, to_square, promotion = self.parse_san(san)
+        self.apply(from_square, to_square, promotion)
+
+        return encode_move(from_square, to_square, promotion)
+
+
+def encode_moves(moves: list) -> list:
+    """Replays a game's SAN moves and returns their 16 bit encodings."""
+
+    board = Board()
+
+    return [board.push_san(san) for san in moves]
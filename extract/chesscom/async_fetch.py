@@ -0,0 +1,269 @@
+import asyncio
+import time
+import requests
+from utils import (
+    headers,
+    chesscom_url,
+    opponent_cache,
+    get_opponent,
+    extract_games,
+    archive_watermark,
+    endpoint_name,
+    conditional_headers,
+    response_validators,
+    game_index,
+    metrics,
+    PROFILE_TTL,
+    COUNTRY_TTL
+)
+from extract.http_client import HttpClient, RETRY_STATUSES, retry_delay
+
+# chess.com serves serial requests without limits but may answer parallel
+# requests with 429, so concurrency is kept low and throttled by default
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 8.0
+MIN_RATE = 0.5
+MAX_RETRIES = 5
+
+
+class TokenBucket:
+    """Token bucket rate limiter that slows down when the API answers 429."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, capacity: int = 1):
+        """
+        Args:
+            rate (float, optional): tokens added per second. Defaults to DEFAULT_RATE.
+            capacity (int, optional): maximum burst size. Defaults to 1.
+        """
+
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a request is allowed to go out."""
+
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def backoff(self, delay: float):
+        """Pauses every request for `delay` seconds and halves the rate."""
+
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self.rate = max(self.rate / 2, MIN_RATE)
+
+    def recover(self):
+        """Moves the rate back towards its configured value after a success."""
+
+        self.rate = min(self.max_rate, self.rate * 1.1)
+
+
+class AsyncChesscomClient:
+    """Concurrent chess.com client built on a pooled HttpClient.
+
+    Requests run in worker threads while scheduling, rate limiting and the
+    opponent cache stay on the event loop.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE):
+        """
+        Args:
+            concurrency (int, optional): maximum requests in flight. Defaults to DEFAULT_CONCURRENCY.
+            rate (float, optional): maximum requests per second. Defaults to DEFAULT_RATE.
+        """
+
+        # Retries are left to get_json so that they slow down every request through the bucket
+        self.http = HttpClient(max_per_host=concurrency, max_retries=0)
+        self.http.session.headers.update(headers)
+
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate)
+        self.pending = dict()
+        self.requests_made = 0
+
+    async def get_response(self, url: str, request_headers: dict = None):
+        """Fetches a url, retrying with backoff on 429 and server errors.
+
+        Returns:
+            requests.Response: the response, or None if the resource does not exist.
+        """
+
+        for attempt in range(MAX_RETRIES):
+            await self.bucket.acquire()
+
+            async with self.semaphore:
+                self.requests_made += 1
+                try:
+                    response = await asyncio.to_thread(self.http.get, url, endpoint_name(url), headers=request_headers)
+                except (requests.ConnectionError, requests.Timeout):
+                    self.bucket.backoff(retry_delay(None, attempt))
+                    continue
+
+            if response.status_code == 404:
+                return None
+
+            if response.status_code in RETRY_STATUSES:
+                delay = retry_delay(response, attempt)
+                print(f"Got {response.status_code} from {url}, retrying in {delay:.1f}s")
+                self.bucket.backoff(delay)
+                continue
+
+            response.raise_for_status()
+            self.bucket.recover()
+
+            return response
+
+        raise RuntimeError(f"Giving up on {url} after {MAX_RETRIES} attempts")
+
+    async def get_json(self, url: str):
+        """Returns the JSON response of a url, or None if the resource does not exist."""
+
+        response = await self.get_response(url)
+
+        return response.json() if response is not None else None
+
+    async def get_archive_if_modified(self, url: str, validators: dict) -> tuple:
+        """Async counterpart of utils.get_archive_if_modified."""
+
+        start = time.perf_counter()
+        response = await self.get_response(url, conditional_headers(validators))
+        metrics.add_time('fetch_archive', time.perf_counter() - start)
+
+        if response is None:
+            return {'games': []}, validators
+        if response.status_code == 304:
+            return None, validators
+
+        return response.json(), response_validators(response)
+
+    async def get_cached(self, url: str, ttl: float):
+        """Returns a cached JSON response, fetching it once even if requested concurrently.
+
+        A url that does not exist is cached as an empty dict, like utils.get_cached.
+        """
+
+        data = opponent_cache.get(url)
+        if data is not None:
+            return data
+
+        if url not in self.pending:
+            self.pending[url] = asyncio.ensure_future(self.get_json(url))
+
+        try:
+            data = await self.pending[url]
+        finally:
+            self.pending.pop(url, None)
+
+        if data is None:
+            data = {}
+        opponent_cache.set(url, data, ttl)
+
+        return data
+
+    async def get_archives(self, username: str) -> list:
+        """Returns the (year, month) pairs a player has an archive for."""
+
+        archives = await self.get_json(f"{chesscom_url}/pub/player/{username}/games/archives")
+
+        return [tuple(int(part) for part in url.split('/')[-2:]) for url in (archives or {}).get('archives', [])]
+
+    async def get_monthly_archive(self, year: int, month: int, username: str) -> dict:
+
+        url = f"{chesscom_url}/pub/player/{username}/games/{year}/{str(month).zfill(2)}"
+        archive = await self.get_json(url)
+
+        return archive if archive is not None else {'games': []}
+
+    async def enrich_opponents(self, games: list, username: str):
+        """Fetches the profiles and countries of every opponent into the opponent cache.
+
+        Opponents already cached or being fetched for another month or player
+        are not requested again.
+        """
+
+        profile_urls = list(dict.fromkeys(get_opponent(game, username)[1] for game in games))
+        profiles = await asyncio.gather(*[self.get_cached(url, PROFILE_TTL) for url in profile_urls])
+
+        country_urls = list(dict.fromkeys(profile['country'] for profile in profiles if 'country' in profile))
+        await asyncio.gather(*[self.get_cached(url, COUNTRY_TTL) for url in country_urls])
+
+    async def extract_monthly_data(self, year: int, month: int, username: str) -> tuple:
+        """Async counterpart of utils.extract_monthly_data."""
+
+        start = time.perf_counter()
+        archive = await self.get_monthly_archive(year, month, username)
+        metrics.add_time('fetch_archive', time.perf_counter() - start)
+        games = game_index.new_games('chesscom', username, archive['games'], 'uuid')
+
+        # Once the cache is warm extract_game_data makes no network calls
+        start = time.perf_counter()
+        await self.enrich_opponents(games, username)
+        metrics.add_time('opponent_enrichment', time.perf_counter() - start)
+
+        # Parsing runs in a worker thread so the other months' requests carry on
+        return await asyncio.to_thread(extract_games, games, username), archive_watermark(archive['games'])
+
+
+async def extract_months(months: list, usernames: list, concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE,
+                         completed: callable = None):
+    """Extracts several months of several players concurrently under one rate limit.
+
+    Every player's archive list is fetched first so that only months they
+    played in are requested. All players then share the client's rate limit,
+    connections and in-flight opponent lookups.
+
+    Args:
+        months (list): (year, month) pairs to extract.
+        usernames (list): chess.com usernames of the players, e.g. from roster.get_usernames.
+        concurrency (int, optional): maximum requests in flight. Defaults to DEFAULT_CONCURRENCY.
+        rate (float, optional): maximum requests per second. Defaults to DEFAULT_RATE.
+        completed (callable, optional): called with username, year and month, returns
+        True for months already extracted, which are not requested again. Defaults to None.
+
+    Yields:
+        tuple: username, year, month, the month's DataFrame and its watermark, in
+        order of completion.
+    """
+
+    client = AsyncChesscomClient(concurrency, rate)
+
+    archives = await asyncio.gather(*[client.get_archives(username) for username in usernames])
+    user_months = [
+        (username, year, month)
+        for username, archived in zip(usernames, map(set, archives))
+        for year, month in months if (year, month) in archived
+        and not (completed and completed(username, year, month))
+    ]
+
+    async def extract(username, year, month):
+        return (username, year, month, *await client.extract_monthly_data(year, month, username))
+
+    tasks = [asyncio.ensure_future(extract(*user_month)) for user_month in user_months]
+
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # A failed month or a consumer that stops early leaves the rest unfinished
+        for task in tasks:
+            task.cancel()
+
+    print(f"Made {client.requests_made} requests for {len(user_months)} months of {len(usernames)} players.")
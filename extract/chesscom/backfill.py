@@ -1,4 +1,8 @@
-from utils import extract_monthly_data
+from async_fetch import extract_months
+from utils import append_games, opponent_cache, game_index, metrics
+from extract.roster import get_usernames
+from extract.manifest import Manifest, partition_key
+import asyncio
 import os
 from pathlib import Path
 
@@ -7,9 +11,15 @@ year_end = 2025
 month_strt = 1
 month_end = 13
 
-CHESSCOM_USER = os.getenv('CHESSCOM_USER')
+# CHESSCOM_USERS=alice,bob extracts several players in one run, see roster.py
+CHESSCOM_USERS = get_usernames('chesscom')
+CONCURRENCY = int(os.getenv('CHESSCOM_CONCURRENCY', 4))
+RATE = float(os.getenv('CHESSCOM_RATE', 8.0))
 
 games_data_path = Path.cwd() / 'games_data' / 'chesscom'
+manifest = Manifest()
+
+months = []
 
 for year in range(year_strt, year_end):
     for month in range(month_strt, month_end):
@@ -19,8 +29,25 @@ for year in range(year_strt, year_end):
         if year == 2024 and month > 8:
             continue
         
-print(f"Extracting data for {year}-{month}")
-monthly_data = extract_monthly_data(year, month, CHESSCOM_USER)
-print(f"Saving data for {year}-{month}")
-monthly_data.write_ndjson(games_data_path / f"{year}_{str(month).zfill(2)}.ndjson")
-print(f"Data saved for {year}-{month}")
\ No newline at end of file
+        months.append((year, month))
+
+def completed(username: str, year: int, month: int) -> bool:
+    # Months written by a previous run are skipped while their files still match the manifest
+    return manifest.is_complete(partition_key('chesscom', username, f"{year}_{str(month).zfill(2)}"))
+
+async def main():
+    
+    # Files changed since the last run are indexed again before any game is skipped
+    game_index.sync('chesscom')
+    print(f"Extracting data for {len(months)} months of {len(CHESSCOM_USERS)} players")
+    async for username, year, month, monthly_data, watermark in extract_months(months, CHESSCOM_USERS, concurrency=CONCURRENCY, rate=RATE, completed=completed):
+        year_month = f"{year}_{str(month).zfill(2)}"
+        print(f"Saving data for {username} {year}-{month}")
+        # Only games not stored yet were extracted, so they are added to the month's file
+        path = append_games(monthly_data, games_data_path / username / year_month)
+        manifest.record(partition_key('chesscom', username, year_month), path, watermark)
+        print(f"Data saved for {username} {year}-{month}")
+
+asyncio.run(main())
+
+metrics.write_summary(opponent_cache=opponent_cache.stats())
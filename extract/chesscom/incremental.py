@@ -0,0 +1,77 @@
+from async_fetch import AsyncChesscomClient
+from utils import chesscom_url, extract_games, append_games, opponent_cache, game_index, metrics
+from extract.extraction_state import load_state, save_state, get_user_state
+from extract.roster import get_usernames
+from extract.manifest import Manifest, partition_key
+from datetime import datetime, timezone
+from pathlib import Path
+import asyncio
+import os
+
+games_data_path = Path.cwd() / 'games_data' / 'chesscom'
+CHESSCOM_USERS = get_usernames('chesscom')
+CONCURRENCY = int(os.getenv('CHESSCOM_CONCURRENCY', 4))
+RATE = float(os.getenv('CHESSCOM_RATE', 8.0))
+
+state = load_state()
+manifest = Manifest()
+game_index.sync('chesscom')
+
+async def update_player(client: AsyncChesscomClient, username: str):
+    
+    user_state = get_user_state(state, 'chesscom', username)
+    watermark = user_state['watermark'] or 0
+    
+    # Months that ended before the watermark cannot contain new games
+    watermark_month = datetime.fromtimestamp(watermark, tz=timezone.utc).strftime('%Y/%m')
+    archive_urls = [
+        f"{chesscom_url}/pub/player/{username}/games/{year}/{str(month).zfill(2)}"
+        for year, month in await client.get_archives(username)
+        if f"{year}/{str(month).zfill(2)}" >= watermark_month
+    ]
+    
+    # Archives are requested together, then handled in order so the watermark only moves forward
+    fetched = await asyncio.gather(*[
+        client.get_archive_if_modified(archive_url, user_state['archives'].get(archive_url, {}))
+        for archive_url in archive_urls
+    ])
+    
+    for archive_url, (archive, validators) in zip(archive_urls, fetched):
+        
+        year, month = archive_url.split('/')[-2:]
+        
+        if archive is None:
+            print(f"No changes for {username} {year}-{month}")
+            continue
+        
+        new_games = [game for game in archive['games'] if game['end_time'] > watermark]
+        new_games = game_index.new_games('chesscom', username, new_games, 'uuid')
+        
+        if new_games:
+            print(f"Extracting {len(new_games)} new games for {username} {year}-{month}")
+            await client.enrich_opponents(new_games, username)
+            monthly_data = await asyncio.to_thread(extract_games, new_games, username)
+            path = append_games(monthly_data, games_data_path / username / f"{year}_{month}")
+            user_state['watermark'] = max(user_state['watermark'] or 0, max(game['end_time'] for game in new_games))
+            manifest.record(partition_key('chesscom', username, f"{year}_{month}"), path, user_state['watermark'])
+            print(f"Data saved for {username} {year}-{month}")
+        
+        # Other players save the shared state at any time, so the validators are only
+        # set once the games are written, or a 304 would skip them on the next run
+        user_state['archives'][archive_url] = validators
+        # Saved after every archive so an interrupted run does not re-extract finished months
+        save_state(state)
+
+async def main():
+    
+    # Players share the client's rate limit and the opponent cache, so an
+    # opponent met by several of them is fetched once
+    client = AsyncChesscomClient(CONCURRENCY, RATE)
+    await asyncio.gather(*[update_player(client, username) for username in CHESSCOM_USERS])
+    print(f"Made {client.requests_made} requests for {len(CHESSCOM_USERS)} players.")
+
+asyncio.run(main())
+
+save_state(state)
+
+metrics.write_summary(opponent_cache=opponent_cache.stats())
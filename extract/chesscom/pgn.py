@@ -0,0 +1,71 @@
+import re
+import polars as pl
+
+TAG_RE = re.compile(r'^\[(\w+) "(.*)"\]$', re.M)
+# A SAN move (always starts with a letter, unlike move numbers and results)
+# followed by an optional comment holding its clock time
+MOVE_RE = re.compile(r'([A-Za-z][^\s{}]*)(?:\s*\{[^}]*?(?:\[%clk ([^\]]+)\][^}]*)?\})?')
+
+# Tags extracted by the vectorized parser
+TAGS = ['Date', 'ECO', 'ECOUrl', 'StartTime', 'EndDate', 'EndTime']
+
+
+def parse_pgn(pgn: str) -> tuple:
+    """Parses a chess.com PGN into its tags, moves and clock times in one pass.
+
+    Args:
+        pgn (str): PGN of a single game as returned by the chess.com API.
+
+    Returns:
+        tuple: dict of tag name to value, list of SAN moves and list of clock
+        times (e.g. '0:09:58.5') aligned with the moves, '' where a move has
+        no clock comment, as BigQuery takes no null elements in repeated columns.
+    """
+
+    header, _, movetext = pgn.partition('\n\n')
+    tags = dict(TAG_RE.findall(header))
+
+    matches = MOVE_RE.findall(movetext)
+    moves = [move for move, _ in matches]
+    clocks = [clock for _, clock in matches]
+
+    return tags, moves, clocks
+
+
+def parse_pgn_column(df: pl.DataFrame, column: str = 'pgn') -> pl.DataFrame:
+    """Vectorized parse_pgn over a column of PGNs, e.g. a whole month of games.
+
+    Args:
+        df (pl.DataFrame): DataFrame with a column of chess.com PGNs.
+        column (str, optional): name of the PGN column. Defaults to 'pgn'.
+
+    Returns:
+        pl.DataFrame: the input with one column per tag in TAGS, plus `moves`
+        and `move_times` list columns.
+    """
+
+    movetext = pl.col(column).str.replace(r'(?s)^.*?\n\n', '')
+
+    df = df.with_columns(
+        [pl.col(column).str.extract(rf'\[{tag} "([^"]*)"\]', 1).alias(tag) for tag in TAGS]
+    ).with_columns(
+        movetext.str.replace_all(r'\{[^}]*\}', '').str.extract_all(r'[A-Za-z][^\s]*').alias('moves'),
+        movetext.str.extract_all(r'%clk [^\]]+').list.eval(pl.element().str.slice(5)).alias('move_times')
+    )
+
+    # Games where some moves have no clock are parsed again move by move, so the
+    # times get '' for those moves like in parse_pgn and stay aligned with them
+    unclocked = (df['moves'].list.lengths() != df['move_times'].list.lengths()).fill_null(False)
+    if not unclocked.any():
+        return df
+
+    # Every move is replaced by its clock time, empty without one, and a '|'
+    clocks = movetext.str.replace_all(MOVE_RE.pattern, '${2}|').str.extract_all(r'[^\s|]*\|').list.eval(
+        pl.element().str.strip_chars_end('|')
+    )
+    df = df.with_row_count('_row')
+
+    return pl.concat([
+        df.filter(~unclocked),
+        df.filter(unclocked).with_columns(clocks.alias('move_times'))
+    ]).sort('_row').drop('_row')
@@ -1,18 +1,34 @@
-from utils import extract_monthly_data
+from async_fetch import extract_months
+from utils import append_games, opponent_cache, game_index, metrics
+from extract.roster import get_usernames
+from extract.manifest import Manifest, partition_key
 from datetime import datetime
 from pathlib import Path
+import asyncio
 import os
 
 games_data_path = Path.cwd() / 'games_data' / 'chesscom'
-CHESSCOM_USER = os.getenv('CHESSCOM_USER')
+CHESSCOM_USERS = get_usernames('chesscom')
+CONCURRENCY = int(os.getenv('CHESSCOM_CONCURRENCY', 4))
+RATE = float(os.getenv('CHESSCOM_RATE', 8.0))
+manifest = Manifest()
+game_index.sync('chesscom')
 
 # Get Year and Month for Extract
 year = datetime.now().year
 # Get Last month's data on 1st of the current month
 month = datetime.now().month - 1 
 
-print(f"Extracting data for {year}-{month}")
-monthly_data = extract_monthly_data(year, month, CHESSCOM_USER)
-print(f"Saving data for {year}-{month}")
-monthly_data.write_ndjson(games_data_path / f"{year}_{str(month).zfill(2)}.ndjson")
-print(f"Data saved for {year}-{month}")
\ No newline at end of file
+async def main():
+    
+    # Every player's month is extracted concurrently under one rate limit, see async_fetch.py
+    print(f"Extracting data for {len(CHESSCOM_USERS)} players {year}-{month}")
+    async for username, _, _, monthly_data, watermark in extract_months([(year, month)], CHESSCOM_USERS, concurrency=CONCURRENCY, rate=RATE):
+        print(f"Saving data for {username} {year}-{month}")
+        path = append_games(monthly_data, games_data_path / username / f"{year}_{str(month).zfill(2)}")
+        manifest.record(partition_key('chesscom', username, f"{year}_{str(month).zfill(2)}"), path, watermark)
+        print(f"Data saved for {username} {year}-{month}")
+
+asyncio.run(main())
+
+metrics.write_summary(opponent_cache=opponent_cache.stats())
@@ -1,33 +1,184 @@
 import polars as pl
-import requests
-from polars.exceptions import SchemaError
 from datetime import datetime
+from pathlib import Path
+import sys
+import os
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from extract.opponent_cache import OpponentCache, PROFILE_TTL, COUNTRY_TTL
+from extract.clocks import add_clock_columns, CLOCK_TYPE
+from extract.move_store import MoveStore
+from extract.game_index import GameIndex
+from extract.openings import add_opening_columns
+from extract.metrics import metrics
+from extract.http_client import http_client
+from pgn import parse_pgn
 
 headers = {'User-Agent': 'Mozilla/5.0'}
+chesscom_url = os.getenv('CHESSCOM_API_URL', 'https://api.chess.com')
+
+cache_path = os.getenv('OPPONENT_CACHE_PATH', Path.cwd() / 'games_data' / 'opponent_cache.sqlite')
+opponent_cache = OpponentCache(cache_path)
+
+# Column types of the extracted data, shared by every batch
+SCHEMA = {
+    'game_id': pl.Utf8,
+    'url': pl.Utf8,
+    'time_class': pl.Utf8,
+    'time_control': pl.Utf8,
+    'is_rated': pl.Boolean,
+    'white_rating': pl.Utf8,
+    'black_rating': pl.Utf8,
+    'white_accuracy': pl.Utf8,
+    'black_accuracy': pl.Utf8,
+    'white_result': pl.Utf8,
+    'black_result': pl.Utf8,
+    'username': pl.Utf8,
+    'colour': pl.Utf8,
+    'opponent_id': pl.Utf8,
+    'opponent_username': pl.Utf8,
+    'opponent_country': pl.Utf8,
+    'opponent_is_verified': pl.Boolean,
+    'opponent_status': pl.Utf8,
+    'start_datetime': pl.Utf8,
+    'end_datetime': pl.Utf8,
+    'opening_code': pl.Utf8,
+    'opening_url': pl.Utf8,
+    'opening_name': pl.Utf8,
+    'total_moves': pl.Utf8,
+    'moves': pl.List(pl.Utf8),
+    'move_times': pl.List(pl.Utf8),
+    'clock_ms': CLOCK_TYPE,
+    'time_spent_ms': CLOCK_TYPE
+}
+
+# Native column types used for Parquet output in place of the Utf8 ones above
+NATIVE_TYPES = {
+    'white_rating': pl.Int64,
+    'black_rating': pl.Int64,
+    'white_accuracy': pl.Float64,
+    'black_accuracy': pl.Float64,
+    'opponent_id': pl.Int64,
+    'total_moves': pl.Int64
+}
+
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'ndjson')
+
+# Written games are also added to the binary move store when a path is set
+move_store_path = os.getenv('MOVE_STORE_PATH')
+move_store = MoveStore(Path(move_store_path) / 'chesscom') if move_store_path else None
+
+# Games already in the local store are dropped before parsing, see game_index.py.
+# The SQLite file is only opened once a script uses the index
+game_index = GameIndex()
+
+def endpoint_name(url: str) -> str:
+    """Names the chess.com endpoint of a url for the HTTP metrics."""
+    
+    if url.endswith('/games/archives'):
+        return 'chesscom_archives'
+    if '/games/' in url:
+        return 'chesscom_monthly_archive'
+    if '/pub/country/' in url:
+        return 'chesscom_country'
+    
+    return 'chesscom_player'
 
 def get_archives(username: str) -> dict:
     
-    base_url = "https://api.chess.com/pub/player"
+    base_url = f"{chesscom_url}/pub/player"
     url = f"{base_url}/{username}/games/archives"
-    response = requests.get(url, headers=headers).json()
+    response = http_client.get(url, 'chesscom_archives', headers=headers)
+    response.raise_for_status()
     
-    return response
+    return response.json()
 
 def get_monthly_archive(year: int, month: int, username: str) -> dict:
     
     year = str(year)
     month = str(month).zfill(2)
     
-    base_url = f"https://api.chess.com/pub/player/{username}/games/"
+    base_url = f"{chesscom_url}/pub/player/{username}/games/"
     url = f"{base_url}{year}/{month}"
-    response = requests.get(url, headers=headers).json()
     
-    return response
+    with metrics.timer('fetch_archive'):
+        response = http_client.get(url, 'chesscom_monthly_archive', headers=headers)
+    response.raise_for_status()
+    
+    return response.json()
+
+def conditional_headers(validators: dict) -> dict:
+    """Returns the headers of a conditional request from an archive's previous validators."""
+    
+    request_headers = dict(headers)
+    if validators.get('etag'):
+        request_headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        request_headers['If-Modified-Since'] = validators['last_modified']
+    
+    return request_headers
+
+def response_validators(response) -> dict:
+    """Returns the validators of an archive response, to be sent with the next request."""
+    
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
+    }
+
+def get_archive_if_modified(url: str, validators: dict) -> tuple:
+    """Fetches a monthly archive with a conditional request.
+
+    Args:
+        url (str): archive url as listed by get_archives.
+        validators (dict): 'etag' and 'last_modified' from the previous fetch, may be empty.
 
-def extract_game_data(game: dict) -> pl.DataFrame:
+    Returns:
+        tuple: the archive, or None if it has not changed (304), and the new validators.
+    """
+    
+    with metrics.timer('fetch_archive'):
+        response = http_client.get(url, 'chesscom_monthly_archive', headers=conditional_headers(validators))
+    
+    if response.status_code == 304:
+        return None, validators
+    
+    response.raise_for_status()
+    
+    return response.json(), response_validators(response)
+
+def get_cached(url: str, ttl: float) -> dict:
+    """Returns the JSON response for a url, from the opponent cache if possible.
+    
+    A url that does not exist, e.g. the profile of a closed account, is cached
+    as an empty dict so it is not requested again.
+    """
+    
+    data = opponent_cache.get(url)
+    
+    if data is None:
+        response = http_client.get(url, endpoint_name(url), headers=headers)
+        if response.status_code == 404:
+            data = {}
+        else:
+            response.raise_for_status()
+            data = response.json()
+        opponent_cache.set(url, data, ttl)
+    
+    return data
+
+def get_opponent(game: dict, username: str) -> tuple:
+    """Returns the player's colour and the opponent's profile API link for a game."""
+    
+    if game['white']['username'].lower() == username.lower():
+        return 'white', game['black']['@id']
+    
+    return 'black', game['white']['@id']
+
+def extract_game_data(game: dict, username: str) -> dict:
     
     url = game['url']
-    print('Extracting data from:', url)
     game_id = game['uuid']
     time_class = game['time_class'] # rapid, blitz, bullet
     time_control = game['time_control'] # in seconds
@@ -44,33 +195,26 @@ def extract_game_data(game: dict) -> pl.DataFrame:
         white_accuracy = None
         black_accuracy = None
 
-    if game['white']['username'] == 'zainsiddiqii':
-        colour = 'white'
-        opponent_api_link = game['black']['@id']
-
-    else:
-        colour = 'black'
-        opponent_api_link = game['white']['@id']
+    colour, opponent_api_link = get_opponent(game, username)
 
-    opponent_data = requests.get(opponent_api_link, headers=headers).json()
-    opponent_username = opponent_data['username']
-    opponent_country = requests.get(opponent_data['country'], headers=headers).json()['name']
-    opponent_is_verified = opponent_data['verified']
-    opponent_status = opponent_data['status']
-    opponent_id = opponent_data['player_id']
-    
-    pgn_data = game['pgn'].split('\n')
+    with metrics.timer('opponent_enrichment'):
+        # A missing profile, e.g. of a closed account, leaves the opponent's fields null
+        opponent_data = get_cached(opponent_api_link, PROFILE_TTL)
+        if 'country' in opponent_data:
+            opponent_country = get_cached(opponent_data['country'], COUNTRY_TTL).get('name')
+        else:
+            opponent_country = None
+    opponent_username = opponent_data.get('username', game['black' if colour == 'white' else 'white']['username'])
+    opponent_is_verified = opponent_data.get('verified')
+    opponent_status = opponent_data.get('status')
+    opponent_id = opponent_data.get('player_id')
     
-    start_date = pgn_data[2].strip('[]').split(' ')[1].strip('"')
-    start_time = pgn_data[17].strip('[]').split(' ')[1].strip('"')
-    end_date = pgn_data[18].strip('[]').split(' ')[1].strip('"')
-    try:
-        end_time = pgn_data[19].strip('[]').split(' ')[1].strip('"')
-    except IndexError:
-        end_time = None
-        print('Game was not started. Skipping...')
+    with metrics.timer('pgn_parse'):
+        tags, moves, move_times = parse_pgn(game['pgn'])
+    end_time = tags.get('EndTime')
     
     if end_time is None:
+        metrics.count('games_not_started')
         start_datetime = None
         end_datetime = None
         opening_code = None
@@ -80,25 +224,13 @@ def extract_game_data(game: dict) -> pl.DataFrame:
         moves = None
         total_moves = None
     else:
-        start_datetime = start_date.replace('.', '-') + ' ' + start_time
-        end_datetime = end_date.replace('.', '-') + ' ' + end_time
-        opening_code = pgn_data[9].strip('[]').split(' ')[1].strip('"')
-        opening_url = pgn_data[10].strip('[]').split(' ')[1].strip('"')
-        opening_name = pgn_data[10].strip('[]').split(' ')[1].strip('"').split('/')[-1].replace('-', ' ')
-        
-        pgn = game['pgn'].split('\n')[-2]
-        pgn = pgn.split('}')
-        moves = [moves.split('{')[0].strip() for moves in pgn]
-        move_times = [moves.split('{')[-1] for moves in pgn]
-        move_times = [move_times.split(' ')[-1].strip(']') for move_times in move_times]
-
-        moves_list = [move.split(' ')[-1] for move in moves]
-        move_times_list = [move.split(' ')[-1] for move in move_times]
-
-        move_times = ','.join(move_times_list[:-1])
-        moves = ','.join(moves_list[:-1])
-
-        total_moves = len(moves_list) // 2
+        start_datetime = tags['Date'].replace('.', '-') + ' ' + tags['StartTime']
+        end_datetime = tags['EndDate'].replace('.', '-') + ' ' + end_time
+        # Reclassified from the moves in build_dataframe, kept for games the ECO table misses
+        opening_code = tags.get('ECO')
+        opening_url = tags.get('ECOUrl')
+        opening_name = opening_url.split('/')[-1].replace('-', ' ') if opening_url else None
+        total_moves = (len(moves) + 1) // 2
 
     row = {
         'game_id': game_id,
@@ -112,6 +244,7 @@ def extract_game_data(game: dict) -> pl.DataFrame:
         'black_accuracy': black_accuracy,
         'white_result': white_result,
         'black_result': black_result,
+        'username': username.lower(),
         'colour': colour,
         'opponent_id': opponent_id,
         'opponent_username': opponent_username,
@@ -128,52 +261,135 @@ def extract_game_data(game: dict) -> pl.DataFrame:
         'move_times': move_times
     }
     
-    df = pl.DataFrame(row).with_columns(
-        pl.col('moves').str.split(','),
-        pl.col('move_times').str.split(',')
-    ).select(
-        pl.col('game_id').cast(pl.Utf8),
-        pl.col('url').cast(pl.Utf8),
-        pl.col('time_class').cast(pl.Utf8),
-        pl.col('time_control').cast(pl.Utf8),
-        pl.col('is_rated').cast(pl.Boolean),
-        pl.col('white_rating').cast(pl.Utf8),
-        pl.col('black_rating').cast(pl.Utf8),
-        pl.col('white_accuracy').cast(pl.Utf8),
-        pl.col('black_accuracy').cast(pl.Utf8),
-        pl.col('white_result').cast(pl.Utf8),
-        pl.col('black_result').cast(pl.Utf8),
-        pl.col('colour').cast(pl.Utf8),
-        pl.col('opponent_id').cast(pl.Utf8),
-        pl.col('opponent_username').cast(pl.Utf8),
-        pl.col('opponent_country').cast(pl.Utf8),
-        pl.col('opponent_is_verified').cast(pl.Boolean),
-        pl.col('opponent_status').cast(pl.Utf8),
-        pl.col('start_datetime').cast(pl.Utf8),
-        pl.col('end_datetime').cast(pl.Utf8),
-        pl.col('opening_code').cast(pl.Utf8),
-        pl.col('opening_url').cast(pl.Utf8),
-        pl.col('opening_name').cast(pl.Utf8),
-        pl.col('total_moves').cast(pl.Utf8),
-        pl.col('moves').cast(pl.List(pl.Utf8)),
-        pl.col('move_times').cast(pl.List(pl.Utf8)),
-        pl.lit(datetime.now()).alias("_extracted_at")
-    )
+    return row
+
+def build_dataframe(rows: list) -> pl.DataFrame:
+    """Builds one typed DataFrame from a batch of rows returned by extract_game_data."""
+    
+    if not rows:
+        return pl.DataFrame(schema={**SCHEMA, '_extracted_at': pl.Datetime})
+    
+    with metrics.timer('dataframe_build'):
+        df = pl.DataFrame(rows, infer_schema_length=None).pipe(
+            add_clock_columns, 'move_times', 'clk'
+        ).pipe(
+            add_opening_columns
+        ).select(
+            [pl.col(name).cast(dtype) for name, dtype in SCHEMA.items()]
+        ).with_columns(
+            pl.lit(datetime.now()).alias("_extracted_at")
+        )
     
     return df
 
-def extract_monthly_data(year: int, month: int, username: str) -> pl.DataFrame:
+def write_games(df: pl.DataFrame, path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+    """Writes a month of games as NDJSON or as typed, zstd compressed Parquet.
+
+    Args:
+        df (pl.DataFrame): DataFrame from build_dataframe.
+        path (Path): output path, its suffix is set from the output format.
+        output_format (str, optional): 'ndjson' or 'parquet'. Defaults to OUTPUT_FORMAT.
+
+    Returns:
+        Path: the path written to.
+    """
     
-    monthly_data = get_monthly_archive(year, month, username=username)
-    games = monthly_data['games']
+    if move_store is not None:
+        move_store.append_games(df)
+    
+    # Partitioned by user, games_data/chesscom/<username>/<YYYY_MM>
+    path.parent.mkdir(parents=True, exist_ok=True)
+    
+    with metrics.timer('write'):
+        if output_format == 'parquet':
+            path = path.with_suffix('.parquet')
+            df.with_columns(
+                [pl.col(name).cast(dtype) for name, dtype in NATIVE_TYPES.items()]
+            ).write_parquet(path, compression='zstd')
+        else:
+            path = path.with_suffix('.ndjson')
+            df.write_ndjson(path)
+    
+    game_index.remove_file(path)
+    if df.height:
+        game_index.add('chesscom', df['username'][0], df['game_id'], path)
+    
+    metrics.count('games_written', df.height)
+    
+    return path
+
+def append_games(df: pl.DataFrame, path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+    """Appends games to a month's file, creating it if it does not exist yet.
+
+    Args:
+        df (pl.DataFrame): DataFrame from build_dataframe.
+        path (Path): output path, its suffix is set from the output format.
+        output_format (str, optional): 'ndjson' or 'parquet'. Defaults to OUTPUT_FORMAT.
+
+    Returns:
+        Path: the path written to.
+    """
     
-    df = pl.DataFrame({})
+    path = path.with_suffix(f'.{output_format}')
+    
+    # write_games adds the moves of a new file to the move store
+    if not path.exists():
+        return write_games(df, path, output_format)
+    
+    # Nothing new, e.g. every game of the month was already stored
+    if df.is_empty():
+        return path
+    
+    if move_store is not None:
+        move_store.append_games(df)
+    
+    with metrics.timer('write'):
+        if output_format == 'parquet':
+            existing = pl.read_parquet(path)
+            df = df.with_columns(
+                [pl.col(name).cast(dtype) for name, dtype in NATIVE_TYPES.items()]
+            )
+            pl.concat([existing, df], how='vertical_relaxed').write_parquet(path, compression='zstd')
+        else:
+            with open(path, 'a') as f:
+                f.write(df.write_ndjson())
+    
+    game_index.add('chesscom', df['username'][0], df['game_id'], path)
+    
+    metrics.count('games_written', df.height)
+    
+    return path
+
+def extract_games(games: list, username: str) -> pl.DataFrame:
+    """Parses a list of games from a player's monthly archive into one DataFrame."""
+    
+    rows = []
     
     for game in games:
-        try:
-            game_df = extract_game_data(game)
-            df = df.vstack(game_df)
-        except SchemaError:
+        row = extract_game_data(game, username)
+        # Games that were never started have no moves and are skipped
+        if row['moves'] is None:
             continue
+        rows.append(row)
+    
+    metrics.count('games_extracted', len(rows))
+    
+    return build_dataframe(rows)
+
+def archive_watermark(games: list):
+    """Returns the newest end_time of an archive's games, as epoch seconds, or None if it is empty."""
+    
+    return max((game['end_time'] for game in games), default=None)
+
+def extract_monthly_data(year: int, month: int, username: str) -> tuple:
+    """Extracts the games of a player's month that are not stored locally yet.
+    
+    Returns:
+        tuple: DataFrame of the new games and the archive's watermark, see archive_watermark.
+    """
+    
+    monthly_data = get_monthly_archive(year, month, username=username)
+    # Stored games are dropped before their opponents are looked up
+    games = game_index.new_games('chesscom', username, monthly_data['games'], 'uuid')
     
-    return df
\ No newline at end of file
+    return extract_games(games, username), archive_watermark(monthly_data['games'])
@@ -0,0 +1,110 @@
+import polars as pl
+
+CLOCK_TYPE = pl.List(pl.Int32)
+
+
+def clock_string_to_ms(clock: pl.Expr) -> pl.Expr:
+    """Converts chess.com clock strings ('H:MM:SS.s', 'M:SS' or 'S') into milliseconds."""
+
+    parts = clock.str.split(':')
+    seconds = parts.list.last().cast(pl.Float64, strict=False)
+    minutes = parts.list.get(-2).cast(pl.Float64, strict=False).fill_null(0)
+    hours = parts.list.get(-3).cast(pl.Float64, strict=False).fill_null(0)
+
+    return ((hours * 3600 + minutes * 60 + seconds) * 1000).round(0)
+
+
+def ms_to_hhmmss(ms: pl.Expr) -> pl.Expr:
+    """Formats milliseconds as 'hh:mm:ss', truncating fractions of a second."""
+
+    seconds = ms // 1000
+
+    return pl.format(
+        '{}:{}:{}',
+        (seconds // 3600).cast(pl.Utf8).str.zfill(2),
+        (seconds % 3600 // 60).cast(pl.Utf8).str.zfill(2),
+        (seconds % 60).cast(pl.Utf8).str.zfill(2)
+    )
+
+
+def add_clock_columns(df: pl.DataFrame, clock_column: str, unit: str, time_control_column: str = 'time_control') -> pl.DataFrame:
+    """Decodes a batch of per-ply clocks into numeric list columns.
+
+    Every clock of the batch is decoded in one exploded column, so the cost
+    does not depend on Python per-move work. Adds:
+        clock_ms: remaining time after each ply, in milliseconds.
+        time_spent_ms: time used on each ply, in milliseconds. The previous
+        clock of the same player (or the initial time) minus the clock after
+        the ply, plus the increment from `time_control` ('600', '600+5').
+        move_times: for centisecond clocks only, the remaining time as
+        'hh:mm:ss' strings.
+    Every list has one element per ply. A ply without a clock is null in
+    both numeric lists ('' in move_times), and so is the time spent on the
+    same player's next ply.
+
+    Args:
+        df (pl.DataFrame): batch of games with a list column of clocks.
+        clock_column (str): name of the list column holding the clocks.
+        unit (str): 'centiseconds' for lichess clocks or 'clk' for chess.com
+        '[%clk ...]' strings.
+        time_control_column (str, optional): column holding the time control.
+        Defaults to 'time_control'.
+
+    Returns:
+        pl.DataFrame: the input with the three columns added, null for games
+        without clocks.
+    """
+
+    time_control = pl.col(time_control_column).cast(pl.Utf8).str.split('+')
+    # Daily games ('1/86400') get a fixed time per move and no increment
+    initial_ms = time_control.list.first().str.split('/').list.last().cast(pl.Int64, strict=False) * 1000
+    increment_ms = time_control.list.get(1).cast(pl.Int64, strict=False).fill_null(0) * 1000
+
+    if unit == 'centiseconds':
+        clock_ms = pl.col(clock_column).cast(pl.Int64) * 10
+        columns = ['clock_ms', 'time_spent_ms', 'move_times']
+    else:
+        clock_ms = clock_string_to_ms(pl.col(clock_column))
+        columns = ['clock_ms', 'time_spent_ms']
+
+    plies = df.select(
+        pl.col(clock_column),
+        initial_ms.alias('_initial_ms'),
+        increment_ms.alias('_increment_ms')
+    ).with_row_count(
+        '_row'
+    ).filter(
+        pl.col(clock_column).list.lengths() > 0
+    ).explode(
+        clock_column
+    ).with_columns(
+        clock_ms.cast(pl.Int64).alias('clock_ms'),
+        pl.int_range(0, pl.count()).over('_row').alias('_ply')
+    ).with_columns(
+        # A missing clock stays null at its ply, so both lists line up with the moves,
+        # and the next clock of the same player has no time spent either
+        (
+            pl.when(pl.col('_ply') < 2).then(pl.col('_initial_ms')).otherwise(pl.col('clock_ms').shift(2).over('_row'))
+            - pl.col('clock_ms')
+            + pl.col('_increment_ms')
+        ).alias('time_spent_ms')
+    ).group_by(
+        '_row', maintain_order=True
+    ).agg(
+        pl.col('clock_ms').cast(pl.Int32),
+        pl.col('time_spent_ms').cast(pl.Int32),
+        # REPEATED STRING columns take no null elements, a missing clock is ''
+        ms_to_hhmmss(pl.col('clock_ms')).fill_null('').alias('move_times')
+    ).select(
+        ['_row'] + columns
+    )
+
+    return df.drop(
+        [column for column in columns if column in df.columns]
+    ).with_row_count(
+        '_row'
+    ).join(
+        plies, on='_row', how='left'
+    ).drop(
+        '_row'
+    )
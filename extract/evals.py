@@ -0,0 +1,52 @@
+import polars as pl
+
+EVAL_TYPE = pl.List(pl.Int16)
+JUDGMENT_TYPE = pl.List(pl.Int8)
+
+# Evaluations are stored in centipawns from white's point of view. Mate in n
+# moves is stored as +/-(MATE_SCORE - n), so sorting and comparing evaluations
+# still works, and centipawns are clamped to MAX_CENTIPAWNS to stay apart.
+MATE_SCORE = 32000
+MAX_CENTIPAWNS = 30000
+# A ply in the analysis without an evaluation
+MISSING_EVAL = -32768
+
+# Judgment of each ply, 0 when the move was not judged
+JUDGMENTS = {'Inaccuracy': 1, 'Mistake': 2, 'Blunder': 3}
+
+
+def encode_analysis(analysis: list) -> tuple:
+    """Encodes a lichess per-ply analysis into evaluation and judgment lists.
+
+    The lists are cast to EVAL_TYPE and JUDGMENT_TYPE when the batch is built.
+    Reading the few keys of each ply here is cheaper than building the
+    analysis structs in polars, which also carry the engine's variations.
+
+    Args:
+        analysis (list): the `analysis` of a game from the lichess API, e.g.
+        [{'eval': 18}, {'mate': -3, 'judgment': {'name': 'Blunder', ...}}], or None.
+
+    Returns:
+        tuple: evaluations (see MATE_SCORE and MISSING_EVAL) and judgments
+        (see JUDGMENTS) of each ply, both None for games without analysis.
+    """
+
+    if not analysis:
+        return None, None
+
+    evals = []
+    judgments = []
+
+    for ply in analysis:
+        if 'mate' in ply:
+            mate = ply['mate']
+            evals.append(MATE_SCORE - mate if mate > 0 else -MATE_SCORE - mate)
+        elif 'eval' in ply:
+            evals.append(max(-MAX_CENTIPAWNS, min(MAX_CENTIPAWNS, ply['eval'])))
+        else:
+            evals.append(MISSING_EVAL)
+
+        judgment = ply.get('judgment')
+        judgments.append(JUDGMENTS.get(judgment['name'], 0) if judgment else 0)
+
+    return evals, judgments
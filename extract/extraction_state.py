@@ -0,0 +1,41 @@
+import json
+import os
+from pathlib import Path
+
+state_path = Path(os.getenv('EXTRACTION_STATE_PATH', Path.cwd() / 'games_data' / 'extraction_state.json'))
+
+
+def load_state(path: Path = state_path) -> dict:
+    """Loads the extraction state, or an empty state if none was saved yet.
+
+    The state maps '<platform>:<username>' to a dict with the newest game
+    timestamp seen (`watermark`) and, for chess.com, the ETag/Last-Modified
+    validators of each monthly archive (`archives`).
+    """
+
+    path = Path(path)
+
+    if not path.exists():
+        return dict()
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state: dict, path: Path = state_path):
+    """Saves the extraction state, replacing the previous file atomically."""
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+
+    os.replace(tmp_path, path)
+
+
+def get_user_state(state: dict, platform: str, username: str) -> dict:
+    """Returns the mutable state entry of a user, creating it if needed."""
+
+    return state.setdefault(f'{platform}:{username}', {'watermark': None, 'archives': {}})
@@ -0,0 +1,195 @@
+import os
+import sqlite3
+from pathlib import Path
+
+from extract.manifest import read_game_ids
+from extract.metrics import metrics
+from extract.store import list_partitions, store_path
+
+game_index_path = Path(os.getenv('GAME_INDEX_PATH', Path.cwd() / 'games_data' / 'game_index.sqlite'))
+
+
+class GameIndex:
+    """On-disk set of the games already in the local store, per platform and player.
+
+    The set is a SQLite table clustered on (platform, username, game_id), so
+    a player's games are read back with one index range scan and kept in
+    memory for the rest of the run. Every indexed file is recorded with its
+    size and mtime, and `sync` re-reads the files that changed since, e.g.
+    one appended to by a run that stopped before indexing it.
+
+    The index can always be rebuilt from the files, see `rebuild`.
+    """
+
+    def __init__(self, path: Path = game_index_path):
+        """
+        Args:
+            path (Path, optional): location of the SQLite file, created on first use.
+            Defaults to GAME_INDEX_PATH or games_data/game_index.sqlite.
+        """
+
+        self.path = Path(path)
+        self.known = dict()
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection to the SQLite file, created on first use."""
+
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Archives are parsed in worker threads, see async_fetch.py
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS games (
+                    platform TEXT NOT NULL,
+                    username TEXT NOT NULL,
+                    game_id TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    PRIMARY KEY (platform, username, game_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    platform TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL
+                );
+                """
+            )
+
+        return self._conn
+
+    def game_ids(self, platform: str, username: str) -> set:
+        """Returns the stored game_ids of a player, read from disk on first use."""
+
+        key = (platform, username)
+
+        if key not in self.known:
+            self.known[key] = {
+                row[0] for row in self.conn.execute(
+                    'SELECT game_id FROM games WHERE platform = ? AND username = ?', (platform, username)
+                )
+            }
+
+        return self.known[key]
+
+    def new_games(self, platform: str, username: str, games: list, id_key: str) -> list:
+        """Drops the games of an API response that are already stored.
+
+        Args:
+            platform (str): 'chesscom' or 'lichess'.
+            username (str): player the games were extracted for.
+            games (list): games from the API.
+            id_key (str): key of the game's id in the API response, 'uuid' or 'id'.
+
+        Returns:
+            list: games not in the index, in their original order.
+        """
+
+        stored = self.game_ids(platform, username)
+        games = list(games)
+        new = [game for game in games if game[id_key] not in stored]
+
+        metrics.count('games_already_stored', len(games) - len(new))
+
+        return new
+
+    def add(self, platform: str, username: str, game_ids, path: Path):
+        """Adds games just written to a file, and records the file as indexed."""
+
+        path = Path(path)
+        game_ids = list(game_ids)
+        # Empty files are left out of the store's partitions, see store.list_partitions
+        if not game_ids:
+            return
+
+        stat = path.stat()
+
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO games (platform, username, game_id, path) VALUES (?, ?, ?, ?)',
+                [(platform, username, game_id, str(path)) for game_id in game_ids]
+            )
+            self.conn.execute(
+                'INSERT OR REPLACE INTO files (path, platform, size, mtime) VALUES (?, ?, ?, ?)',
+                (str(path), platform, stat.st_size, stat.st_mtime)
+            )
+
+        self.game_ids(platform, username).update(game_ids)
+
+    def remove_file(self, path: Path):
+        """Removes the games of a file, e.g. before it is overwritten."""
+
+        for platform, username, game_id in self.conn.execute(
+            'SELECT platform, username, game_id FROM games WHERE path = ?', (str(path),)
+        ).fetchall():
+            self.known.get((platform, username), set()).discard(game_id)
+
+        with self.conn:
+            self.conn.execute('DELETE FROM games WHERE path = ?', (str(path),))
+            self.conn.execute('DELETE FROM files WHERE path = ?', (str(path),))
+
+    def sync(self, platform: str, root: Path = store_path) -> int:
+        """Brings the index of a platform in line with the files of the store.
+
+        Files that are new or whose size or mtime changed are indexed again,
+        and the games of files that no longer exist are removed.
+
+        Returns:
+            int: number of files indexed.
+        """
+
+        indexed_files = {
+            row[0]: (row[1], row[2]) for row in self.conn.execute(
+                'SELECT path, size, mtime FROM files WHERE platform = ?', (platform,)
+            )
+        }
+        partitions = list_partitions(root, platforms=[platform])
+        indexed = 0
+
+        for partition in partitions:
+            path = partition['path']
+            stat = path.stat()
+            if indexed_files.get(str(path)) == (stat.st_size, stat.st_mtime):
+                continue
+
+            self.remove_file(path)
+            self.add(platform, partition['username'], read_game_ids(path), path)
+            indexed += 1
+
+        for path in set(indexed_files) - {str(partition['path']) for partition in partitions}:
+            self.remove_file(path)
+
+        return indexed
+
+    def rebuild(self, root: Path = store_path) -> int:
+        """Clears the index and indexes every file of the store again.
+
+        Returns:
+            int: number of games indexed.
+        """
+
+        with self.conn:
+            self.conn.execute('DELETE FROM games')
+            self.conn.execute('DELETE FROM files')
+        self.known.clear()
+
+        for partition in list_partitions(root):
+            self.add(partition['platform'], partition['username'], read_game_ids(partition['path']), partition['path'])
+
+        return self.conn.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+    def close(self):
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# Run from the repository root: python -m extract.game_index
+if __name__ == '__main__':
+
+    index = GameIndex()
+    print(f"Indexed {index.rebuild()} games from {store_path}")
@@ -0,0 +1,184 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from extract.metrics import metrics
+
+# Both APIs answer 429 when a client goes too fast, the 5xx are transient
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 6))
+BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 1.0))
+MAX_BACKOFF = float(os.getenv('HTTP_MAX_BACKOFF', 120.0))
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10.0))
+# Between two bytes of a response, not for the whole response
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 60.0))
+
+# Requests in flight and pooled keep-alive connections per host
+MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', 4))
+# Set to 0 to ask for uncompressed responses, e.g. to compare transfer times
+GZIP = os.getenv('HTTP_GZIP', '1') != '0'
+
+
+def retry_delay(response, attempt: int) -> float:
+    """Returns how long to wait before retrying a request.
+
+    The Retry-After header is honoured when the response has one, in seconds or
+    as an HTTP date, otherwise the delay doubles with every attempt (with jitter
+    so concurrent requests do not retry in lockstep).
+
+    Args:
+        response: the failed response, or None if the request got no response.
+        attempt (int): number of attempts made so far, from 0.
+
+    Returns:
+        float: delay in seconds.
+    """
+
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+
+    return min(MAX_BACKOFF, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class HttpClient:
+    """Pooled, retrying HTTP client shared by the chess.com and lichess extractors.
+
+    Connections are kept alive in one requests session, requests to a host are
+    capped at `max_per_host` in flight across threads, and 429s, 5xx and
+    network errors are retried with backoff. A streamed response keeps its
+    slot until it is closed, so it has to be closed, e.g. with a `with` block. Every attempt is recorded in the
+    run's metrics under the endpoint name given by the caller.
+    """
+
+    def __init__(self, max_per_host: int = MAX_PER_HOST, max_retries: int = MAX_RETRIES,
+                 timeout: tuple = (CONNECT_TIMEOUT, READ_TIMEOUT), gzip: bool = GZIP):
+        """
+        Args:
+            max_per_host (int, optional): requests in flight per host. Defaults to MAX_PER_HOST.
+            max_retries (int, optional): retries after the first attempt. Defaults to MAX_RETRIES.
+            timeout (tuple, optional): connect and read timeouts in seconds. Defaults to
+                (CONNECT_TIMEOUT, READ_TIMEOUT).
+            gzip (bool, optional): ask for compressed responses. Defaults to GZIP.
+        """
+
+        self.max_per_host = max_per_host
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate' if gzip else 'identity'
+        # Retries are done here rather than by urllib3 so they are visible in the metrics
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max_per_host, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.lock = threading.Lock()
+        self.host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.max_per_host))
+
+    def slot(self, url: str) -> threading.BoundedSemaphore:
+        """Returns the semaphore capping the requests in flight to a url's host."""
+
+        with self.lock:
+            return self.host_slots[urlsplit(url).netloc]
+
+    def request(self, method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+        """Sends a request, retrying on 429, 5xx, timeouts and connection errors.
+
+        Args:
+            method (str): HTTP method, e.g. 'GET'.
+            url (str): url to request.
+            endpoint (str): endpoint name the attempts are recorded under in the metrics.
+            **kwargs: passed to requests, e.g. headers, params, data or stream.
+
+        Raises:
+            requests.RequestException: the last network error once retries are exhausted.
+
+        Returns:
+            requests.Response: the response, possibly a retryable error status if
+            retries are exhausted. Callers check the status as they would with requests.
+        """
+
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.send(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.record_request(endpoint, time.perf_counter() - start)
+                if attempt == self.max_retries:
+                    raise
+                error, response = e, None
+            else:
+                metrics.record_request(endpoint, response.elapsed.total_seconds(), response.status_code)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                error = response.status_code
+                response.close()
+
+            delay = retry_delay(response, attempt)
+            metrics.count('http_retries')
+            print(f"{method} {url} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends one attempt within the host's slots.
+
+        A response read in full gives its slot back straight away. A streamed
+        one is still being downloaded, e.g. a long lichess export, so its slot
+        is given back when the response is closed.
+        """
+
+        slot = self.slot(url)
+        slot.acquire()
+
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except BaseException:
+            slot.release()
+            raise
+
+        if not kwargs.get('stream'):
+            slot.release()
+            return response
+
+        close = response.close
+        held = [True]
+
+        def close_and_release():
+            close()
+            with self.lock:
+                release, held[0] = held[0], False
+            if release:
+                slot.release()
+
+        response.close = close_and_release
+
+        return response
+
+    def get(self, url: str, endpoint: str, **kwargs) -> requests.Response:
+
+        return self.request('GET', url, endpoint, **kwargs)
+
+    def post(self, url: str, endpoint: str, **kwargs) -> requests.Response:
+
+        return self.request('POST', url, endpoint, **kwargs)
+
+
+http_client = HttpClient()
@@ -1,11 +1,17 @@
-from utils import get_games, extract_game_data
+from utils import stream_games, group_by_month, append_games, opponent_cache, game_index, metrics
+from parallel import parse_months, make_executor
+from shards import sharded_games
+from extract.roster import get_usernames
+from extract.manifest import Manifest, partition_key
 from pathlib import Path
-import polars as pl
-import os
 from datetime import datetime
+import os
 
 games_data_path = Path.cwd() / 'games_data' / 'lichess'
-LICHESS_USER = os.getenv('LICHESS_USER')
+# LICHESS_USERS=alice,bob extracts several players in one run, see roster.py
+LICHESS_USERS = get_usernames('lichess')
+# 'stream' reads one export of the whole period, 'sharded' exports month windows in parallel, see shards.py
+EXPORT_MODE = os.getenv('LICHESS_EXPORT_MODE', 'stream')
 
 # Create a datetime object for August 31, 2024, at 23:59:59
 until = datetime(2024, 8, 31, 23, 59, 59)
@@ -13,26 +19,55 @@ until = datetime(2024, 8, 31, 23, 59, 59)
 # Convert to timestamp
 until_timestamp = int(until.timestamp() * 1000)
 
-games = get_games(LICHESS_USER, since=None, until=until_timestamp)
-games_store = dict()
+def with_watermarks(months, watermarks: dict):
+    """Passes monthly batches through, noting the newest createdAt of each month."""
+    
+    for year_month, monthly_games in months:
+        watermarks[year_month] = max(game['createdAt'] for game in monthly_games)
+        yield year_month, monthly_games
 
-for game in games:
+def skip_stored(months, username: str):
+    """Drops the games already in the local store from monthly batches, before they are enriched."""
     
-    df = extract_game_data(game)
+    for year_month, monthly_games in months:
+        yield year_month, game_index.new_games('lichess', username, monthly_games, 'id')
+
+# Parse workers are spawned and import this script again, so it only runs as __main__
+if __name__ == '__main__':
     
-    str_date = df['start_datetime'].str.split(' ').list.get(0).item()
-    year_month = f"{str_date.split('-')[0]}_{str_date.split('-')[1]}"
+    manifest = Manifest()
+    executor = make_executor()
+    # Files changed since the last run are indexed again before any game is skipped
+    game_index.sync('lichess')
     
-    if year_month not in games_store:
-        games_store[year_month] = [df]
-    else:
-        games_store[year_month].append(df)
+    # lichess allows one export at a time, so players are exported one after
+    # another while sharing the parse pool, connections and opponent cache
+    for username in LICHESS_USERS:
+        
+        # Every month a backfill recorded is complete, as the export is read in date order
+        # and a month is only written once the next one starts. An interrupted run
+        # resumes after the last game of the last backfilled month that still validates.
+        watermark = manifest.resume_watermark('lichess', username)
+        since = watermark + 1 if watermark is not None else None
+        if since is not None:
+            print(f"Resuming {username} after {datetime.fromtimestamp(watermark / 1000)}")
+        
+        if EXPORT_MODE == 'sharded':
+            games = sharded_games(username, since=since, until=until_timestamp)
+        else:
+            games = stream_games(username, since=since, until=until_timestamp)
+        watermarks = dict()
+        
+        # Games arrive in ascending date order, so each month is complete and can be
+        # parsed as soon as the first game of the next month is read
+        for year_month, df in parse_months(skip_stored(with_watermarks(group_by_month(games), watermarks), username), username, executor):
+            
+            print(f"Saving data for {username} {year_month}")
+            path = append_games(df, games_data_path / username / year_month)
+            manifest.record(partition_key('lichess', username, year_month), path, watermarks.pop(year_month), backfill=True)
+            print(f"Data saved for {username} {year_month}")
     
-    print(f'Extracted and stored data for game {df['game_id'].item()} from {year_month}.')
-
-for year_month, games in games_store.items():
+    if executor is not None:
+        executor.shutdown()
     
-    print(f"Saving data for {year_month}")
-    df = pl.concat(games)
-    df.write_ndjson(games_data_path / f"{year_month}.ndjson")
-    print(f"Data saved for {year_month}")
\ No newline at end of file
+    metrics.write_summary(opponent_cache=opponent_cache.stats())
@@ -0,0 +1,65 @@
+from utils import stream_games, group_by_month, enrich_opponents, extract_game_data, build_dataframe, append_games, opponent_cache, game_index, metrics
+from extract.extraction_state import load_state, save_state, get_user_state
+from extract.roster import get_usernames
+from extract.manifest import Manifest, partition_key
+from pathlib import Path
+
+games_data_path = Path.cwd() / 'games_data' / 'lichess'
+LICHESS_USERS = get_usernames('lichess')
+
+# lichess filters `since` on the creation time of a game, so a long game created
+# before the watermark can finish after it. Games created in this window before
+# the watermark are requested again and dropped if they were already extracted.
+OVERLAP_MS = 6 * 60 * 60 * 1000
+
+state = load_state()
+manifest = Manifest()
+game_index.sync('lichess')
+
+# Players share the opponent cache, so an opponent met by several of them is fetched once
+for username in LICHESS_USERS:
+    
+    user_state = get_user_state(state, 'lichess', username)
+    watermark = user_state['watermark']
+    recent_games = dict(user_state.get('recent_games', {}))
+    
+    since = watermark - OVERLAP_MS if watermark is not None else None
+    
+    print(f"Extracting games of {username} since {since}")
+    
+    games = (
+        game for game in stream_games(username, since=since, until=None)
+        if game['id'] not in recent_games
+    )
+    
+    for year_month, monthly_games in group_by_month(games):
+        
+        monthly_games = game_index.new_games('lichess', username, monthly_games, 'id')
+        if not monthly_games:
+            continue
+        
+        print(f"Extracted {len(monthly_games)} new games from {year_month}.")
+        opponents = enrich_opponents(monthly_games, username)
+        with metrics.timer('game_parse'):
+            rows = [extract_game_data(game, username, opponents) for game in monthly_games]
+        
+        path = append_games(build_dataframe(rows), games_data_path / username / year_month)
+        print(f"Data saved for {username} {year_month}")
+        
+        watermark = max(watermark or 0, max(game['createdAt'] for game in monthly_games))
+        manifest.record(partition_key('lichess', username, year_month), path, watermark)
+        recent_games.update((game['id'], game['createdAt']) for game in monthly_games)
+        user_state['watermark'] = watermark
+        user_state['recent_games'] = recent_games
+        user_state['last_move_at'] = max(user_state.get('last_move_at') or 0, max(game['lastMoveAt'] for game in monthly_games))
+        save_state(state)
+    
+    # Only games inside the overlap window are needed to drop repeats next time
+    if watermark is not None:
+        user_state['recent_games'] = {
+            game_id: created_at for game_id, created_at in recent_games.items()
+            if created_at >= watermark - OVERLAP_MS
+        }
+        save_state(state)
+
+metrics.write_summary(opponent_cache=opponent_cache.stats())
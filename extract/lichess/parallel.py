@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+import polars as pl
+import pyarrow as pa
+
+from utils import extract_game_data, build_dataframe, enrich_opponents, get_opponent, metrics
+
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', os.cpu_count() or 1))
+PARSE_BATCH_SIZE = int(os.getenv('PARSE_BATCH_SIZE', 500))
+
+
+def parse_batch(games: list, username: str, opponents: dict) -> tuple:
+    """Parses a batch of games into an Arrow table, run inside a worker process.
+
+    The result is sent back as an Arrow table, which pickles as a few column
+    buffers instead of one object per value, with the worker's metrics of
+    the batch to be merged into the main process.
+    """
+
+    with metrics.timer('game_parse'):
+        rows = [extract_game_data(game, username, opponents) for game in games]
+
+    return build_dataframe(rows).to_arrow(), metrics.collect()
+
+
+def make_executor(workers: int = PARSE_WORKERS) -> ProcessPoolExecutor:
+    """Creates the worker pool for parse_months, or None to parse in this process.
+
+    Workers are spawned rather than forked, polars' thread pool is not fork safe.
+    """
+
+    if workers <= 1:
+        return None
+
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def submit_month(executor: ProcessPoolExecutor, games: list, username: str, opponents: dict, batch_size: int) -> list:
+    """Splits a month into batches and submits them, each with only the opponents it needs."""
+
+    futures = []
+
+    for i in range(0, len(games), batch_size):
+        batch = games[i:i + batch_size]
+        batch_opponents = {}
+        for game in batch:
+            opponent_id = get_opponent(game, username)[2]
+            batch_opponents[opponent_id] = opponents.get(opponent_id, {})
+        if executor is None:
+            future = Future()
+            future.set_result(parse_batch(batch, username, batch_opponents))
+        else:
+            future = executor.submit(parse_batch, batch, username, batch_opponents)
+        futures.append(future)
+
+    return futures
+
+
+def collect_month(futures: list) -> pl.DataFrame:
+    """Waits for the batches of a month and concatenates them in order."""
+
+    tables = []
+
+    with metrics.timer('parse_wait'):
+        for future in futures:
+            table, batch_metrics = future.result()
+            tables.append(table)
+            metrics.merge(batch_metrics)
+
+    # Every game of the month may have been skipped as already stored
+    if not tables:
+        return build_dataframe([])
+
+    return pl.from_arrow(pa.concat_tables(tables))
+
+
+def parse_months(months, username: str, executor: ProcessPoolExecutor, batch_size: int = PARSE_BATCH_SIZE, max_pending: int = 2):
+    """Parses monthly batches of games in a process pool, keeping their order.
+
+    Opponents are enriched in the calling process, then the month is split
+    into batches parsed by the workers. While they run, the next months are
+    read and enriched, up to `max_pending` months in flight.
+
+    Args:
+        months: iterable of (year_month, games), e.g. from group_by_month.
+        username (str): lichess username of the player the games were exported for.
+        executor (ProcessPoolExecutor): pool from make_executor, None parses
+        in this process.
+        batch_size (int, optional): games per worker task. Defaults to PARSE_BATCH_SIZE.
+        max_pending (int, optional): months submitted but not yielded yet. Defaults to 2.
+
+    Yields:
+        tuple: the YYYY_MM partition and its DataFrame, with games in the
+        order they were read.
+    """
+
+    pending = deque()
+
+    for year_month, monthly_games in months:
+        print(f"Extracted {len(monthly_games)} games from {year_month}.")
+        opponents = enrich_opponents(monthly_games, username)
+        pending.append((year_month, submit_month(executor, monthly_games, username, opponents, batch_size)))
+
+        while len(pending) >= max_pending:
+            year_month, futures = pending.popleft()
+            yield year_month, collect_month(futures)
+
+    while pending:
+        year_month, futures = pending.popleft()
+        yield year_month, collect_month(futures)
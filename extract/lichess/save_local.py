@@ -1,12 +1,14 @@
-from utils import get_games, extract_game_data
+from utils import get_games, enrich_opponents, extract_game_data, build_dataframe, append_games, opponent_cache, game_index, metrics
+from extract.roster import get_usernames
+from extract.manifest import Manifest, partition_key
 from pathlib import Path
-import polars as pl
-import os
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
 games_data_path = Path.cwd() / 'games_data' / 'lichess'
-LICHESS_USER = os.getenv('LICHESS_USER')
+LICHESS_USERS = get_usernames('lichess')
+manifest = Manifest()
+game_index.sync('lichess')
 
 # Create a datetime object for August 31, 2024, at 23:59:59
 now = datetime.now()
@@ -22,20 +24,24 @@ year_month = f"{since.year}_{str(since.month).zfill(2)}"
 
 print(f"Extracting data from {since} to {until}")
 
-games = get_games(LICHESS_USER, since=since_timestamp, until=until_timestamp)
-
-if games:
-    print(f"Extracted {len(games)} games.")
-    df = pl.DataFrame({})
-
-    for game in games:
-        
-        game_df = extract_game_data(game)
-        df = df.vstack(game_df)
-        
-    print(f"Saving data for {year_month}")
-    df.write_ndjson(games_data_path / f"{year_month}.ndjson")
-    print(f"Data saved for {year_month}")
-        
-else:
-    print("No games found. Exiting...")
\ No newline at end of file
+for username in LICHESS_USERS:
+    
+    games = get_games(username, since=since_timestamp, until=until_timestamp)
+    games = game_index.new_games('lichess', username, games, 'id')
+    
+    if games:
+        print(f"Extracted {len(games)} games of {username}.")
+        opponents = enrich_opponents(games, username)
+        with metrics.timer('game_parse'):
+            rows = [extract_game_data(game, username, opponents) for game in games]
+        df = build_dataframe(rows)
+            
+        print(f"Saving data for {username} {year_month}")
+        path = append_games(df, games_data_path / username / year_month)
+        manifest.record(partition_key('lichess', username, year_month), path, max(game['createdAt'] for game in games))
+        print(f"Data saved for {username} {year_month}")
+            
+    else:
+        print(f"No new games found for {username}.")
+
+metrics.write_summary(opponent_cache=opponent_cache.stats())
\ No newline at end of file
@@ -0,0 +1,141 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from utils import get_games, get_users, metrics
+from extract.http_client import retry_delay
+
+# Windows exported at the same time. lichess throttles each export stream and
+# may answer 429 to concurrent ones, which the HTTP client waits out
+EXPORT_WORKERS = int(os.getenv('LICHESS_EXPORT_WORKERS', 2))
+# Games per request, a window with more games is continued from its last game
+WINDOW_MAX_GAMES = int(os.getenv('LICHESS_WINDOW_MAX_GAMES', 1000))
+WINDOW_RETRIES = int(os.getenv('LICHESS_WINDOW_RETRIES', 3))
+
+
+def month_windows(since: int, until: int) -> list:
+    """Splits a period into calendar month windows.
+
+    Months are in local time like get_year_month, so every window is exactly
+    one partition.
+
+    Args:
+        since (int): timestamp of the beginning of the period in milliseconds.
+        until (int): timestamp of the end of the period in milliseconds, inclusive.
+
+    Returns:
+        list: (since, until) of each window in milliseconds, both inclusive.
+    """
+
+    windows = []
+    start = datetime.fromtimestamp(since / 1000)
+
+    while int(start.timestamp() * 1000) <= until:
+        if start.month == 12:
+            next_month = datetime(start.year + 1, 1, 1)
+        else:
+            next_month = datetime(start.year, start.month + 1, 1)
+        window_since = int(start.timestamp() * 1000)
+        window_until = min(int(next_month.timestamp() * 1000) - 1, until)
+        windows.append((max(window_since, since), window_until))
+        start = next_month
+
+    return windows
+
+
+def get_chunk(username: str, since: int, until: int, max_games: int, retries: int = WINDOW_RETRIES) -> list:
+    """Requests one chunk of a window, retrying it on its own if the export fails.
+
+    A dropped connection mid export is not retried by the HTTP client, as the
+    request was answered, so it is retried here.
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            return get_games(username, since=since, until=until, max_games=max_games)
+        except (requests.RequestException, ValueError) as e:
+            if attempt == retries:
+                raise
+            delay = retry_delay(getattr(e, 'response', None), attempt)
+            metrics.count('lichess_window_retries')
+            print(f"Export of {username} from {since} to {until} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def fetch_window(username: str, since: int, until: int, max_games: int = WINDOW_MAX_GAMES) -> list:
+    """Exports every game of a window in ascending date order.
+
+    The window is requested in chunks of at most `max_games`. A full chunk
+    means the window holds more games, so the next one starts from the time
+    of its last game, and games at that same millisecond are not repeated.
+    Dense months are split by their own games this way, and a failure only
+    loses the chunk being read.
+
+    Returns:
+        list: games of the window, from the API.
+    """
+
+    games = []
+
+    while True:
+        with metrics.timer('fetch_window'):
+            chunk = get_chunk(username, since, until, max_games)
+
+        seen = {game['id'] for game in games if game['createdAt'] == since}
+        new_games = [game for game in chunk if game['id'] not in seen]
+        games.extend(new_games)
+
+        if len(chunk) < max_games or not new_games:
+            return games
+
+        since = chunk[-1]['createdAt']
+        metrics.count('lichess_window_splits')
+
+
+def sharded_games(username: str, since: int = None, until: int = None, workers: int = EXPORT_WORKERS):
+    """Exports the games of a user through month windows fetched in parallel.
+
+    Windows are submitted in date order to a pool of `workers` threads and
+    read back in the same order, so the games come out as from stream_games
+    and can be grouped by month as they arrive. At most two windows per
+    worker are held in memory.
+
+    Args:
+        username (str): lichess username of player.
+        since (int, optional): timestamp for beginning of period in milliseconds.
+        Defaults to None, from the creation of the account.
+        until (int, optional): timestamp for end of period in milliseconds. Defaults to None, now.
+        workers (int, optional): windows exported at the same time. Defaults to EXPORT_WORKERS.
+
+    Yields:
+        dict: a single game from the API, in ascending date order.
+    """
+
+    if since is None:
+        since = get_users([username.lower()])[username.lower()]['createdAt']
+    if until is None:
+        until = int(time.time() * 1000)
+
+    windows = month_windows(since, until)
+    print(f"Exporting games of {username} in {len(windows)} windows with {workers} workers")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        try:
+            for window_since, window_until in windows:
+                pending.append(executor.submit(fetch_window, username, window_since, window_until))
+
+                while len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # A failed window or a consumer that stops early leaves the rest unread
+            for future in pending:
+                future.cancel()
@@ -1,11 +1,92 @@
 import polars as pl
-import requests
-from polars.exceptions import SchemaError
 from datetime import datetime
+from pathlib import Path
+import sys
+from itertools import groupby
+import json
 import os
 import ndjson
 
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from extract.opponent_cache import OpponentCache, PROFILE_TTL
+from extract.clocks import add_clock_columns, CLOCK_TYPE
+from extract.evals import encode_analysis, EVAL_TYPE, JUDGMENT_TYPE
+from extract.move_store import MoveStore
+from extract.game_index import GameIndex
+from extract.openings import add_opening_columns
+from extract.metrics import metrics
+from extract.http_client import http_client
+
 token = os.getenv('LICHESS_TOKEN')
+lichess_url = os.getenv('LICHESS_API_URL', 'https://lichess.org')
+
+# Column types of the extracted data, shared by every batch
+SCHEMA = {
+    'game_id': pl.Utf8,
+    'url': pl.Utf8,
+    'time_class': pl.Utf8,
+    'time_control': pl.Utf8,
+    'is_rated': pl.Boolean,
+    'white_rating': pl.Utf8,
+    'black_rating': pl.Utf8,
+    'white_accuracy': pl.Utf8,
+    'black_accuracy': pl.Utf8,
+    'game_winner': pl.Utf8,
+    'game_status': pl.Utf8,
+    'username': pl.Utf8,
+    'colour': pl.Utf8,
+    'opponent_id': pl.Utf8,
+    'opponent_username': pl.Utf8,
+    'opponent_country': pl.Utf8,
+    'opponent_is_verified': pl.Boolean,
+    'opponent_status': pl.Utf8,
+    'start_datetime': pl.Utf8,
+    'end_datetime': pl.Utf8,
+    'opening_code': pl.Utf8,
+    'opening_name': pl.Utf8,
+    'total_moves': pl.Utf8,
+    'moves': pl.List(pl.Utf8),
+    'move_times': pl.List(pl.Utf8),
+    'clock_ms': CLOCK_TYPE,
+    'time_spent_ms': CLOCK_TYPE,
+    'eval_cp': EVAL_TYPE,
+    'eval_judgment': JUDGMENT_TYPE
+}
+
+# Native column types used for Parquet output in place of the Utf8 ones above
+NATIVE_TYPES = {
+    'white_rating': pl.Int64,
+    'black_rating': pl.Int64,
+    'white_accuracy': pl.Float64,
+    'black_accuracy': pl.Float64,
+    'total_moves': pl.Int64
+}
+
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'ndjson')
+
+# Written games are also added to the binary move store when a path is set
+move_store_path = os.getenv('MOVE_STORE_PATH')
+move_store = MoveStore(Path(move_store_path) / 'lichess') if move_store_path else None
+
+# Games already in the local store are dropped before parsing, see game_index.py.
+# The SQLite file is only opened once a script uses the index
+game_index = GameIndex()
+
+GAMES_QUERY_PARAMS = {
+    'pgnInJson': 'true',
+    'accuracy': 'true',
+    'clocks': 'true',
+    'evals': 'true',
+    'opening': 'true',
+    'sort': 'dateAsc'
+}
+
+# Maximum number of ids accepted by the bulk users endpoint
+USERS_CHUNK_SIZE = 300
+
+cache_path = os.getenv('OPPONENT_CACHE_PATH', Path.cwd() / 'games_data' / 'opponent_cache.sqlite')
+opponent_cache = OpponentCache(cache_path)
 
 def convert_seconds_to_hhmmss(total_centiseconds: int):
     """Converts total seconds into hh:mm:ss format
@@ -23,25 +104,19 @@ def convert_seconds_to_hhmmss(total_centiseconds: int):
     
     return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
 
-def get_games(username: str, since: int = None, until: int = None) -> dict:
+def get_games(username: str, since: int = None, until: int = None, max_games: int = None) -> dict:
     """Calls the lichess API to get games of a user.
     Args:
         username (str): lichess username of player.
         since (int, optional): timestamp for beginning of period in milliseconds. Defaults to None.
         until (int, optional): timestamp for end of period in milliseconds. Defaults to None.
+        max_games (int, optional): maximum number of games, the oldest first. Defaults to None.
 
     Returns:
         dict: returns dictionary of response from API.
     """
     
-    query_params = {
-        'pgnInJson': 'true',
-        'accuracy': 'true',
-        'clocks': 'true',
-        'evals': 'true',
-        'opening': 'true',
-        'sort': 'dateAsc'  
-    }
+    query_params = dict(GAMES_QUERY_PARAMS)
     headers = {
         "Authorization": f"Bearer {token}",
         "accept": "application/x-ndjson"
@@ -51,29 +126,168 @@ def get_games(username: str, since: int = None, until: int = None) -> dict:
         query_params['since'] = since
     if until is not None:
         query_params['until'] = until
+    if max_games is not None:
+        query_params['max'] = max_games
     
-    base_url = "https://lichess.org/api/games/user"
+    base_url = f"{lichess_url}/api/games/user"
     url = f"{base_url}/{username}"
     
-    response = requests.get(
-        url,
-        headers=headers,
-        params=query_params
-    ).json(
-        cls=ndjson.Decoder
-    )
+    with metrics.timer('fetch_games'):
+        response = http_client.get(
+            url,
+            'lichess_games',
+            headers=headers,
+            params=query_params
+        )
+        response.raise_for_status()
+        games = response.json(
+            cls=ndjson.Decoder
+        )
+    
+    return games
+
+def stream_games(username: str, since: int = None, until: int = None):
+    """Streams the games of a user from the lichess API, one game at a time.
+
+    Unlike get_games, the export is parsed line by line as it arrives so only
+    the game being read is held in memory.
+
+    Args:
+        username (str): lichess username of player.
+        since (int, optional): timestamp for beginning of period in milliseconds. Defaults to None.
+        until (int, optional): timestamp for end of period in milliseconds. Defaults to None.
+
+    Yields:
+        dict: a single game from the API, in ascending date order.
+    """
+    
+    query_params = dict(GAMES_QUERY_PARAMS)
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "accept": "application/x-ndjson"
+    }
+    
+    if since is not None:
+        query_params['since'] = since
+    if until is not None:
+        query_params['until'] = until
+    
+    url = f"{lichess_url}/api/games/user/{username}"
+    
+    # Recorded in the metrics up to the first byte, the export itself is read as it is parsed
+    with http_client.get(url, 'lichess_games', headers=headers, params=query_params, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            # lichess sends empty lines as keep-alives on slow exports
+            if line:
+                yield json.loads(line)
+
+def get_year_month(game: dict) -> str:
+    """Returns the YYYY_MM partition a game belongs to, based on its start time."""
+    
+    return datetime.fromtimestamp(game['createdAt'] / 1000).strftime('%Y_%m')
+
+def group_by_month(games):
+    """Groups a date ordered stream of games into consecutive monthly batches.
+
+    Args:
+        games: iterable of games sorted by date, e.g. from stream_games.
+
+    Yields:
+        tuple: the YYYY_MM partition and the list of games played in it.
+    """
+    
+    for year_month, monthly_games in groupby(games, key=get_year_month):
+        yield year_month, list(monthly_games)
+
+def get_users(user_ids: list) -> dict:
+    """Calls the lichess bulk users endpoint for a list of user ids.
+
+    Args:
+        user_ids (list): lichess user ids, sent in chunks of USERS_CHUNK_SIZE.
+
+    Returns:
+        dict: user id mapped to the user's profile from the API.
+    """
+    
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "accept": "application/json",
+        "content-type": "text/plain"
+    }
+    url = f"{lichess_url}/api/users"
+    users = dict()
+    
+    for i in range(0, len(user_ids), USERS_CHUNK_SIZE):
+        chunk = user_ids[i:i + USERS_CHUNK_SIZE]
+        response = http_client.post(url, 'lichess_users', headers=headers, data=','.join(chunk))
+        response.raise_for_status()
+        
+        for user in response.json():
+            users[user['id']] = user
+    
+    return users
+
+def get_opponent(game: dict, username: str) -> tuple:
+    """Returns the player's colour and the opponent's username and id for a game."""
+    
+    if game['players']['white']['user']['id'] == username.lower():
+        return 'white', game['players']['black']['user']['name'], game['players']['black']['user']['id']
+    
+    return 'black', game['players']['white']['user']['name'], game['players']['white']['user']['id']
+
+def enrich_opponents(games: list, username: str) -> dict:
+    """Resolves the profiles of every distinct opponent in a list of games.
+
+    Profiles are read from the opponent cache first and the remaining ids are
+    fetched through the bulk users endpoint, so an opponent shared by several
+    tracked players is only fetched once.
+
+    Args:
+        games (list): games of a player as returned by get_games.
+        username (str): lichess username of the player.
+
+    Returns:
+        dict: opponent id mapped to the opponent's profile, to be passed to
+        extract_game_data.
+    """
+    
+    with metrics.timer('opponent_enrichment'):
+        opponent_ids = list(dict.fromkeys(get_opponent(game, username)[2] for game in games))
+        opponents = dict()
+        missing = []
+        
+        for opponent_id in opponent_ids:
+            opp_info = opponent_cache.get(f'{lichess_url}/api/user/{opponent_id}')
+            if opp_info is None:
+                missing.append(opponent_id)
+            else:
+                opponents[opponent_id] = opp_info
+        
+        fetched = get_users(missing)
+        
+        for opponent_id in missing:
+            # Ids missing from the bulk response are cached too so they are not requested again
+            opp_info = fetched.get(opponent_id, {})
+            opponent_cache.set(f'{lichess_url}/api/user/{opponent_id}', opp_info, PROFILE_TTL)
+            opponents[opponent_id] = opp_info
+    
+    print(f"Resolved {len(opponent_ids)} opponents with {len(missing)} fetched from the API.")
     
-    return response
+    return opponents
 
-def extract_game_data(game: dict) -> pl.DataFrame:
-    """Parses the game data and returns a polars DataFrame.
+def extract_game_data(game: dict, username: str, opponents: dict = None) -> dict:
+    """Parses the game data into a row, see build_dataframe.
 
     Args:
         game (dict): A dictionary containing information for a single game from
         the lichess API.
+        username (str): lichess username of the player the game was exported for.
+        opponents (dict, optional): opponent profiles from enrich_opponents. When
+        given, no API calls are made. Defaults to None.
 
     Returns:
-        pl.DataFrame: DataFrame containing all useful data.
+        dict: row containing all useful data.
     """
     
     game_id = game['id']
@@ -81,8 +295,6 @@ def extract_game_data(game: dict) -> pl.DataFrame:
     game_winner = game.get('winner', "draw")
     url = f'https://lichess.org/{game_id}'
     
-    print('Extracting data from:', url)
-    
     time_class = game['speed']
     time_control = str(game.get('clock').get('initial')) + '+' + str(game.get('clock').get('increment'))
     is_rated = game['rated']
@@ -93,28 +305,30 @@ def extract_game_data(game: dict) -> pl.DataFrame:
     white_accuracy = game['players']['white'].get('analysis', {'accuracy': None}).get('accuracy', None)
     black_accuracy = game['players']['black'].get('analysis', {'accuracy': None}).get('accuracy', None)
         
-    opening_code = game['opening']['eco']
-    opening_name = game['opening']['name']
+    # Reclassified from the moves in build_dataframe, kept for games the ECO table misses
+    opening_code = game.get('opening', {}).get('eco')
+    opening_name = game.get('opening', {}).get('name')
     
-    if game['players']['white']['user']['id'] == 'zainsiddiqi':
-        colour = 'white'
-        opponent_username = game['players']['black']['user']['name']
-        opponent_id = game['players']['black']['user']['id']
+    colour, opponent_username, opponent_id = get_opponent(game, username)
 
+    if opponents is not None:
+        opp_info = opponents.get(opponent_id, {})
     else:
-        colour = 'black'
-        opponent_username = game['players']['white']['user']['name']
-        opponent_id = game['players']['white']['user']['id']
-        
+        opp_headers = {
+            "Authorization": f"Bearer {token}",
+            "accept": "application/json"
+        }
 
-    opp_headers = {
-        "Authorization": f"Bearer {token}",
-        "accept": "application/json"
-    }
+        opponent_api_url = f'{lichess_url}/api/user/{opponent_id}'
+        opp_info = opponent_cache.get(opponent_api_url)
+        
+        if opp_info is None:
+            opp_response = http_client.get(opponent_api_url, 'lichess_user', headers=opp_headers)
+            # An error body must not be cached as the opponent's profile
+            opp_response.raise_for_status()
+            opp_info = opp_response.json()
+            opponent_cache.set(opponent_api_url, opp_info, PROFILE_TTL)
 
-    opponent_api_url = f'https://lichess.org/api/user/{opponent_id}'
-    opp_response = requests.get(opponent_api_url, headers=opp_headers)
-    opp_info = opp_response.json()
     opponent_country = opp_info.get('profile', {'country': None}).get('country', None)
     opponent_is_verified = opp_info.get('verified', None)
 
@@ -137,9 +351,11 @@ def extract_game_data(game: dict) -> pl.DataFrame:
     end_datetime = datetime.strftime(end_datetime_dt, '%Y-%m-%d %H:%M:%S')
     
     moves_list = game['moves'].split(' ')
-    move_times_list = [convert_seconds_to_hhmmss(move_time) for move_time in game['clocks']][:-1]
-    moves = ','.join(moves_list)
-    move_times = ','.join(move_times_list)
+    moves = moves_list
+    # Decoded for the whole batch in build_dataframe
+    clocks = game['clocks'][:-1]
+    # Only analysed games have per-ply evaluations
+    eval_cp, eval_judgment = encode_analysis(game.get('analysis'))
     total_moves = len(moves_list) // 2
     
     row = {
@@ -154,6 +370,7 @@ def extract_game_data(game: dict) -> pl.DataFrame:
         'black_accuracy': black_accuracy,
         'game_winner': game_winner,
         'game_status': game_status,
+        'username': username.lower(),
         'colour': colour,
         'opponent_id': opponent_id,
         'opponent_username': opponent_username,
@@ -166,40 +383,118 @@ def extract_game_data(game: dict) -> pl.DataFrame:
         'opening_name': opening_name,
         'total_moves': total_moves,
         'moves': moves,
-        'move_times': move_times
+        'clocks': clocks,
+        'eval_cp': eval_cp,
+        'eval_judgment': eval_judgment
     }
     
-    df = pl.DataFrame(
-        row
-    ).with_columns(
-        pl.col('moves').str.split(','),
-        pl.col('move_times').str.split(',')
-    ).select(
-        pl.col('game_id').cast(pl.Utf8),
-        pl.col('url').cast(pl.Utf8),
-        pl.col('time_class').cast(pl.Utf8),
-        pl.col('time_control').cast(pl.Utf8),
-        pl.col('is_rated').cast(pl.Boolean),
-        pl.col('white_rating').cast(pl.Utf8),
-        pl.col('black_rating').cast(pl.Utf8),
-        pl.col('white_accuracy').cast(pl.Utf8),
-        pl.col('black_accuracy').cast(pl.Utf8),
-        pl.col('game_winner').cast(pl.Utf8),
-        pl.col('game_status').cast(pl.Utf8),
-        pl.col('colour').cast(pl.Utf8),
-        pl.col('opponent_id').cast(pl.Utf8),
-        pl.col('opponent_username').cast(pl.Utf8),
-        pl.col('opponent_country').cast(pl.Utf8),
-        pl.col('opponent_is_verified').cast(pl.Boolean),
-        pl.col('opponent_status').cast(pl.Utf8),
-        pl.col('start_datetime').cast(pl.Utf8),
-        pl.col('end_datetime').cast(pl.Utf8),
-        pl.col('opening_code').cast(pl.Utf8),
-        pl.col('opening_name').cast(pl.Utf8),
-        pl.col('total_moves').cast(pl.Utf8),
-        pl.col('moves').cast(pl.List(pl.Utf8)),
-        pl.col('move_times').cast(pl.List(pl.Utf8)),
-        pl.lit(datetime.now()).alias("_extracted_at")
-    )
-    
-    return df
\ No newline at end of file
+    return row
+
+def build_dataframe(rows: list) -> pl.DataFrame:
+    """Builds one typed polars DataFrame from a batch of parsed games.
+
+    Args:
+        rows (list): rows returned by extract_game_data.
+
+    Returns:
+        pl.DataFrame: DataFrame with the columns and types of SCHEMA.
+    """
+    
+    if not rows:
+        return pl.DataFrame(schema={**SCHEMA, '_extracted_at': pl.Datetime})
+    
+    with metrics.timer('dataframe_build'):
+        df = pl.DataFrame(
+            rows,
+            infer_schema_length=None
+        ).pipe(
+            add_clock_columns, 'clocks', 'centiseconds'
+        ).pipe(
+            add_opening_columns
+        ).select(
+            [pl.col(name).cast(dtype) for name, dtype in SCHEMA.items()]
+        ).with_columns(
+            pl.lit(datetime.now()).alias("_extracted_at")
+        )
+    
+    metrics.count('games_extracted', len(rows))
+    
+    return df
+
+def write_games(df: pl.DataFrame, path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+    """Writes a month of games as NDJSON or as typed, zstd compressed Parquet.
+
+    Args:
+        df (pl.DataFrame): DataFrame from build_dataframe.
+        path (Path): output path, its suffix is set from the output format.
+        output_format (str, optional): 'ndjson' or 'parquet'. Defaults to OUTPUT_FORMAT.
+
+    Returns:
+        Path: the path written to.
+    """
+    
+    if move_store is not None:
+        move_store.append_games(df)
+    
+    # Partitioned by user, games_data/lichess/<username>/<YYYY_MM>
+    path.parent.mkdir(parents=True, exist_ok=True)
+    
+    with metrics.timer('write'):
+        if output_format == 'parquet':
+            path = path.with_suffix('.parquet')
+            df.with_columns(
+                [pl.col(name).cast(dtype) for name, dtype in NATIVE_TYPES.items()]
+            ).write_parquet(path, compression='zstd')
+        else:
+            path = path.with_suffix('.ndjson')
+            df.write_ndjson(path)
+    
+    game_index.remove_file(path)
+    if df.height:
+        game_index.add('lichess', df['username'][0], df['game_id'], path)
+    
+    metrics.count('games_written', df.height)
+    
+    return path
+
+def append_games(df: pl.DataFrame, path: Path, output_format: str = OUTPUT_FORMAT) -> Path:
+    """Appends games to a month's file, creating it if it does not exist yet.
+
+    Args:
+        df (pl.DataFrame): DataFrame from build_dataframe.
+        path (Path): output path, its suffix is set from the output format.
+        output_format (str, optional): 'ndjson' or 'parquet'. Defaults to OUTPUT_FORMAT.
+
+    Returns:
+        Path: the path written to.
+    """
+    
+    path = path.with_suffix(f'.{output_format}')
+    
+    # write_games adds the moves of a new file to the move store
+    if not path.exists():
+        return write_games(df, path, output_format)
+    
+    # Nothing new, e.g. every game of the month was already stored
+    if df.is_empty():
+        return path
+    
+    if move_store is not None:
+        move_store.append_games(df)
+    
+    with metrics.timer('write'):
+        if output_format == 'parquet':
+            existing = pl.read_parquet(path)
+            df = df.with_columns(
+                [pl.col(name).cast(dtype) for name, dtype in NATIVE_TYPES.items()]
+            )
+            pl.concat([existing, df], how='vertical_relaxed').write_parquet(path, compression='zstd')
+        else:
+            with open(path, 'a') as f:
+                f.write(df.write_ndjson())
+    
+    game_index.add('lichess', df['username'][0], df['game_id'], path)
+    
+    metrics.count('games_written', df.height)
+    
+    return path
\ No newline at end of file
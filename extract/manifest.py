@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import polars as pl
+
+manifest_path = Path(os.getenv('MANIFEST_PATH', Path.cwd() / 'games_data' / 'manifest.json'))
+
+
+def partition_key(platform: str, username: str, year_month: str) -> str:
+    """Returns the manifest key of a partition, e.g. 'lichess/alice/2024_01'."""
+
+    return f'{platform}/{username}/{year_month}'
+
+
+def file_checksum(path: Path) -> str:
+    """Returns the SHA-256 of a file, read in 1 MiB blocks."""
+
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def read_game_ids(path: Path) -> pl.Series:
+
+    path = Path(path)
+
+    if path.stat().st_size == 0:
+        return pl.Series('game_id', [], dtype=pl.Utf8)
+    if path.suffix == '.parquet':
+        return pl.read_parquet(path, columns=['game_id'])['game_id']
+
+    return pl.scan_ndjson(path).select('game_id').collect()['game_id']
+
+
+class Manifest:
+    """Completed partitions of the extracted games and what was loaded from them.
+
+    Each partition (platform, user, month) records its file, game count,
+    game_id range, SHA-256 and the source watermark it was extracted up to,
+    e.g. the newest game's end time. Backfills skip partitions that still
+    validate against their record, and the load scripts only upload files
+    whose checksum differs from the one last loaded to a table. Partitions
+    streamed to a table without a local file are recorded separately.
+
+    The manifest is a JSON file, replaced atomically on every save.
+    """
+
+    def __init__(self, path: Path = manifest_path):
+        """
+        Args:
+            path (Path, optional): location of the JSON file, created on first save.
+            Defaults to MANIFEST_PATH or games_data/manifest.json.
+        """
+
+        self.path = Path(path)
+
+        if self.path.exists():
+            with open(self.path) as f:
+                data = json.load(f)
+        else:
+            data = dict()
+
+        self.partitions = data.get('partitions', {})
+        self.loads = data.get('loads', {})
+        self.streams = data.get('streams', {})
+
+    def save(self):
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'partitions': self.partitions, 'loads': self.loads, 'streams': self.streams}, f, indent=2)
+
+        os.replace(tmp_path, self.path)
+
+    def record(self, key: str, path: Path, watermark=None, backfill: bool = False) -> dict:
+        """Records a partition as complete from its written file, and saves the manifest.
+
+        Args:
+            key (str): partition key, see partition_key.
+            path (Path): the partition's file as returned by write_games or append_games.
+            watermark (optional): newest source timestamp the partition covers. Defaults to None.
+            backfill (bool, optional): whether a date ordered backfill wrote the partition,
+            after every earlier month of the user. Defaults to False.
+
+        Returns:
+            dict: the partition's record.
+        """
+
+        path = Path(path)
+        game_ids = read_game_ids(path)
+
+        self.partitions[key] = {
+            'path': str(path),
+            'games': len(game_ids),
+            'first_game_id': game_ids.min(),
+            'last_game_id': game_ids.max(),
+            'bytes': path.stat().st_size,
+            'sha256': file_checksum(path),
+            'watermark': watermark,
+            'backfill': backfill,
+            'completed_at': datetime.now().isoformat(timespec='seconds')
+        }
+        self.save()
+
+        return self.partitions[key]
+
+    def is_complete(self, key: str) -> bool:
+        """Whether a partition was recorded and its file is unchanged since."""
+
+        record = self.partitions.get(key)
+        if record is None:
+            return False
+
+        path = Path(record['path'])
+
+        return path.exists() and path.stat().st_size == record['bytes'] and file_checksum(path) == record['sha256']
+
+    def resume_watermark(self, platform: str, username: str):
+        """Returns the watermark a date ordered backfill of a user can resume from.
+
+        Only partitions recorded by a backfill count, as other scripts record
+        single recent months without the history before them.
+
+        Returns:
+            the watermark of the user's last backfilled partition before the
+            first one that no longer validates, or None to start from the beginning.
+        """
+
+        prefix = partition_key(platform, username, '')
+        watermark = None
+
+        for key in sorted(key for key in self.partitions if key.startswith(prefix)):
+            if not self.partitions[key].get('backfill'):
+                continue
+            if not self.is_complete(key):
+                break
+            watermark = self.partitions[key]['watermark']
+
+        return watermark
+
+    def needs_load(self, table_id: str, path: Path) -> bool:
+        """Whether a file is new or changed since it was last loaded to a table."""
+
+        loaded = self.loads.get(table_id, {}).get(str(path))
+
+        return loaded is None or loaded != file_checksum(path)
+
+    def was_loaded(self, table_id: str, path: Path) -> bool:
+        """Whether any version of a file was loaded to a table."""
+
+        return str(path) in self.loads.get(table_id, {})
+
+    def mark_loaded(self, table_id: str, paths: list):
+        """Records the current checksums of files loaded to a table, and saves the manifest."""
+
+        loads = self.loads.setdefault(table_id, {})
+
+        for path in paths:
+            loads[str(path)] = file_checksum(path)
+
+        self.save()
+
+    def mark_streamed(self, table_id: str, key: str, games: int, watermark=None):
+        """Records a partition loaded to a table straight from the extractor, and saves the manifest."""
+
+        streams = self.streams.setdefault(table_id, {'partitions': {}, 'watermarks': {}})
+        streams['partitions'][key] = {
+            'games': games,
+            'watermark': watermark,
+            'loaded_at': datetime.now().isoformat(timespec='seconds')
+        }
+        streams.get('partial', {}).pop(key, None)
+        self.save()
+
+    def was_streamed(self, table_id: str, key: str) -> bool:
+
+        return key in self.streams.get(table_id, {}).get('partitions', {})
+
+    def mark_chunk_streamed(self, table_id: str, key: str):
+        """Records that a chunk of a partition was loaded to a table before the whole partition was, and saves the manifest."""
+
+        streams = self.streams.setdefault(table_id, {'partitions': {}, 'watermarks': {}})
+        partial = streams.setdefault('partial', {})
+        partial[key] = partial.get(key, 0) + 1
+        self.save()
+
+    def was_partly_streamed(self, table_id: str, key: str) -> bool:
+        """Whether some but not all chunks of a partition were loaded, e.g. by a run where one failed."""
+
+        return key in self.streams.get(table_id, {}).get('partial', {})
+
+    def set_stream_watermark(self, table_id: str, platform: str, username: str, watermark):
+        """Records that every game of a user up to the watermark was streamed to a table, and saves the manifest."""
+
+        streams = self.streams.setdefault(table_id, {'partitions': {}, 'watermarks': {}})
+        streams['watermarks'][partition_key(platform, username, '')] = watermark
+        self.save()
+
+    def stream_watermark(self, table_id: str, platform: str, username: str):
+        """Returns the watermark a streamed backfill of a user can resume from, or None."""
+
+        return self.streams.get(table_id, {}).get('watermarks', {}).get(partition_key(platform, username, ''))
@@ -0,0 +1,215 @@
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# Upper bounds of the HTTP latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+METRICS_DIR = os.getenv('METRICS_DIR', Path.cwd() / 'games_data' / 'metrics')
+# 'cprofile' or 'tracemalloc' to profile the whole run, the result goes in the summary
+PROFILE_MODE = os.getenv('PROFILE_MODE')
+
+
+class Metrics:
+    """Per-run counters, stage timers and HTTP statistics.
+
+    Recording is a few dict updates, so it stays on in every run. The summary
+    is written once at the end by write_summary.
+    """
+
+    def __init__(self, profile_mode: str = None):
+        """
+        Args:
+            profile_mode (str, optional): 'cprofile' or 'tracemalloc' to profile
+            from now until write_summary. Defaults to None.
+        """
+
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = defaultdict(lambda: {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        self.counters = Counter()
+        self.http = defaultdict(lambda: {
+            'requests': 0,
+            'errors': 0,
+            'throttled': 0,
+            'seconds': 0.0,
+            'latency_ms': Counter()
+        })
+        self.profile_mode = profile_mode
+        self.profiler = None
+        self.written = False
+
+        if profile_mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif profile_mode == 'tracemalloc':
+            tracemalloc.start(10)
+
+    def add_time(self, stage: str, seconds: float):
+
+        stage = self.stages[stage]
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        stage['max_seconds'] = max(stage['max_seconds'], seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Times a block of code as one call of a stage, e.g. with metrics.timer('pgn_parse'):"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def count(self, name: str, n: int = 1):
+
+        self.counters[name] += n
+
+    def record_request(self, endpoint: str, seconds: float, status: int = None):
+        """Records one HTTP request of an endpoint. A status of None means no response."""
+
+        http = self.http[endpoint]
+        http['requests'] += 1
+        http['seconds'] += seconds
+
+        if status is None or status >= 400:
+            http['errors'] += 1
+        if status == 429:
+            http['throttled'] += 1
+
+        ms = seconds * 1000
+        bucket = next((f'<={bound}' for bound in LATENCY_BUCKETS_MS if ms <= bound), f'>{LATENCY_BUCKETS_MS[-1]}')
+        http['latency_ms'][bucket] += 1
+
+    def record_response(self, endpoint: str, response):
+        """Records a requests response, timed by its `elapsed` attribute."""
+
+        self.record_request(endpoint, response.elapsed.total_seconds(), response.status_code)
+
+    def collect(self) -> dict:
+        """Returns and resets the stage timers and counters, to be merged in another process."""
+
+        collected = {'stages': dict(self.stages), 'counters': dict(self.counters)}
+        self.stages.clear()
+        self.counters.clear()
+
+        return collected
+
+    def merge(self, collected: dict):
+        """Adds stage timers and counters returned by collect, e.g. from a worker process."""
+
+        for name, other in collected['stages'].items():
+            stage = self.stages[name]
+            stage['calls'] += other['calls']
+            stage['seconds'] += other['seconds']
+            stage['max_seconds'] = max(stage['max_seconds'], other['max_seconds'])
+
+        self.counters.update(collected['counters'])
+
+    def summary(self, **extra) -> dict:
+        """Returns every metric of the run as a JSON serialisable dict.
+
+        Args:
+            **extra: additional sections, e.g. opponent_cache=opponent_cache.stats().
+        """
+
+        http = dict()
+        for endpoint, stats in self.http.items():
+            http[endpoint] = {
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'throttled': stats['throttled'],
+                'mean_ms': round(1000 * stats['seconds'] / stats['requests'], 1),
+                'latency_ms': {
+                    bucket: stats['latency_ms'][bucket]
+                    for bucket in [f'<={bound}' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}']
+                    if stats['latency_ms'][bucket]
+                }
+            }
+
+        return {
+            # e.g. lichess/backfill.py, both platforms have scripts of the same name
+            'script': '/'.join(Path(sys.argv[0]).resolve().parts[-2:]),
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_seconds': round(time.perf_counter() - self.start, 3),
+            'stages': {
+                stage: {key: round(value, 4) if isinstance(value, float) else value for key, value in stats.items()}
+                for stage, stats in self.stages.items()
+            },
+            'counters': dict(self.counters),
+            'http': http,
+            **extra
+        }
+
+    def profile_summary(self, top: int = 20) -> dict:
+        """Stops profiling and returns its top entries."""
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(top)
+            self.profiler = None
+            return {'cprofile': output.getvalue().splitlines()}
+
+        if self.profile_mode == 'tracemalloc' and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return {
+                'tracemalloc': {
+                    'peak_mib': round(peak / 2 ** 20, 1),
+                    'top': [str(stat) for stat in snapshot.statistics('lineno')[:top]]
+                }
+            }
+
+        return {}
+
+    def write_summary(self, path: Path = None, **extra) -> dict:
+        """Prints the run's summary and writes it as JSON to METRICS_DIR.
+
+        Args:
+            path (Path, optional): output file. Defaults to
+                METRICS_DIR/<platform>_<script>_<start time>.json.
+            **extra: additional sections, see summary.
+
+        Returns:
+            dict: the summary.
+        """
+
+        summary = self.summary(**extra)
+        summary.update(self.profile_summary())
+        self.written = True
+
+        if path is None:
+            name = summary['script'].removesuffix('.py').replace('/', '_')
+            path = Path(METRICS_DIR) / f"{name}_{self.started_at:%Y%m%d_%H%M%S}.json"
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(summary, indent=2))
+
+        stages = ', '.join(f"{stage} {stats['seconds']:.2f}s" for stage, stats in summary['stages'].items())
+        requests = sum(stats['requests'] for stats in summary['http'].values())
+        throttled = sum(stats['throttled'] for stats in summary['http'].values())
+        print(f"Finished in {summary['wall_seconds']:.1f}s: {stages}")
+        print(f"{requests} HTTP requests ({throttled} throttled), counters: {summary['counters']}")
+        print(f"Metrics written to {path}")
+
+        return summary
+
+
+metrics = Metrics(PROFILE_MODE)
+
+if PROFILE_MODE:
+    # Scripts that stop early still get their profile written
+    atexit.register(lambda: metrics.written or metrics.write_summary())
@@ -0,0 +1,127 @@
+import mmap
+from array import array
+from pathlib import Path
+from extract.board import encode_moves
+
+
+class MoveStore:
+    """Append-only store of games as arrays of 16 bit encoded moves.
+
+    Moves of every game are appended to `moves.bin` and an offset index
+    (`index.tsv`: game_id, offset and number of plies) is kept next to it.
+    Reads go through a memory map of `moves.bin`, so a game's moves are
+    returned as a view into the file without copying.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path (Path): directory of the store, created if missing.
+        """
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.data_path = self.path / 'moves.bin'
+        self.index_path = self.path / 'index.tsv'
+        self.data_path.touch()
+        self.index_path.touch()
+
+        self.index = dict()
+        with open(self.index_path) as f:
+            for line in f:
+                game_id, start, length = line.rstrip('\n').split('\t')
+                self.index[game_id] = (int(start), int(length))
+
+        self.size = self.data_path.stat().st_size // 2
+        self.mapped = None
+        self.view = None
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def append(self, game_id: str, codes) -> bool:
+        """Appends the encoded moves of a game, unless it is already stored.
+
+        Returns:
+            bool: whether the game was added.
+        """
+
+        if game_id in self.index:
+            return False
+
+        codes = array('H', codes)
+        with open(self.data_path, 'ab') as f:
+            codes.tofile(f)
+        with open(self.index_path, 'a') as f:
+            f.write(f'{game_id}\t{self.size}\t{len(codes)}\n')
+
+        self.index[game_id] = (self.size, len(codes))
+        self.size += len(codes)
+
+        return True
+
+    def append_games(self, df) -> int:
+        """Encodes and appends the games of a DataFrame with `game_id` and `moves` columns.
+
+        Games whose moves cannot be replayed are skipped.
+
+        Returns:
+            int: number of games added.
+        """
+
+        added = 0
+
+        for game_id, moves in zip(df['game_id'], df['moves']):
+            if game_id in self.index or moves is None:
+                continue
+            try:
+                codes = encode_moves(moves)
+            except ValueError as e:
+                print(f"Skipping moves of game {game_id}: {e}")
+                continue
+            added += self.append(game_id, codes)
+
+        return added
+
+    def remap(self):
+        """Maps the data file again, to make games appended since the last map readable.
+
+        The previous map is not closed, views returned earlier stay valid and
+        it is released once they are no longer referenced.
+        """
+
+        if self.size:
+            with open(self.data_path, 'rb') as f:
+                self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mapped).cast('H')
+
+    def get(self, game_id: str) -> memoryview:
+        """Returns the encoded moves of a game as a zero-copy view, see board.decode_move."""
+
+        start, length = self.index[game_id]
+
+        if self.view is None or start + length > len(self.view):
+            self.remap()
+
+        return self.view[start:start + length]
+
+    def iter_games(self):
+        """Yields (game_id, moves view) for every game, in the order they were stored."""
+
+        self.remap()
+
+        for game_id, (start, length) in self.index.items():
+            yield game_id, self.view[start:start + length]
+
+    def close(self):
+        """Closes the memory map. Views returned by get must be released first."""
+
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
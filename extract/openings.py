@@ -0,0 +1,169 @@
+import csv
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+import polars as pl
+from extract.board import Board
+
+ECO_TABLE_PATH = Path(__file__).resolve().parent / 'eco.tsv'
+
+MOVE_NUMBER_RE = re.compile(r'^\d+\.+$')
+
+
+class OpeningTrie:
+    """Trie of opening lines keyed on encoded moves, built from an ECO table.
+
+    Lines are stored as 16 bit encoded moves (see board.encode_move) rather
+    than SAN, so check marks, annotations and redundant disambiguation in the
+    platforms' notation do not matter. A game is classified as the deepest
+    line it follows, in time proportional to the length of that line.
+    """
+
+    def __init__(self):
+
+        # Every node is a dict of children, the opening ending at it is under None
+        self.root = dict()
+        # Length of the longest line, later moves never change the classification
+        self.depth = 0
+        # Games mostly share their first moves, so classifications are cached by prefix
+        self.classify_prefix = lru_cache(maxsize=65536)(self.classify_prefix)
+
+    def insert(self, moves: list, code: str, name: str):
+        """Adds an opening line given as SAN moves."""
+
+        node = self.root
+        board = Board()
+
+        for san in moves:
+            node = node.setdefault(board.push_san(san), dict())
+
+        node[None] = (code, name)
+        self.depth = max(self.depth, len(moves))
+        self.classify_prefix.cache_clear()
+
+    def classify(self, moves: list) -> tuple:
+        """Returns the (opening_code, opening_name) of the deepest line a game follows.
+
+        Only the moves of the opening are replayed, classification stops as
+        soon as the game leaves the table.
+
+        Args:
+            moves (list): SAN moves of the game.
+
+        Returns:
+            tuple: (opening_code, opening_name), (None, None) when not even the
+            first move is in the table.
+        """
+
+        return self.classify_prefix(tuple((moves or [])[:self.depth]))
+
+    def classify_prefix(self, moves: tuple) -> tuple:
+
+        node = self.root
+        board = Board()
+        opening = node.get(None, (None, None))
+
+        for san in moves:
+            try:
+                node = node.get(board.push_san(san))
+            except ValueError:
+                break
+            if node is None:
+                break
+            opening = node.get(None, opening)
+
+        return opening
+
+
+def load_openings(path: Path = ECO_TABLE_PATH) -> OpeningTrie:
+    """Builds the opening trie from a tab separated ECO table.
+
+    The table has `eco`, `name` and `pgn` columns, the same layout as the
+    lichess chess-openings tables, which can be dropped in as a replacement.
+    """
+
+    trie = OpeningTrie()
+
+    with open(path, encoding='utf-8') as f:
+        for row in csv.DictReader(f, delimiter='\t'):
+            moves = [token for token in row['pgn'].split() if not MOVE_NUMBER_RE.match(token)]
+            trie.insert(moves, row['eco'], row['name'])
+
+    return trie
+
+
+openings = load_openings(os.getenv('ECO_TABLE_PATH', ECO_TABLE_PATH))
+
+
+def add_opening_columns(df: pl.DataFrame, keep_missing: bool = True) -> pl.DataFrame:
+    """Sets `opening_code` and `opening_name` of a batch of games from their `moves`.
+
+    chess.com's `opening_url` links to the opening chess.com classified the
+    game as, so it is set to null where the ECO code changes. The table has
+    no urls to recompute it from.
+
+    Args:
+        df (pl.DataFrame): batch of games with a `moves` list column.
+        keep_missing (bool, optional): keep the existing values of games the
+        table cannot classify instead of setting them to null. Defaults to True.
+
+    Returns:
+        pl.DataFrame: the input with both columns classified.
+    """
+
+    classified = [openings.classify(moves) for moves in df['moves'].to_list()]
+    codes = pl.Series('opening_code', [code for code, _ in classified], dtype=pl.Utf8)
+    names = pl.Series('opening_name', [name for _, name in classified], dtype=pl.Utf8)
+
+    if 'opening_url' in df.columns:
+        if keep_missing and 'opening_code' in df.columns:
+            changed = pl.lit(codes.is_not_null()) & pl.col('opening_code').ne_missing(codes)
+        else:
+            changed = pl.col('opening_code').ne_missing(codes) if 'opening_code' in df.columns else pl.lit(True)
+        df = df.with_columns(
+            pl.when(changed).then(pl.lit(None, dtype=pl.Utf8)).otherwise(pl.col('opening_url')).alias('opening_url')
+        )
+
+    if keep_missing and 'opening_code' in df.columns:
+        return df.with_columns(
+            pl.when(codes.is_null()).then(pl.col('opening_code')).otherwise(codes).alias('opening_code'),
+            pl.when(codes.is_null()).then(pl.col('opening_name')).otherwise(names).alias('opening_name')
+        )
+
+    return df.with_columns(codes, names)
+
+
+def reclassify_files(paths: list) -> int:
+    """Rewrites the opening columns of monthly NDJSON or Parquet files in place.
+
+    Returns:
+        int: number of games reclassified.
+    """
+
+    total = 0
+
+    for path in paths:
+        path = Path(path)
+
+        if path.suffix == '.parquet':
+            df = pl.read_parquet(path)
+            add_opening_columns(df).write_parquet(path, compression='zstd')
+        else:
+            df = pl.read_ndjson(path)
+            add_opening_columns(df).write_ndjson(path)
+
+        total += df.height
+        print(f"Reclassified {df.height} games in {path}")
+
+    return total
+
+
+# Run from the repository root: python -m extract.openings
+if __name__ == '__main__':
+
+    # Files are partitioned as games_data/<platform>/<username>/<YYYY_MM>
+    games_data_path = Path.cwd() / 'games_data'
+
+    paths = sorted(games_data_path.glob('*/*/*.ndjson')) + sorted(games_data_path.glob('*/*/*.parquet'))
+    print(f"Reclassified {reclassify_files(paths)} games")
@@ -0,0 +1,141 @@
+import sqlite3
+import json
+import time
+from pathlib import Path
+
+# Profiles can change (status, verification), country names effectively never do
+PROFILE_TTL = 7 * 24 * 60 * 60
+COUNTRY_TTL = 365 * 24 * 60 * 60
+
+
+class OpponentCache:
+    """On-disk key/value cache for opponent profiles and country names.
+
+    Entries are stored as JSON in a SQLite table with a per-entry expiry and a
+    last access time, which is used to evict the least recently used entries
+    once the cache grows beyond `max_entries`. The file is opened on first
+    use, so importing a module that creates a cache does not touch the disk.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 100_000):
+        """
+        Args:
+            path (Path): location of the SQLite file, created if missing.
+            max_entries (int, optional): entries kept before LRU eviction. Defaults to 100_000.
+        """
+
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Upper bound of the number of entries, so the table is only counted once it may be full
+        self.entries = 0
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection to the SQLite file, created on first use."""
+
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # The cache is shared with worker threads, sqlite serialises the calls
+            self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)')
+            self.entries = self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+        return self._conn
+
+    def get(self, key: str):
+        """Returns the cached value for a key, or None if missing or expired.
+
+        Args:
+            key (str): cache key, e.g. an API url.
+
+        Returns:
+            dict: the cached JSON value or None.
+        """
+
+        now = time.time()
+        row = self.conn.execute(
+            'SELECT value, expires_at FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+
+        if row is None or row[1] < now:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.conn.execute('UPDATE cache SET last_access = ? WHERE key = ?', (now, key))
+
+        return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float = PROFILE_TTL):
+        """Stores a JSON serialisable value under a key.
+
+        Args:
+            key (str): cache key, e.g. an API url.
+            value: JSON serialisable value.
+            ttl (float, optional): seconds until the entry expires. Defaults to PROFILE_TTL.
+        """
+
+        now = time.time()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + ttl, now)
+        )
+        # A replaced key is counted too, which only makes the bound looser
+        self.entries += 1
+        if self.entries > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """Removes expired entries and the least recently used ones above `max_entries`.
+
+        The cache is trimmed to 90% of `max_entries`, so a full cache is only
+        counted and trimmed once every tenth of `max_entries` inserts.
+        """
+
+        self.conn.execute('DELETE FROM cache WHERE expires_at < ?', (time.time(),))
+        count = self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        excess = count - int(self.max_entries * 0.9) if count > self.max_entries else 0
+
+        if excess > 0:
+            self.conn.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access LIMIT ?)',
+                (excess,)
+            )
+
+        self.entries = count - max(excess, 0)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current number of entries."""
+
+        if self._conn is None and not self.path.exists():
+            size = 0
+        else:
+            size = self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        lookups = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': size
+        }
+
+    def close(self):
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
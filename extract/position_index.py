@@ -0,0 +1,217 @@
+import os
+import random
+import sqlite3
+from pathlib import Path
+import polars as pl
+from extract.board import Board
+
+PIECES = 'PNBRQKpnbrqk'
+
+# Fixed seed, hashes have to be the same on every run for the index to be reusable
+_random = random.Random(20240901)
+
+
+def _random_key() -> int:
+    # SQLite integers are signed 64 bit
+    return _random.getrandbits(64) - 2 ** 63
+
+
+PIECE_KEYS = {piece: [_random_key() for _ in range(64)] for piece in PIECES}
+BLACK_TO_MOVE_KEY = _random_key()
+CASTLING_KEYS = {right: _random_key() for right in 'KQkq'}
+EP_FILE_KEYS = [_random_key() for _ in range(8)]
+
+
+def state_key(board: Board) -> int:
+    """Returns the part of a position's hash that is not piece placement.
+
+    The en passant file only counts when a pawn can legally capture on it,
+    as in FEN and python-chess, so the same position reached through different
+    move orders hashes the same. A capture that would leave the king in check,
+    e.g. with the pawn pinned, does not count.
+    """
+
+    key = 0
+
+    if not board.white_to_move:
+        key ^= BLACK_TO_MOVE_KEY
+
+    for right in board.castling:
+        key ^= CASTLING_KEYS[right]
+
+    if board.ep_square is not None:
+        pawn = 'P' if board.white_to_move else 'p'
+        behind = -8 if board.white_to_move else 8
+        file = board.ep_square % 8
+        for side in (-1, 1):
+            source = board.ep_square + behind + side
+            if 0 <= file + side < 8 and board.squares[source] == pawn \
+                    and not board.king_in_check_after(source, board.ep_square):
+                key ^= EP_FILE_KEYS[file]
+                break
+
+    return key
+
+
+def zobrist_hash(board: Board) -> int:
+    """Returns the Zobrist hash of a position as a signed 64 bit integer."""
+
+    key = state_key(board)
+
+    for square, piece in enumerate(board.squares):
+        if piece is not None:
+            key ^= PIECE_KEYS[piece][square]
+
+    return key
+
+
+def game_hashes(moves: list) -> list:
+    """Replays a game and returns the hash of the position after every ply.
+
+    The hash is updated from the squares each move changed and the side to
+    move, castling and en passant keys, rather than recomputed from the board.
+    """
+
+    board = Board()
+    key = zobrist_hash(board)
+    hashes = []
+
+    for san in moves:
+        key ^= state_key(board)
+        for square, piece in board.apply(*board.parse_san(san)):
+            if piece is not None:
+                key ^= PIECE_KEYS[piece][square]
+            if board.squares[square] is not None:
+                key ^= PIECE_KEYS[board.squares[square]][square]
+        key ^= state_key(board)
+        hashes.append(key)
+
+    return hashes
+
+
+class PositionIndex:
+    """On-disk inverted index from position hash to the (game_id, ply) where it occurred.
+
+    Postings are kept in a SQLite table clustered on the hash, so a lookup is
+    a single index range scan. The starting position is not indexed.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path (Path): location of the SQLite file, created if missing.
+        """
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS positions (
+                hash INTEGER NOT NULL,
+                game_id TEXT NOT NULL,
+                ply INTEGER NOT NULL,
+                PRIMARY KEY (hash, game_id, ply)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS games (game_id TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL NOT NULL);
+            """
+        )
+
+    def index_games(self, df: pl.DataFrame) -> int:
+        """Indexes the games of a DataFrame with `game_id` and `moves` columns.
+
+        Games already in the index, without moves or with moves that cannot be
+        replayed are skipped.
+
+        Returns:
+            int: number of games indexed.
+        """
+
+        indexed = 0
+
+        with self.conn:
+            for game_id, moves in zip(df['game_id'], df['moves']):
+                if moves is None:
+                    continue
+                if self.conn.execute('SELECT 1 FROM games WHERE game_id = ?', (game_id,)).fetchone():
+                    continue
+                try:
+                    hashes = game_hashes(moves)
+                except ValueError as e:
+                    print(f"Skipping game {game_id}: {e}")
+                    continue
+
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO positions (hash, game_id, ply) VALUES (?, ?, ?)',
+                    [(key, game_id, ply) for ply, key in enumerate(hashes, start=1)]
+                )
+                self.conn.execute('INSERT INTO games (game_id) VALUES (?)', (game_id,))
+                indexed += 1
+
+        return indexed
+
+    def update_from_files(self, paths: list) -> int:
+        """Indexes monthly NDJSON or Parquet files that are new or changed since the last update.
+
+        Returns:
+            int: number of games indexed.
+        """
+
+        indexed = 0
+
+        for path in paths:
+            path = Path(path)
+            mtime = path.stat().st_mtime
+            row = self.conn.execute('SELECT mtime FROM files WHERE path = ?', (str(path),)).fetchone()
+            if row is not None and row[0] == mtime:
+                continue
+
+            if path.suffix == '.parquet':
+                df = pl.read_parquet(path, columns=['game_id', 'moves'])
+            else:
+                df = pl.read_ndjson(path).select('game_id', 'moves')
+
+            indexed += self.index_games(df)
+            with self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO files (path, mtime) VALUES (?, ?)', (str(path), mtime))
+            print(f"Indexed {path}")
+
+        return indexed
+
+    def lookup(self, key: int) -> list:
+        """Returns every (game_id, ply) where the position with this hash occurred."""
+
+        return self.conn.execute(
+            'SELECT game_id, ply FROM positions WHERE hash = ? ORDER BY game_id, ply', (key,)
+        ).fetchall()
+
+    def lookup_moves(self, moves: list) -> list:
+        """Returns every (game_id, ply) where the position after these SAN moves occurred."""
+
+        # The starting position is not indexed
+        if not moves:
+            return []
+
+        return self.lookup(game_hashes(moves)[-1])
+
+    def lookup_fen(self, fen: str) -> list:
+        """Returns every (game_id, ply) where the position of a FEN string occurred."""
+
+        return self.lookup(zobrist_hash(Board.from_fen(fen)))
+
+    def close(self):
+        self.conn.close()
+
+
+# Run from the repository root: python -m extract.position_index
+if __name__ == '__main__':
+
+    # Files are partitioned as games_data/<platform>/<username>/<YYYY_MM>
+    games_data_path = Path.cwd() / 'games_data'
+    index = PositionIndex(os.getenv('POSITION_INDEX_PATH', games_data_path / 'positions.sqlite'))
+
+    paths = sorted(games_data_path.glob('*/*/*.ndjson')) + sorted(games_data_path.glob('*/*/*.parquet'))
+    print(f"Indexed {index.update_from_files(paths)} new games")
@@ -0,0 +1,20 @@
+import os
+
+
+def get_usernames(platform: str) -> list:
+    """Returns the tracked players of a platform.
+
+    Read from `<PLATFORM>_USERS` as a comma separated list, e.g.
+    CHESSCOM_USERS=alice,bob, falling back to the single `<PLATFORM>_USER`.
+
+    Args:
+        platform (str): 'chesscom' or 'lichess'.
+
+    Returns:
+        list: usernames, lowercased and without duplicates, in the order given.
+    """
+
+    usernames = os.getenv(f'{platform.upper()}_USERS') or os.getenv(f'{platform.upper()}_USER') or ''
+
+    # Both platforms treat usernames case insensitively, lichess ids are lowercase
+    return list(dict.fromkeys(name.strip().lower() for name in usernames.split(',') if name.strip()))
@@ -0,0 +1,285 @@
+import os
+import re
+from pathlib import Path
+
+import polars as pl
+
+from extract.clocks import CLOCK_TYPE
+from extract.evals import EVAL_TYPE, JUDGMENT_TYPE
+
+store_path = Path(os.getenv('GAMES_DATA_PATH', Path.cwd() / 'games_data'))
+
+# games_data/<platform>/<username>/<YYYY_MM>.<ndjson|parquet>
+PARTITION_PATTERN = re.compile(r'(?P<year>\d{4})_(?P<month>\d{2})\.(?P<format>ndjson|parquet)')
+
+# Columns of the NDJSON files as written by each platform's build_dataframe,
+# given to the reader so it does not infer types from the first lines of a file
+_SHARED_COLUMNS = {
+    'game_id': pl.Utf8,
+    'url': pl.Utf8,
+    'time_class': pl.Utf8,
+    'time_control': pl.Utf8,
+    'is_rated': pl.Boolean,
+    'white_rating': pl.Utf8,
+    'black_rating': pl.Utf8,
+    'white_accuracy': pl.Utf8,
+    'black_accuracy': pl.Utf8,
+    'username': pl.Utf8,
+    'colour': pl.Utf8,
+    'opponent_id': pl.Utf8,
+    'opponent_username': pl.Utf8,
+    'opponent_country': pl.Utf8,
+    'opponent_is_verified': pl.Boolean,
+    'opponent_status': pl.Utf8,
+    'start_datetime': pl.Utf8,
+    'end_datetime': pl.Utf8,
+    'opening_code': pl.Utf8,
+    'opening_name': pl.Utf8,
+    'total_moves': pl.Utf8,
+    'moves': pl.List(pl.Utf8),
+    'move_times': pl.List(pl.Utf8),
+    'clock_ms': CLOCK_TYPE,
+    'time_spent_ms': CLOCK_TYPE,
+    '_extracted_at': pl.Utf8
+}
+
+NDJSON_SCHEMAS = {
+    'chesscom': {
+        **_SHARED_COLUMNS,
+        'white_result': pl.Utf8,
+        'black_result': pl.Utf8,
+        'opening_url': pl.Utf8
+    },
+    'lichess': {
+        **_SHARED_COLUMNS,
+        'game_winner': pl.Utf8,
+        'game_status': pl.Utf8,
+        'eval_cp': EVAL_TYPE,
+        'eval_judgment': JUDGMENT_TYPE
+    }
+}
+
+# Columns and types every partition is mapped to, whatever its platform and format
+SCHEMA = {
+    'platform': pl.Utf8,
+    'username': pl.Utf8,
+    'year': pl.Int32,
+    'month': pl.Int32,
+    'game_id': pl.Utf8,
+    'url': pl.Utf8,
+    'time_class': pl.Utf8,
+    'time_control': pl.Utf8,
+    'is_rated': pl.Boolean,
+    'colour': pl.Utf8,
+    'result': pl.Utf8,
+    'termination': pl.Utf8,
+    'player_rating': pl.Int64,
+    'opponent_rating': pl.Int64,
+    'white_rating': pl.Int64,
+    'black_rating': pl.Int64,
+    'white_accuracy': pl.Float64,
+    'black_accuracy': pl.Float64,
+    'opponent_id': pl.Utf8,
+    'opponent_username': pl.Utf8,
+    'opponent_country': pl.Utf8,
+    'opponent_is_verified': pl.Boolean,
+    'opponent_status': pl.Utf8,
+    'start_datetime': pl.Datetime,
+    'end_datetime': pl.Datetime,
+    'opening_code': pl.Utf8,
+    'opening_name': pl.Utf8,
+    'total_moves': pl.Int64,
+    'moves': pl.List(pl.Utf8),
+    'move_times': pl.List(pl.Utf8),
+    'clock_ms': CLOCK_TYPE,
+    'time_spent_ms': CLOCK_TYPE,
+    'eval_cp': EVAL_TYPE,
+    'eval_judgment': JUDGMENT_TYPE,
+    '_extracted_at': pl.Datetime
+}
+
+# chess.com results of a drawn game, any other result than 'win' is a loss
+CHESSCOM_DRAWS = ['agreed', 'repetition', 'stalemate', 'insufficient', '50move', 'timevsinsufficient']
+
+
+def list_partitions(root: Path = store_path, platforms: list = None, usernames: list = None,
+                    start: str = None, end: str = None) -> list:
+    """Lists the partition files of the store, pruned by platform, player and month.
+
+    Only the directory names are read. Empty files, written for months
+    without games, are left out, and a month written as both NDJSON and
+    Parquet is read from the Parquet file.
+
+    Args:
+        root (Path, optional): the store's directory. Defaults to GAMES_DATA_PATH or games_data.
+        platforms (list, optional): 'chesscom' and/or 'lichess'. Defaults to None, for both.
+        usernames (list, optional): players to keep. Defaults to None, for all.
+        start (str, optional): first month, 'YYYY-MM'. Defaults to None.
+        end (str, optional): last month, 'YYYY-MM', inclusive. Defaults to None.
+
+    Returns:
+        list: dicts of platform, username, year, month, format and path,
+        sorted by partition.
+    """
+
+    root = Path(root)
+    usernames = {username.lower() for username in usernames} if usernames else None
+    partitions = {}
+
+    for platform in platforms or NDJSON_SCHEMAS:
+        platform_dir = root / platform
+        if not platform_dir.is_dir():
+            continue
+
+        for user_dir in platform_dir.iterdir():
+            if not user_dir.is_dir() or (usernames and user_dir.name not in usernames):
+                continue
+
+            for path in user_dir.iterdir():
+                match = PARTITION_PATTERN.fullmatch(path.name)
+                if match is None:
+                    continue
+
+                year_month = f"{match['year']}-{match['month']}"
+                if (start and year_month < start) or (end and year_month > end):
+                    continue
+                if path.stat().st_size == 0:
+                    continue
+
+                key = (platform, user_dir.name, year_month)
+                if key in partitions and partitions[key]['format'] == 'parquet':
+                    continue
+
+                partitions[key] = {
+                    'platform': platform,
+                    'username': user_dir.name,
+                    'year': int(match['year']),
+                    'month': int(match['month']),
+                    'format': match['format'],
+                    'path': path
+                }
+
+    return [partitions[key] for key in sorted(partitions)]
+
+
+def scan_partition(partition: dict) -> pl.LazyFrame:
+    """Lazily reads one partition file mapped to SCHEMA.
+
+    NDJSON files are read with the platform's column types and Parquet files
+    with their own, from the file footer. Columns added after a file was
+    written, e.g. username or eval_cp, are null.
+    """
+
+    platform = partition['platform']
+    path = partition['path']
+
+    if partition['format'] == 'parquet':
+        lf = pl.scan_parquet(path)
+        columns = pl.read_parquet_schema(path)
+    else:
+        columns = NDJSON_SCHEMAS[platform]
+        lf = pl.scan_ndjson(path, schema=columns)
+
+    def column(name: str) -> pl.Expr:
+        if name in columns:
+            return pl.col(name)
+        return pl.lit(None)
+
+    white = column('colour') == 'white'
+
+    if platform == 'chesscom':
+        player_result = pl.when(white).then(column('white_result')).otherwise(column('black_result'))
+        opponent_result = pl.when(white).then(column('black_result')).otherwise(column('white_result'))
+        result = (
+            pl.when(player_result == 'win').then(pl.lit('win'))
+            .when(player_result.is_in(CHESSCOM_DRAWS)).then(pl.lit('draw'))
+            .when(player_result.is_not_null()).then(pl.lit('loss'))
+        )
+        # How the game ended is the result of the side that did not win
+        termination = pl.when(player_result == 'win').then(opponent_result).otherwise(player_result)
+    else:
+        result = (
+            pl.when(column('game_winner') == 'draw').then(pl.lit('draw'))
+            .when(column('game_winner') == column('colour')).then(pl.lit('win'))
+            .when(column('game_winner').is_not_null()).then(pl.lit('loss'))
+        )
+        termination = column('game_status')
+
+    white_rating = column('white_rating').cast(pl.Int64, strict=False)
+    black_rating = column('black_rating').cast(pl.Int64, strict=False)
+
+    expressions = {
+        'platform': pl.lit(platform),
+        # Files written before the roster have no username column
+        'username': pl.coalesce([column('username'), pl.lit(partition['username'])]),
+        'year': pl.lit(partition['year']),
+        'month': pl.lit(partition['month']),
+        'result': result,
+        'termination': termination,
+        'player_rating': pl.when(white).then(white_rating).otherwise(black_rating),
+        'opponent_rating': pl.when(white).then(black_rating).otherwise(white_rating),
+        'white_rating': white_rating,
+        'black_rating': black_rating
+    }
+
+    for name, dtype in SCHEMA.items():
+        if name in expressions:
+            continue
+        if dtype == pl.Datetime and columns.get(name) == pl.Utf8:
+            expressions[name] = column(name).str.strptime(pl.Datetime, '%Y-%m-%d %H:%M:%S%.f', strict=False)
+        else:
+            expressions[name] = column(name)
+
+    return lf.select(
+        [expressions[name].cast(dtype, strict=False).alias(name) for name, dtype in SCHEMA.items()]
+    )
+
+
+def scan_games(platforms: list = None, usernames: list = None, start: str = None, end: str = None,
+               root: Path = store_path) -> pl.LazyFrame:
+    """Lazily reads the games of the local store as one dataset of both platforms.
+
+    Partitions are pruned by platform, player and month from the directory
+    layout before any file is opened. Filters and column selections applied
+    to the returned frame are pushed down into each file's scan, so Parquet
+    partitions only read the columns a query uses.
+
+    Example, rapid games played as black against opponents above 1800 in 2023:
+
+        scan_games(start='2023-01', end='2023-12').filter(
+            (pl.col('time_class') == 'rapid')
+            & (pl.col('colour') == 'black')
+            & (pl.col('opponent_rating') > 1800)
+        ).select(['game_id', 'end_datetime', 'opponent_username', 'result']).collect()
+
+    Args:
+        platforms (list, optional): 'chesscom' and/or 'lichess'. Defaults to None, for both.
+        usernames (list, optional): players to read. Defaults to None, for all.
+        start (str, optional): first month, 'YYYY-MM'. Defaults to None.
+        end (str, optional): last month, 'YYYY-MM', inclusive. Defaults to None.
+        root (Path, optional): the store's directory. Defaults to GAMES_DATA_PATH or games_data.
+
+    Returns:
+        pl.LazyFrame: games with the columns and types of SCHEMA.
+    """
+
+    partitions = list_partitions(root, platforms, usernames, start, end)
+
+    if not partitions:
+        return pl.LazyFrame(schema=SCHEMA)
+
+    return pl.concat([scan_partition(partition) for partition in partitions], how='vertical')
+
+
+if __name__ == '__main__':
+
+    partitions = list_partitions()
+    print(f"{len(partitions)} partitions in {store_path}")
+
+    print(
+        scan_games().group_by(['platform', 'username', 'year']).agg(
+            pl.count().alias('games'),
+            (pl.col('result') == 'win').mean().round(3).alias('win_rate'),
+            pl.col('player_rating').last().alias('last_rating')
+        ).sort(['platform', 'username', 'year']).collect()
+    )
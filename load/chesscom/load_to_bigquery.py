@@ -1,7 +1,12 @@
 from google.cloud import bigquery
 from datetime import datetime
 import os
-from load.chesscom.config import job_config
+from pathlib import Path
+import tempfile
+from load.chesscom.config import job_config, parquet_job_config
+from load.partitions import replace_partition, merge_games, partition_table_id, combine_files
+from extract.metrics import metrics
+from extract.roster import get_usernames
 
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getcwd() + r"\bigquery_service_account.json"
 
@@ -10,6 +15,13 @@ PLATFORM = "chesscom"
 PROJECT_ID = "chesscom-433717"
 DATASET_ID = f"{ENV}_games_{PLATFORM}"
 TABLE_NAME = "raw_games"
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'ndjson')
+# 'append' adds rows to the table, 'replace' overwrites the month's partition
+# and 'merge' upserts the month's games on game_id through a staging table
+LOAD_MODE = os.getenv('LOAD_MODE', 'append')
+
+if OUTPUT_FORMAT == 'parquet':
+    job_config = parquet_job_config
 
 client = bigquery.Client()
 table_id = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_NAME}"
@@ -18,14 +30,34 @@ print(f"Table ID: {table_id}")
 year = str(datetime.now().year)
 month = str(datetime.now().month - 1).zfill(2)
         
-print(f"Uploading {year}_{month}.ndjson")
-
-file_path = os.getcwd() + r"\monthly_data\\" + f"{year}_{month}.ndjson"
+# One file per tracked player, monthly_data/<username>/<YYYY_MM>
+file_paths = [
+    os.getcwd() + r"\monthly_data\\" + f"{username}\\" + f"{year}_{month}.{OUTPUT_FORMAT}"
+    for username in get_usernames(PLATFORM)
+]
+file_paths = [file_path for file_path in file_paths if os.path.exists(file_path)]
 
-with open(file_path, "rb") as source_file:
-    job = client.load_table_from_file(source_file, table_id, job_config=job_config)
-
-job.result()  # Waits for the job to complete
+with metrics.timer('bigquery_job'):
+    if LOAD_MODE == 'replace' and not file_paths:
+        # Replacing with an empty file would wipe the month's partition
+        print(f"No files for {year}_{month}, keeping its partition")
+    elif LOAD_MODE == 'replace':
+        # The month's partition holds every player, so their files replace it in one job
+        print(f"Replacing {year}_{month} with {len(file_paths)} files")
+        combined_path = combine_files(file_paths, Path(tempfile.mkdtemp()) / f"{year}_{month}.{OUTPUT_FORMAT}")
+        replace_partition(client, table_id, year, month, combined_path, job_config)
+    else:
+        for file_path in file_paths:
+            print(f"Uploading {file_path}")
+            if LOAD_MODE == 'merge':
+                merge_games(client, table_id, year, month, file_path, job_config)
+            else:
+                # Appended to the partition of the games' month, not of the load
+                with open(file_path, "rb") as source_file:
+                    job = client.load_table_from_file(
+                        source_file, partition_table_id(table_id, year, month), job_config=job_config
+                    )
+                job.result()  # Waits for the job to complete
 
 table = client.get_table(table_id)  # Make an API request.
 
@@ -33,4 +65,6 @@ print(
     "Loaded {} rows and {} columns to {}".format(
         table.num_rows, len(table.schema), table_id
     )
-)
\ No newline at end of file
+)
+
+metrics.write_summary()
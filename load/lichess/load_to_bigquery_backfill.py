@@ -1,6 +1,17 @@
 from google.cloud import bigquery
 import os
-from config import job_config
+from pathlib import Path
+import tempfile
+import sys
+from config import job_config, parquet_job_config
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from load.orchestrator import load_files
+from extract.metrics import metrics
+from load.partitions import partition_table_id, partition_job_config, combine_files
+from extract.roster import get_usernames
+from extract.manifest import Manifest
 
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getcwd() + r"\bigquery_service_account.json"
 
@@ -9,34 +20,85 @@ ENV = "dev"
 DATASET_ID = f"{ENV}"
 PLATFORM = "lichess"
 TABLE_NAME = f"raw_games_{PLATFORM}"
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'ndjson')
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', 8))
+# 'append' adds rows to the table, 'replace' overwrites each month's partition
+LOAD_MODE = os.getenv('LOAD_MODE', 'append')
+
+if OUTPUT_FORMAT == 'parquet':
+    job_config = parquet_job_config
 
 client = bigquery.Client()
 table_id = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_NAME}"
 print(f"Table ID: {table_id}")
 
+# Files of every tracked player, games_data/<platform>/<username>/<YYYY_MM>
+USERS = get_usernames(PLATFORM)
+
+# Files already loaded are skipped unless their checksum changed, see extract/manifest.py
+manifest = Manifest()
+
+file_paths = []
+# Every file is loaded to the partition of its games' month, not of the load
+table_ids = dict()
+# In replace mode a month's partition holds every player's games, so their files
+# are combined and replace the partition in one job, mapped to the files they hold
+replacing = dict()
+combined_dir = Path(tempfile.mkdtemp())
+# Appending a changed file again would duplicate its games, only replace mode reloads them
+changed = []
+
 for year in range(2020, 2025):
     for month in range(1, 13):
         
         year = str(year)
         month = str(month).zfill(2)
-                
-        print(f"Uploading {year}_{month}.ndjson")
+        
+        month_paths = [
+            os.getcwd() + r"\games_data\\" + f"{PLATFORM}\\{username}\\" + f"{year}_{month}.{OUTPUT_FORMAT}"
+            for username in USERS
+        ]
+        month_paths = [file_path for file_path in month_paths if os.path.exists(file_path)]
+        partition = partition_table_id(table_id, year, month)
+        
+        if LOAD_MODE == 'replace':
+            # One new or changed file reloads the whole partition
+            if any(manifest.needs_load(table_id, file_path) for file_path in month_paths):
+                combined_path = str(combine_files(month_paths, combined_dir / f"{year}_{month}.{OUTPUT_FORMAT}"))
+                table_ids[combined_path] = partition
+                replacing[combined_path] = month_paths
+            continue
+        
+        for file_path in month_paths:
+            table_ids[file_path] = partition
+            if not manifest.was_loaded(table_id, file_path):
+                file_paths.append(file_path)
+            elif manifest.needs_load(table_id, file_path):
+                changed.append(file_path)
 
-        file_path = os.getcwd() + r"\games_data\\" +f"{PLATFORM}\\" + f"{year}_{month}.ndjson"
+if LOAD_MODE == 'replace':
+    print(f"Replacing {len(replacing)} month partitions of {len(USERS)} players")
+else:
+    print(f"Uploading {len(file_paths)} new files of {len(USERS)} players")
 
-        try:
-            with open(file_path, "rb") as source_file:
-                job = client.load_table_from_file(source_file, table_id, job_config=job_config)
-        except FileNotFoundError:
-            print(f"File {year}_{month}.ndjson not found")
-            continue
+results = load_files(client, table_id, list(replacing), partition_job_config(job_config), max_concurrent=MAX_CONCURRENT_JOBS, table_ids=table_ids)
+results.update(load_files(client, table_id, file_paths, job_config, max_concurrent=MAX_CONCURRENT_JOBS, table_ids=table_ids))
+
+loaded_rows = sum(result['output_rows'] for result in results.values())
+failed = [file_path for file_path, result in results.items() if result['state'] == 'FAILED']
+
+# A combined file stands for every player's file of its month
+loaded = []
+for file_path, result in results.items():
+    if result['state'] == 'DONE':
+        loaded.extend(replacing.get(file_path, [file_path]))
+manifest.mark_loaded(table_id, loaded)
 
-        job.result()  # Waits for the job to complete
+print(f"Loaded {loaded_rows} rows from {len(loaded)} files to {table_id}")
 
-        table = client.get_table(table_id)  # Make an API request.
+if failed:
+    print(f"Failed to load {len(failed)} files, their partitions keep their previous games: {failed}")
+if changed:
+    print(f"Skipped {len(changed)} files changed since they were loaded, reload them with LOAD_MODE=replace: {changed}")
 
-        print(
-            "Loaded {} rows and {} columns to {}".format(
-                table.num_rows, len(table.schema), table_id
-            )
-        )
\ No newline at end of file
+metrics.write_summary()
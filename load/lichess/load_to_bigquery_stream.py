@@ -0,0 +1,131 @@
+from google.cloud import bigquery
+import os
+import sys
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import polars as pl
+from config import job_config, parquet_job_config
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'extract' / 'lichess'))
+
+from utils import stream_games, group_by_month, opponent_cache, metrics, NATIVE_TYPES
+from parallel import parse_months, make_executor
+from shards import sharded_games
+from load.streaming import StreamingLoader
+from load.partitions import partition_table_id
+from extract.roster import get_usernames
+from extract.manifest import Manifest, partition_key
+
+os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getcwd() + r"\bigquery_service_account.json"
+
+PROJECT_ID = "chessgames"
+ENV = "dev"
+DATASET_ID = f"{ENV}"
+PLATFORM = "lichess"
+TABLE_NAME = f"raw_games_{PLATFORM}"
+# 'ndjson' uploads gzip compressed NDJSON, 'parquet' zstd compressed Parquet
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'ndjson')
+# 'stream' or 'sharded', see extract/lichess/backfill.py
+EXPORT_MODE = os.getenv('LICHESS_EXPORT_MODE', 'stream')
+
+# Create a datetime object for August 31, 2024, at 23:59:59
+until = datetime(2024, 8, 31, 23, 59, 59)
+until_timestamp = int(until.timestamp() * 1000)
+
+def with_watermarks(months, watermarks: dict):
+    """Passes monthly batches through, noting the newest createdAt of each month."""
+
+    for year_month, monthly_games in months:
+        watermarks[year_month] = max(game['createdAt'] for game in monthly_games)
+        yield year_month, monthly_games
+
+def skip_streamed(months, manifest: Manifest, table_id: str, username: str):
+    """Drops the months already loaded by a previous run, e.g. after a month that failed."""
+
+    for year_month, monthly_games in months:
+        if manifest.was_streamed(table_id, partition_key(PLATFORM, username, year_month)):
+            print(f"Skipping {username} {year_month}, already loaded")
+            continue
+        yield year_month, monthly_games
+
+# Parse workers are spawned and import this script again, so it only runs as __main__
+if __name__ == '__main__':
+
+    if OUTPUT_FORMAT == 'parquet':
+        job_config = parquet_job_config
+
+    client = bigquery.Client()
+    table_id = f"{PROJECT_ID}.{DATASET_ID}.{TABLE_NAME}"
+    print(f"Table ID: {table_id}")
+
+    manifest = Manifest()
+    executor = make_executor()
+
+    # The lichess backfill without local files: each month is compressed as it is
+    # parsed and loaded to its partition while the next months are exported.
+    # Games are appended, so a re-run resumes after the last month loaded in
+    # order and skips the months loaded after it. A month split into several
+    # chunks that only partly loaded is merged on game_id by the next run, so
+    # its loaded chunks are not appended twice.
+    for username in get_usernames(PLATFORM):
+
+        watermark = manifest.stream_watermark(table_id, PLATFORM, username)
+        since = watermark + 1 if watermark is not None else None
+        if since is not None:
+            print(f"Resuming {username} after {datetime.fromtimestamp(watermark / 1000)}")
+
+        if EXPORT_MODE == 'sharded':
+            games = sharded_games(username, since=since, until=until_timestamp)
+        else:
+            games = stream_games(username, since=since, until=until_timestamp)
+
+        watermarks = dict()
+        game_counts = dict()
+        # The watermark only moves past months loaded in order, so a month that
+        # failed is exported again by the next run
+        written = deque()
+        loaded = set()
+
+        def on_loaded(key):
+            year_month = key.rsplit('/', 1)[-1]
+            manifest.mark_streamed(table_id, key, game_counts[key], watermarks[year_month])
+            loaded.add(key)
+            while written and written[0] in loaded:
+                key = written.popleft()
+                manifest.set_stream_watermark(table_id, PLATFORM, username, watermarks[key.rsplit('/', 1)[-1]])
+
+        loader = StreamingLoader(
+            client, job_config, OUTPUT_FORMAT, on_loaded=on_loaded,
+            on_chunk_loaded=lambda key: manifest.mark_chunk_streamed(table_id, key)
+        )
+
+        for year_month, df in parse_months(
+            skip_streamed(with_watermarks(group_by_month(games), watermarks), manifest, table_id, username), username, executor
+        ):
+
+            if OUTPUT_FORMAT == 'parquet':
+                df = df.with_columns([pl.col(name).cast(dtype) for name, dtype in NATIVE_TYPES.items()])
+
+            key = partition_key(PLATFORM, username, year_month)
+            written.append(key)
+            game_counts[key] = df.height
+            year, month = year_month.split('_')
+            merge = manifest.was_partly_streamed(table_id, key)
+            if merge:
+                print(f"Merging {username} {year_month}, partly loaded by a previous run")
+            loader.write(df, partition_table_id(table_id, year, month), key, merge=merge)
+
+        results = loader.close()
+
+        failed = [name for name, result in results.items() if result['state'] == 'FAILED']
+        loaded_rows = sum(result['output_rows'] for result in results.values())
+        print(f"Loaded {loaded_rows} rows of {username} in {len(results)} chunks to {table_id}")
+        if failed:
+            print(f"Failed to load {len(failed)} chunks, their months are merged by the next run: {failed}")
+
+    if executor is not None:
+        executor.shutdown()
+
+    metrics.write_summary(opponent_cache=opponent_cache.stats())
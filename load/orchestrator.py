@@ -0,0 +1,82 @@
+import time
+from collections import deque, Counter
+from pathlib import Path
+from extract.metrics import metrics
+
+
+def submit_load(client, table_id: str, file_path: Path, job_config):
+    """Uploads a file and starts its load job without waiting for it."""
+
+    with metrics.timer('bigquery_upload'), open(file_path, "rb") as source_file:
+        return client.load_table_from_file(source_file, table_id, job_config=job_config)
+
+
+def load_files(client, table_id: str, file_paths: list, job_config, max_concurrent: int = 8,
+               max_retries: int = 2, poll_interval: float = 1.0, table_ids: dict = None) -> dict:
+    """Loads several files into a table with concurrent load jobs.
+
+    Up to `max_concurrent` jobs run at once and are polled together. A file
+    whose job fails is resubmitted on its own, up to `max_retries` times.
+
+    Args:
+        client (bigquery.Client): BigQuery client, or any object with the same
+        `load_table_from_file` method.
+        table_id (str): destination table id.
+        file_paths (list): paths of the files to load.
+        job_config (LoadJobConfig): load job configuration.
+        max_concurrent (int, optional): jobs running at the same time. Defaults to 8.
+        max_retries (int, optional): retries per failed file. Defaults to 2.
+        poll_interval (float, optional): seconds between polls. Defaults to 1.0.
+        table_ids (dict, optional): file path mapped to its own destination, e.g.
+        a partition decorator. Files not in it go to `table_id`. Defaults to None.
+
+    Returns:
+        dict: file path mapped to its result: `state` ('DONE' or 'FAILED'),
+        `output_rows`, `job_id` and `errors`.
+    """
+
+    pending = deque(file_paths)
+    running = dict()
+    submitted_at = dict()
+    attempts = Counter()
+    results = dict()
+
+    def retry_or_fail(file_path, errors, job_id=None):
+        if attempts[file_path] <= max_retries:
+            metrics.count('bigquery_load_retries')
+            print(f"Load of {file_path} failed, retrying: {errors}")
+            pending.append(file_path)
+        else:
+            print(f"Load of {file_path} failed after {attempts[file_path]} attempts: {errors}")
+            results[file_path] = {'state': 'FAILED', 'output_rows': 0, 'job_id': job_id, 'errors': errors}
+
+    while pending or running:
+
+        while pending and len(running) < max_concurrent:
+            file_path = pending.popleft()
+            attempts[file_path] += 1
+            try:
+                destination = (table_ids or {}).get(file_path, table_id)
+                running[file_path] = submit_load(client, destination, file_path, job_config)
+                submitted_at[file_path] = time.perf_counter()
+            except Exception as e:
+                retry_or_fail(file_path, [str(e)])
+
+        if running:
+            time.sleep(poll_interval)
+
+        for file_path, job in list(running.items()):
+            if not job.done():
+                continue
+
+            del running[file_path]
+            metrics.add_time('bigquery_job', time.perf_counter() - submitted_at.pop(file_path))
+
+            if job.error_result:
+                retry_or_fail(file_path, job.errors, job.job_id)
+            else:
+                print(f"Loaded {job.output_rows} rows from {file_path}")
+                metrics.count('rows_loaded', job.output_rows)
+                results[file_path] = {'state': 'DONE', 'output_rows': job.output_rows, 'job_id': job.job_id, 'errors': None}
+
+    return results
@@ -0,0 +1,146 @@
+import copy
+from pathlib import Path
+import polars as pl
+from google.cloud.bigquery import LoadJobConfig, WriteDisposition
+
+
+def partition_table_id(table_id: str, year: int, month: int) -> str:
+    """Returns the `table$YYYYMM` decorator addressing one month partition."""
+
+    return f"{table_id}${year}{str(month).zfill(2)}"
+
+
+def partition_job_config(job_config: LoadJobConfig) -> LoadJobConfig:
+    """Copy of a load config that overwrites the destination partition instead of appending."""
+
+    config = copy.deepcopy(job_config)
+    config.write_disposition = WriteDisposition.WRITE_TRUNCATE
+
+    return config
+
+
+def combine_files(file_paths: list, path: Path) -> Path:
+    """Concatenates the files of a month, one per player, into a single file.
+
+    A month partition holds every player's games, so it is replaced by one
+    load job of the combined file: the partition either has all players'
+    new games or keeps its old ones.
+
+    Args:
+        file_paths (list): NDJSON or Parquet files of the same month.
+        path (Path): combined file to write, with the files' suffix.
+
+    Returns:
+        Path: the path written to.
+    """
+
+    path = Path(path)
+
+    if path.suffix == '.parquet':
+        # Empty months are written as empty files
+        frames = [pl.read_parquet(file_path) for file_path in file_paths if Path(file_path).stat().st_size]
+        if frames:
+            pl.concat(frames, how='vertical_relaxed').write_parquet(path, compression='zstd')
+        else:
+            path.write_bytes(b'')
+        return path
+
+    with open(path, 'wb') as combined:
+        for file_path in file_paths:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            combined.write(data)
+            if data and not data.endswith(b'\n'):
+                combined.write(b'\n')
+
+    return path
+
+
+def replace_partition(client, table_id: str, year: int, month: int, file_path: str, job_config: LoadJobConfig):
+    """Atomically replaces one month partition with the contents of a file.
+
+    Re-running a month leaves exactly one copy of its games, and other
+    partitions are not touched. With several players, pass their files
+    combined by combine_files so the month is replaced in one job.
+
+    Every load path puts a file's games in the partition of the file's month,
+    the chess.com archive month or the lichess month the games were created
+    in, so a month is only ever in one partition. Rows appended before loads
+    were routed to the month decorators sit in the partition of the month
+    they were loaded in instead and are not removed here. Rebuild the table
+    once with one row per game_id and username before relying on replace.
+
+    Args:
+        client (bigquery.Client): BigQuery client.
+        table_id (str): month partitioned table id.
+        year (int): year of the partition.
+        month (int): month of the partition.
+        file_path (str): file holding every game of the month.
+        job_config (LoadJobConfig): load config of the table, e.g. from config.py.
+
+    Returns:
+        LoadJob: the finished load job.
+    """
+
+    with open(file_path, "rb") as source_file:
+        job = client.load_table_from_file(
+            source_file,
+            partition_table_id(table_id, year, month),
+            job_config=partition_job_config(job_config)
+        )
+
+    job.result()
+
+    return job
+
+
+def merge_games(client, table_id: str, year: int, month: int, file_path: str, job_config: LoadJobConfig,
+                staging_table_id: str = None):
+    """Loads a file into a staging table and merges it into one month partition on game_id and username.
+
+    New games are inserted into the partition of the file's month, like
+    replace_partition and the appends to partition_table_id, and games
+    already in it are updated, so late arriving games can be added to past
+    months without reloading them. Only that partition is scanned.
+
+    Args:
+        client (bigquery.Client): BigQuery client.
+        table_id (str): month partitioned table id.
+        year (int): year of the file's partition.
+        month (int): month of the file's partition.
+        file_path (str): file with the games of the month to merge.
+        job_config (LoadJobConfig): load config of the table, e.g. from config.py.
+        staging_table_id (str, optional): staging table, replaced on every call.
+        Defaults to `<table_id>_staging`.
+
+    Returns:
+        QueryJob: the finished merge job.
+    """
+
+    staging_table_id = staging_table_id or f"{table_id}_staging"
+
+    staging_config = partition_job_config(job_config)
+    staging_config.time_partitioning = None
+    staging_config.schema_update_options = None
+
+    with open(file_path, "rb") as source_file:
+        client.load_table_from_file(source_file, staging_table_id, job_config=staging_config).result()
+
+    columns = [field.name for field in job_config.schema]
+    partition = f"TIMESTAMP('{year}-{str(month).zfill(2)}-01')"
+
+    query = f"""
+    MERGE `{table_id}` T
+    USING `{staging_table_id}` S
+    ON T.game_id = S.game_id AND T.username IS NOT DISTINCT FROM S.username AND T._PARTITIONTIME = {partition}
+    WHEN MATCHED THEN
+        UPDATE SET {', '.join(f'{column} = S.{column}' for column in columns if column not in ('game_id', 'username'))}
+    WHEN NOT MATCHED THEN
+        INSERT (_PARTITIONTIME, {', '.join(columns)})
+        VALUES ({partition}, {', '.join(f'S.{column}' for column in columns)})
+    """
+
+    job = client.query(query)
+    job.result()
+
+    return job
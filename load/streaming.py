@@ -0,0 +1,299 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from extract.metrics import metrics
+from load.partitions import merge_games
+
+# Uncompressed bytes written to a chunk before it is uploaded as its own load job
+CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', 256 * 2 ** 20))
+# Chunks are held in memory up to this size and spilled to a temporary file beyond it
+SPOOL_MEMORY_BYTES = int(os.getenv('UPLOAD_SPOOL_MEMORY_BYTES', 32 * 2 ** 20))
+GZIP_LEVEL = int(os.getenv('UPLOAD_GZIP_LEVEL', 6))
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 2))
+# Rows compressed at a time, so a large batch is split across chunks
+WRITE_ROWS = 5000
+
+
+class Chunk:
+    """One load job's worth of games, compressed into a spooled temporary file.
+
+    NDJSON is written through gzip, which BigQuery decompresses on load.
+    Parquet is written with zstd compressed pages, one row group per batch.
+    """
+
+    def __init__(self, name: str, key: str, destination: str, output_format: str, merge: bool = False):
+
+        self.name = name
+        self.key = key
+        self.destination = destination
+        self.output_format = output_format
+        self.merge = merge
+        self.rows = 0
+        self.raw_bytes = 0
+
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        if output_format == 'parquet':
+            self.writer = None
+        else:
+            self.writer = gzip.GzipFile(fileobj=self.spool, mode='wb', compresslevel=GZIP_LEVEL)
+
+    def write(self, df: pl.DataFrame):
+
+        if self.output_format == 'parquet':
+            table = df.to_arrow()
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.spool, table.schema, compression='zstd')
+            self.writer.write_table(table)
+            self.raw_bytes += table.nbytes
+        else:
+            data = df.write_ndjson().encode()
+            self.writer.write(data)
+            self.raw_bytes += len(data)
+
+        self.rows += df.height
+
+    def close(self) -> int:
+        """Finishes the compressed stream and returns its size in bytes."""
+
+        if self.writer is not None:
+            self.writer.close()
+        self.spool.seek(0, io.SEEK_END)
+
+        return self.spool.tell()
+
+    def discard(self):
+        self.spool.close()
+
+
+class StreamingLoader:
+    """Loads DataFrames into BigQuery as they are extracted, without writing files.
+
+    Batches are appended to a compressed chunk per key, e.g. a player's month.
+    A chunk is closed when it reaches `chunk_bytes` or when the next batch has
+    a different key, which also completes the previous key. A background
+    thread uploads it while the next batches are extracted and compressed.
+    Load jobs are polled on every write, and a failed job is resubmitted from
+    its chunk, which is kept until the job is done.
+
+    Chunks are appended, so a key whose chunks only partly loaded must not be
+    appended again. Its batches are written with `merge=True` instead, and
+    each chunk is merged on game_id through merge_games, one at a time.
+
+    Args:
+        client (bigquery.Client): BigQuery client, or any object with the same
+        `load_table_from_file` method, e.g. the benchmarks' FakeBigQueryClient.
+        job_config (LoadJobConfig): load config of the table, NDJSON or Parquet.
+        output_format (str, optional): 'ndjson' (gzip) or 'parquet' (zstd). Defaults to 'ndjson'.
+        chunk_bytes (int, optional): uncompressed bytes per load job. Defaults to CHUNK_BYTES.
+        max_pending (int, optional): chunks uploading or loading at once, writes wait
+        beyond it. Defaults to 8.
+        max_retries (int, optional): retries per failed chunk. Defaults to 2.
+        on_loaded (callable, optional): called with a key once it is closed and
+        all its chunks are loaded. Defaults to None.
+        on_chunk_loaded (callable, optional): called with a key every time one
+        of its chunks is loaded, e.g. to record partly loaded keys. Defaults to None.
+    """
+
+    def __init__(self, client, job_config, output_format: str = 'ndjson', chunk_bytes: int = CHUNK_BYTES,
+                 max_pending: int = 8, max_retries: int = 2, on_loaded: callable = None,
+                 on_chunk_loaded: callable = None):
+
+        self.client = client
+        self.job_config = job_config
+        self.output_format = output_format
+        self.chunk_bytes = chunk_bytes
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.on_loaded = on_loaded
+        self.on_chunk_loaded = on_chunk_loaded
+
+        self.executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+        self.chunk = None
+        self.key = None
+        self.n_chunks = 0
+        # Chunk name mapped to (chunk, upload future or load job, attempts, submitted at)
+        self.running = dict()
+        self.open_chunks = defaultdict(int)
+        self.failed_keys = set()
+        self.closed_keys = set()
+        self.results = dict()
+        # Merges share the table's staging table
+        self.merge_lock = threading.Lock()
+
+    def write(self, df: pl.DataFrame, destination: str, key: str = None, merge: bool = False):
+        """Adds a batch of games to the chunk of its key.
+
+        Args:
+            df (pl.DataFrame): games to load, e.g. a month from build_dataframe.
+            destination (str): table id or partition decorator the games are loaded to.
+            key (str, optional): groups batches into chunks, e.g. a partition key.
+            Defaults to the destination.
+            merge (bool, optional): merge the key's chunks on game_id instead of
+            appending them, e.g. for a key partly loaded by a previous run. Defaults to False.
+        """
+
+        key = key or destination
+
+        if key != self.key:
+            self.flush()
+            if self.key is not None:
+                self.close_key(self.key)
+            self.key = key
+
+        for offset in range(0, df.height, WRITE_ROWS):
+
+            if self.chunk is None:
+                self.n_chunks += 1
+                self.chunk = Chunk(f"{key}#{self.n_chunks}", key, destination, self.output_format, merge)
+                self.open_chunks[key] += 1
+
+            with metrics.timer('upload_compress'):
+                self.chunk.write(df.slice(offset, WRITE_ROWS))
+
+            if self.chunk.raw_bytes >= self.chunk_bytes:
+                self.flush()
+
+            self.poll()
+
+    def flush(self):
+        """Closes the current chunk and starts uploading it."""
+
+        if self.chunk is None:
+            return
+
+        chunk, self.chunk = self.chunk, None
+
+        with metrics.timer('upload_compress'):
+            compressed = chunk.close()
+        metrics.count('upload_raw_bytes', chunk.raw_bytes)
+        metrics.count('upload_bytes', compressed)
+
+        while len(self.running) >= self.max_pending:
+            self.poll()
+            time.sleep(0.01)
+
+        self.submit(chunk, attempts=0)
+
+    def submit(self, chunk: Chunk, attempts: int):
+
+        self.running[chunk.name] = (chunk, self.executor.submit(self.upload, chunk), attempts + 1, time.perf_counter())
+
+    def upload(self, chunk: Chunk):
+
+        chunk.spool.seek(0)
+
+        if chunk.merge:
+            # merge_games loads from a file, into the partition of the destination's decorator
+            table_id, partition = chunk.destination.split('$')
+            with tempfile.NamedTemporaryFile(suffix=f'.{self.output_format}') as f:
+                shutil.copyfileobj(chunk.spool, f)
+                f.flush()
+                with self.merge_lock, metrics.timer('bigquery_merge'):
+                    return merge_games(self.client, table_id, partition[:4], partition[4:], f.name, self.job_config)
+
+        with metrics.timer('bigquery_upload'):
+            return self.client.load_table_from_file(chunk.spool, chunk.destination, job_config=self.job_config)
+
+    def poll(self):
+        """Checks uploads and load jobs without waiting, retrying failed chunks."""
+
+        for name, (chunk, job, attempts, submitted_at) in list(self.running.items()):
+
+            # The upload future is replaced by its load job once the upload is done
+            if isinstance(job, Future):
+                if not job.done():
+                    continue
+                if job.exception() is None:
+                    self.running[name] = (chunk, job.result(), attempts, submitted_at)
+                    continue
+                errors = [str(job.exception())]
+            elif not job.done():
+                continue
+            elif job.error_result:
+                errors = job.errors
+            else:
+                errors = None
+
+            del self.running[name]
+
+            if errors and attempts <= self.max_retries:
+                metrics.count('bigquery_load_retries')
+                print(f"Load of {name} failed, retrying: {errors}")
+                self.submit(chunk, attempts)
+                continue
+
+            metrics.add_time('bigquery_job', time.perf_counter() - submitted_at)
+            chunk.discard()
+            self.finish(chunk, job, errors)
+
+    def finish(self, chunk: Chunk, job, errors):
+
+        if errors:
+            print(f"Load of {chunk.name} failed after {self.max_retries + 1} attempts: {errors}")
+            self.failed_keys.add(chunk.key)
+            state, output_rows = 'FAILED', 0
+        else:
+            # A merge is a finished query job, counting the rows it inserted or updated
+            output_rows = job.num_dml_affected_rows if chunk.merge else job.output_rows
+            print(f"Loaded {output_rows} rows from {chunk.name}")
+            metrics.count('rows_loaded', output_rows)
+            state = 'DONE'
+            if self.on_chunk_loaded is not None:
+                self.on_chunk_loaded(chunk.key)
+
+        self.results[chunk.name] = {
+            'state': state,
+            'output_rows': output_rows,
+            'job_id': getattr(job, 'job_id', None),
+            'errors': errors,
+            'key': chunk.key,
+            'destination': chunk.destination
+        }
+
+        self.open_chunks[chunk.key] -= 1
+        self.check_loaded(chunk.key)
+
+    def close_key(self, key: str):
+        """Marks a key as complete, no more batches will be written for it."""
+
+        self.closed_keys.add(key)
+        self.check_loaded(key)
+
+    def check_loaded(self, key: str):
+
+        if key in self.closed_keys and self.open_chunks[key] == 0:
+            self.closed_keys.discard(key)
+            if key not in self.failed_keys and self.on_loaded is not None:
+                self.on_loaded(key)
+
+    def close(self, poll_interval: float = 0.05) -> dict:
+        """Uploads the last chunk and waits for every load job.
+
+        Returns:
+            dict: chunk name, `<key>#<n>`, mapped to its result: `state` ('DONE'
+            or 'FAILED'), `output_rows`, `job_id`, `errors`, `key` and `destination`.
+        """
+
+        self.flush()
+        if self.key is not None:
+            self.close_key(self.key)
+            self.key = None
+
+        while self.running:
+            self.poll()
+            if self.running:
+                time.sleep(poll_interval)
+
+        self.executor.shutdown()
+
+        return self.results